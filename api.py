@@ -4,31 +4,72 @@ Run: uvicorn api:app --reload --port 8000
 """
 from __future__ import annotations
 
-import base64
+import asyncio
+import bisect
 import datetime as dt
+import hashlib
+import hmac
+import itertools
+import multiprocessing
 import os
 import sqlite3
+import tempfile
+import threading
 import time
-from typing import Annotated, List, Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import Annotated, Any, Dict, Iterator, List, Optional, Tuple
 
 import jwt
-from fastapi import FastAPI, Depends, Header, HTTPException
+from fastapi import FastAPI, Depends, File, Form, Header, HTTPException, Query, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
 from pydantic import BaseModel
 
 # Import app's DB and auth (no Streamlit calls in these)
 import pandas as pd
 from app import (
-    CANON,
     DB_PATH,
-    authenticate,
+    EXPORT_SPOOL_BYTES,
+    PASSWORD_HASH_ITERATIONS,
+    QueryTimer,
+    count_billable_rows,
     create_org_with_admin,
     db,
-    get_setting,
+    db_session,
+    SETTING_DEFAULTS,
+    StageProfiler,
+    customer_match_index,
+    export_csv_size,
+    find_login,
+    format_password_hash,
+    get_org_stats,
+    get_settings,
+    import_customers,
     init_db,
+    insert_batch,
+    insert_export,
+    invalidate_settings_cache,
+    iter_export_csv,
+    iter_qb_export_csv,
+    needs_rehash,
+    new_org_error,
     normalize_name,
-    qb_export_csv,
+    open_billable_rows,
+    parse_password_hash,
+    read_county_header,
+    refresh_batch_stats,
+    run_batch_chunked,
+    session_user_from_login,
     set_setting,
+    set_settings,
+    sync_customer_index,
+    time_queries,
+    update_password_hash,
+    write_batch_rows,
 )
 from app import SessionUser  # dataclass
 
@@ -37,13 +78,25 @@ JWT_SECRET = os.environ.get("APP_JWT_SECRET", "taxpilot-dev-secret-change-in-pro
 JWT_ALGORITHM = "HS256"
 JWT_EXP_SECONDS = 86400 * 7  # 7 days
 
-app = FastAPI(title="TaxPilot API", version="1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """The password-hashing pool lives as long as the server."""
+    hash_pool()
+    try:
+        yield
+    finally:
+        shutdown_hash_pool()
+
+
+app = FastAPI(title="TaxPilot API", version="1.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=os.environ.get("CORS_ORIGINS", "http://localhost:3000").split(","),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-After-Id", "Content-Disposition", "X-Invoice-Start-No", "X-Invoice-Count"],
 )
 
 init_db()
@@ -63,20 +116,33 @@ class CreateOrgRequest(BaseModel):
 
 
 def encode_token(u: SessionUser) -> str:
+    now = time.time()
     payload = {
         "user_id": u.user_id,
         "org_id": u.org_id,
         "email": u.email,
         "org_name": u.org_name,
         "role": u.role,
-        "exp": time.time() + JWT_EXP_SECONDS,
+        "iat": now,
+        "exp": now + JWT_EXP_SECONDS,
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 
 def decode_token(token: str) -> Optional[SessionUser]:
+    payload = decode_token_payload(token)
+    return session_user_from_payload(payload) if payload else None
+
+
+def decode_token_payload(token: str) -> Optional[dict]:
+    try:
+        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except Exception:
+        return None
+
+
+def session_user_from_payload(payload: dict) -> Optional[SessionUser]:
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         return SessionUser(
             user_id=payload["user_id"],
             org_id=payload["org_id"],
@@ -88,24 +154,420 @@ def decode_token(token: str) -> Optional[SessionUser]:
         return None
 
 
+# ----- Verified-token cache -----
+# token sha256 -> (exp, iat, SessionUser, checked_at). Hits skip jwt.decode; entries never
+# outlive the token's exp. Logout revocation is per process, like the cache itself. Role
+# changes and removed users are picked up from the users table: a token is checked against
+# it when first verified and again once its entry is TOKEN_REVALIDATE_SECONDS old, so a
+# change made anywhere (Streamlit, manage.py, SQL) takes effect within that interval.
+TOKEN_CACHE_SIZE = int(os.environ.get("APP_TOKEN_CACHE_SIZE", "4096"))
+TOKEN_REVALIDATE_SECONDS = float(os.environ.get("APP_TOKEN_REVALIDATE_SECONDS", "60"))
+
+_token_cache: "OrderedDict[str, Tuple[float, float, SessionUser, float]]" = OrderedDict()
+_revoked_tokens: Dict[str, float] = {}  # token sha256 -> exp
+_user_revoked_before: Dict[int, float] = {}  # user_id -> tokens issued before this are dead
+_token_lock = threading.Lock()
+token_cache_stats = {"hits": 0, "misses": 0, "revalidations": 0, "evictions": 0}
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _token_revoked(key: str, user_id: int, iat: float) -> bool:
+    return key in _revoked_tokens or iat < _user_revoked_before.get(user_id, 0.0)
+
+
+def verify_token(token: str) -> Optional[SessionUser]:
+    """decode_token with a bounded LRU of already-verified tokens, revocation and users-table checks."""
+    key = _token_key(token)
+    now = time.time()
+    with _token_lock:
+        hit = _token_cache.get(key)
+        if hit is not None:
+            exp, iat, u, checked_at = hit
+            if exp <= now or _token_revoked(key, u.user_id, iat):
+                del _token_cache[key]
+                hit = None
+            elif now - checked_at < TOKEN_REVALIDATE_SECONDS:
+                _token_cache.move_to_end(key)
+                token_cache_stats["hits"] += 1
+                return u
+        token_cache_stats["misses" if hit is None else "revalidations"] += 1
+
+    if hit is None:
+        payload = decode_token_payload(token)
+        u = session_user_from_payload(payload) if payload else None
+        if u is None:
+            return None
+        exp, iat = float(payload.get("exp", now)), float(payload.get("iat", 0.0))
+    if not _user_matches(key, u, exp):
+        return None
+    with _token_lock:
+        if _token_revoked(key, u.user_id, iat):
+            return None
+        _token_cache[key] = (exp, iat, u, now)
+        _token_cache.move_to_end(key)
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _evict_one(now)
+    return u
+
+
+def _user_matches(key: str, u: SessionUser, exp: float) -> bool:
+    """
+    Whether the token's user still exists with the org and role it was issued for. A removed
+    user loses every token; a role change only this token (a fresh login carries the new role).
+    """
+    with db_session() as conn:
+        row = conn.execute("SELECT org_id, role FROM users WHERE id=?", (int(u.user_id),)).fetchone()
+    if row is None:
+        invalidate_user_sessions(u.user_id)
+        return False
+    if int(row["org_id"]) != int(u.org_id) or row["role"] != u.role:
+        with _token_lock:
+            _token_cache.pop(key, None)
+            _revoked_tokens[key] = exp
+        return False
+    return True
+
+
+def _evict_one(now: float) -> None:
+    """Drop an expired entry if the oldest few have one, else the least recently used."""
+    for key, (exp, _, _, _) in itertools.islice(_token_cache.items(), 8):
+        if exp <= now:
+            del _token_cache[key]
+            break
+    else:
+        _token_cache.popitem(last=False)
+    token_cache_stats["evictions"] += 1
+
+
+def revoke_token(token: str) -> None:
+    """Logout: the token stops working here even though its exp is still ahead."""
+    key = _token_key(token)
+    payload = decode_token_payload(token)
+    now = time.time()
+    with _token_lock:
+        _token_cache.pop(key, None)
+        if payload:
+            _revoked_tokens[key] = float(payload.get("exp", now + JWT_EXP_SECONDS))
+        for k in [k for k, exp in _revoked_tokens.items() if exp <= now]:
+            del _revoked_tokens[k]
+
+
+def invalidate_user_sessions(user_id: int) -> None:
+    """Every token issued to user_id so far is rejected (called when the user is removed)."""
+    with _token_lock:
+        _user_revoked_before[int(user_id)] = time.time()
+        for k in [k for k, (_, _, u, _) in _token_cache.items() if u.user_id == int(user_id)]:
+            del _token_cache[k]
+
+
+def bearer_token(authorization: Optional[str]) -> str:
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+    return authorization.replace("Bearer ", "").strip()
+
+
 def get_current_user(
     authorization: Annotated[Optional[str], Header(alias="Authorization")] = None,
 ) -> SessionUser:
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
-    token = authorization.replace("Bearer ", "").strip()
-    u = decode_token(token)
+    u = verify_token(bearer_token(authorization))
     if not u:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     return u
 
 
+# ----- Password hashing pool -----
+# PBKDF2 runs in worker processes so a burst of logins never holds the event loop or
+# the threadpool that serves every other endpoint. Requests past the queue cap get 503.
+HASH_WORKERS = int(os.environ.get("APP_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_MAX = int(os.environ.get("APP_HASH_QUEUE_MAX", "32"))
+
+# Workers come from a fork server (spawn where there is none): forking the threaded
+# server process directly can leave a child stuck on a lock another thread held.
+HASH_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+_hash_pool: Optional[ProcessPoolExecutor] = None
+_hash_pool_lock = threading.Lock()
+hash_stats = {"in_flight": 0, "completed": 0, "failed": 0, "rejected": 0, "max_in_flight": 0}
+
+
+def hash_pool() -> ProcessPoolExecutor:
+    """The hashing pool; started by the app's lifespan, or on first use outside it."""
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(
+                max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context(HASH_START_METHOD)
+            )
+        return _hash_pool
+
+
+def shutdown_hash_pool() -> None:
+    global _hash_pool
+    with _hash_pool_lock:
+        pool, _hash_pool = _hash_pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def hash_queue_stats() -> dict:
+    in_flight = hash_stats["in_flight"]
+    return {
+        **hash_stats,
+        "workers": HASH_WORKERS,
+        "running": min(in_flight, HASH_WORKERS),
+        "queued": max(0, in_flight - HASH_WORKERS),
+        "queue_max": HASH_QUEUE_MAX,
+    }
+
+
+async def pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    """PBKDF2-SHA256 on the hashing pool (same derivation as app._pbkdf2_hash_password)."""
+    if hash_stats["in_flight"] >= HASH_WORKERS + HASH_QUEUE_MAX:
+        hash_stats["rejected"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Too many sign-in requests, try again shortly.",
+            headers={"Retry-After": "1"},
+        )
+    hash_stats["in_flight"] += 1
+    hash_stats["max_in_flight"] = max(hash_stats["max_in_flight"], hash_stats["in_flight"])
+    try:
+        loop = asyncio.get_running_loop()
+        dk = await loop.run_in_executor(
+            hash_pool(), hashlib.pbkdf2_hmac, "sha256", password.encode("utf-8"), salt, iterations
+        )
+    except BaseException:
+        hash_stats["failed"] += 1
+        raise
+    finally:
+        hash_stats["in_flight"] -= 1
+    hash_stats["completed"] += 1
+    return dk
+
+
+async def hash_password_async(password: str) -> str:
+    salt = os.urandom(16)
+    dk = await pbkdf2(password, salt, PASSWORD_HASH_ITERATIONS)
+    return format_password_hash(salt, PASSWORD_HASH_ITERATIONS, dk)
+
+
+async def verify_password_async(password: str, stored: str) -> bool:
+    parsed = parse_password_hash(stored)
+    if parsed is None:
+        return False
+    iters, salt, expected = parsed
+    return hmac.compare_digest(await pbkdf2(password, salt, iters), expected)
+
+
+def get_db() -> Iterator[sqlite3.Connection]:
+    """One pooled connection per request."""
+    with db_session() as conn:
+        yield conn
+
+
+DbConn = Annotated[sqlite3.Connection, Depends(get_db)]
+
+
+# ----- Keyset pagination -----
+PAGE_LIMIT_DEFAULT = 1000
+PAGE_LIMIT_MAX = 10000
+
+PageLimit = Annotated[int, Query(ge=1, le=PAGE_LIMIT_MAX)]
+
+
+def paginate(response: Response, rows: list, limit: int, total: int) -> list:
+    """
+    Trim a limit+1 fetch to one page and set X-Total-Count / X-Next-After-Id.
+    The next-page cursor is the id of the last row returned.
+    """
+    page = rows[:limit]
+    response.headers["X-Total-Count"] = str(int(total))
+    if len(rows) > limit and page:
+        response.headers["X-Next-After-Id"] = str(page[-1]["id"])
+    return page
+
+
+# ----- Request metrics (Prometheus text at /api/metrics) -----
+# Served only to `Authorization: Bearer $APP_METRICS_TOKEN` (also the queue and cache
+# details in /api/health); without the variable the endpoint is off.
+METRICS_TOKEN = os.environ.get("APP_METRICS_TOKEN", "")
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRICS_BYTES_BUCKETS = (256, 1024, 10_240, 102_400, 1_048_576, 10_485_760, 104_857_600)
+
+
+class Histogram:
+    """Fixed-bucket histogram; counts[i] holds observations <= buckets[i], the last slot is +Inf."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum: float = 0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> Iterator[str]:
+        cumulative = 0
+        for le, n in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += n
+            yield f'{name}_bucket{{{labels},le="{le}"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class ApiMetrics:
+    """
+    Per-route request metrics keyed by (method, route template). Request time is split into
+    SQLite time (app.time_queries) and the rest, so handlers can be told apart from queries.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.in_flight: Dict[Tuple[str, str], int] = {}
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.db_seconds: Dict[Tuple[str, str], Histogram] = {}
+        self.db_queries: Dict[Tuple[str, str], int] = {}
+        self.response_bytes: Dict[Tuple[str, str], Histogram] = {}
+
+    def started(self, key: Tuple[str, str]) -> None:
+        with self.lock:
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+
+    def finished(self, key: Tuple[str, str], status: int, seconds: float, sent: int, timer: QueryTimer) -> None:
+        with self.lock:
+            self.in_flight[key] -= 1
+            self.requests[(*key, status)] = self.requests.get((*key, status), 0) + 1
+            self.latency.setdefault(key, Histogram(METRICS_LATENCY_BUCKETS)).observe(seconds)
+            self.db_seconds.setdefault(key, Histogram(METRICS_LATENCY_BUCKETS)).observe(timer.seconds)
+            self.db_queries[key] = self.db_queries.get(key, 0) + timer.queries
+            self.response_bytes.setdefault(key, Histogram(METRICS_BYTES_BUCKETS)).observe(sent)
+
+    def render(self) -> str:
+        def labels(method: str, route: str) -> str:
+            return f'method="{method}",route="{route}"'
+
+        out: List[str] = []
+        with self.lock:
+            out += ["# HELP taxpilot_http_requests_in_flight Requests being handled.", "# TYPE taxpilot_http_requests_in_flight gauge"]
+            out += [f"taxpilot_http_requests_in_flight{{{labels(*k)}}} {v}" for k, v in sorted(self.in_flight.items())]
+            out += ["# HELP taxpilot_http_requests_total Requests handled.", "# TYPE taxpilot_http_requests_total counter"]
+            out += [
+                f'taxpilot_http_requests_total{{{labels(m, r)},status="{st}"}} {v}'
+                for (m, r, st), v in sorted(self.requests.items())
+            ]
+            for name, help_text, hists in (
+                ("taxpilot_http_request_duration_seconds", "Time to the last response byte.", self.latency),
+                ("taxpilot_http_request_db_seconds", "Time spent in SQLite per request.", self.db_seconds),
+                ("taxpilot_http_response_size_bytes", "Response body bytes.", self.response_bytes),
+            ):
+                out += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for k, h in sorted(hists.items()):
+                    out.extend(h.lines(name, labels(*k)))
+            out += ["# HELP taxpilot_http_request_db_queries_total SQLite statements run.", "# TYPE taxpilot_http_request_db_queries_total counter"]
+            out += [f"taxpilot_http_request_db_queries_total{{{labels(*k)}}} {v}" for k, v in sorted(self.db_queries.items())]
+        out += ["# HELP taxpilot_token_cache_total Verified-token cache lookups.", "# TYPE taxpilot_token_cache_total counter"]
+        out += [f'taxpilot_token_cache_total{{result="{k}"}} {v}' for k, v in token_cache_stats.items()]
+        out += ["# HELP taxpilot_password_hash_in_flight Password hashes queued or running.", "# TYPE taxpilot_password_hash_in_flight gauge"]
+        out.append(f"taxpilot_password_hash_in_flight {hash_stats['in_flight']}")
+        out += ["# HELP taxpilot_password_hash_total Password hashes by outcome.", "# TYPE taxpilot_password_hash_total counter"]
+        out += [f'taxpilot_password_hash_total{{result="{k}"}} {hash_stats[k]}' for k in ("completed", "failed", "rejected")]
+        return "\n".join(out) + "\n"
+
+
+api_metrics = ApiMetrics()
+
+
+ROUTE_TEMPLATE_CACHE_SIZE = 4096
+
+_route_templates: "OrderedDict[Tuple[str, str, str], str]" = OrderedDict()
+_route_templates_lock = threading.Lock()
+
+
+def route_template(scope: dict) -> str:
+    """
+    The matched route's path template ("/api/batches/{batch_id}"), so ids do not become labels.
+    Resolved once per (method, path) and kept in a small LRU, so requests do not walk every route.
+    """
+    key = (scope["method"], scope.get("root_path", ""), scope["path"])
+    with _route_templates_lock:
+        template = _route_templates.get(key)
+        if template is not None:
+            _route_templates.move_to_end(key)
+            return template
+    template = "unmatched"
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            template = route.path
+            break
+    with _route_templates_lock:
+        _route_templates[key] = template
+        if len(_route_templates) > ROUTE_TEMPLATE_CACHE_SIZE:
+            _route_templates.popitem(last=False)
+    return template
+
+
+def metrics_authorized(authorization: Optional[str]) -> bool:
+    if not METRICS_TOKEN or not authorization or not authorization.startswith("Bearer "):
+        return False
+    return hmac.compare_digest(authorization[len("Bearer "):].strip().encode("utf-8"), METRICS_TOKEN.encode("utf-8"))
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (streamed bodies are timed to the last chunk) feeding ApiMetrics."""
+
+    def __init__(self, app, metrics: ApiMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        key = (scope["method"], route_template(scope))
+        status = 500
+        sent = 0
+
+        async def send_counted(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = int(message["status"])
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        self.metrics.started(key)
+        t0 = time.perf_counter()
+        with time_queries() as timer:
+            try:
+                await self.app(scope, receive, send_counted)
+            finally:
+                self.metrics.finished(key, status, time.perf_counter() - t0, sent, timer)
+
+
+app.add_middleware(MetricsMiddleware, metrics=api_metrics)
+
+
 # ----- Routes -----
 @app.post("/api/auth/login")
-def api_login(body: LoginRequest):
-    ok, user, msg = authenticate(body.org_name.strip(), body.email.strip(), body.password.strip())
-    if not ok or not user:
-        raise HTTPException(status_code=401, detail=msg)
+async def api_login(body: LoginRequest):
+    login = await run_in_threadpool(find_login, body.org_name.strip(), body.email.strip())
+    password = body.password.strip()
+    if not login or not await verify_password_async(password, login["password_hash"]):
+        raise HTTPException(status_code=401, detail="Invalid organization or credentials.")
+    if needs_rehash(login["password_hash"]):
+        new_hash = await hash_password_async(password)
+        await run_in_threadpool(update_password_hash, login["id"], new_hash)
+    user = session_user_from_login(login)
     token = encode_token(user)
     return {
         "token": token,
@@ -120,75 +582,79 @@ def api_login(body: LoginRequest):
 
 
 @app.post("/api/auth/register")
-def api_register(body: CreateOrgRequest):
-    ok, msg = create_org_with_admin(body.org_name.strip(), body.email.strip(), body.password.strip())
+async def api_register(body: CreateOrgRequest):
+    password = body.password.strip()
+    # Checked before hashing so a sign-up that cannot succeed never takes a hashing slot
+    error = await run_in_threadpool(new_org_error, body.org_name, body.email, password)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    password_hash = await hash_password_async(password)
+    ok, msg = await run_in_threadpool(
+        create_org_with_admin, body.org_name.strip(), body.email.strip(), password, password_hash
+    )
     if not ok:
         raise HTTPException(status_code=400, detail=msg)
     return {"message": msg}
 
 
-@app.get("/api/dashboard/stats")
-def api_dashboard_stats(user: Annotated[SessionUser, Depends(get_current_user)]):
-    conn = db()
-    try:
-        cur = conn.execute(
-            "SELECT COUNT(*) AS n FROM customers WHERE org_id=? AND is_active=1",
-            (user.org_id,),
-        )
-        total_customers = cur.fetchone()[0]
-
-        cur = conn.execute("SELECT COUNT(*) AS n FROM batches WHERE org_id=?", (user.org_id,))
-        files_processed = cur.fetchone()[0]
+@app.post("/api/auth/logout")
+def api_logout(authorization: Annotated[Optional[str], Header(alias="Authorization")] = None):
+    token = bearer_token(authorization)
+    if not verify_token(token):
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    revoke_token(token)
+    return {"ok": True}
 
-        cur = conn.execute(
-            """
-            SELECT AVG(br.tax_saved) AS avg_savings, SUM(CASE WHEN br.status='REVIEW' THEN 1 ELSE 0 END) AS review_count
-            FROM batch_rows br
-            INNER JOIN batches b ON br.batch_id = b.id
-            WHERE b.org_id=?
-            """,
-            (user.org_id,),
-        )
-        row = cur.fetchone()
-        avg_savings = float(row[0] or 0)
-        active_reviews = int(row[1] or 0)
-    finally:
-        conn.close()
 
+@app.get("/api/dashboard/stats")
+def api_dashboard_stats(user: Annotated[SessionUser, Depends(get_current_user)], conn: DbConn):
+    stats = get_org_stats(conn, user.org_id)
+    row_count = int(stats["row_count"])
+    avg_savings = float(stats["tax_saved_total"]) / row_count if row_count else 0.0
     return {
-        "total_customers": total_customers,
-        "files_processed": files_processed,
+        "total_customers": int(stats["customer_count"]),
+        "files_processed": int(stats["batch_count"]),
         "avg_savings": round(avg_savings, 2),
-        "active_reviews": active_reviews,
+        "active_reviews": int(stats["review_count"]),
     }
 
 
 @app.get("/api/customers")
 def api_list_customers(
     user: Annotated[SessionUser, Depends(get_current_user)],
+    conn: DbConn,
+    response: Response,
     q: Optional[str] = None,
     show_inactive: bool = False,
+    after_id: Optional[int] = None,
+    limit: PageLimit = PAGE_LIMIT_DEFAULT,
 ):
-    conn = db()
-    try:
-        where = "org_id=?"
-        params = [user.org_id]
-        if not show_inactive:
-            where += " AND is_active=1"
-        if q and q.strip():
-            where += " AND (name LIKE ? OR email LIKE ?)"
-            params.extend([f"%{q.strip()}%", f"%{q.strip()}%"])
-
-        rows = conn.execute(
-            f"""
-            SELECT id, name, email, phone, address1, city, state, zip, qb_customer_ref, is_active, created_at
-            FROM customers WHERE {where} ORDER BY name
-            """,
-            params,
-        ).fetchall()
-        return [dict(r) for r in rows]
-    finally:
-        conn.close()
+    """Customers ordered by (name, id). Pass the X-Next-After-Id header back as after_id for the next page."""
+    where = "org_id=?"
+    params = [user.org_id]
+    if not show_inactive:
+        where += " AND is_active=1"
+    if q and q.strip():
+        where += " AND (name LIKE ? OR email LIKE ?)"
+        params.extend([f"%{q.strip()}%", f"%{q.strip()}%"])
+    total = conn.execute(f"SELECT COUNT(*) FROM customers WHERE {where}", params).fetchone()[0]
+
+    cursor = ""
+    if after_id is not None:
+        last = conn.execute("SELECT name FROM customers WHERE org_id=? AND id=?", (user.org_id, after_id)).fetchone()
+        if not last:
+            raise HTTPException(status_code=400, detail="Unknown after_id")
+        cursor = " AND (name > ? OR (name = ? AND id > ?))"
+        params.extend([last["name"], last["name"], after_id])
+
+    rows = conn.execute(
+        f"""
+        SELECT id, name, email, phone, address1, city, state, zip, qb_customer_ref, is_active, created_at
+        FROM customers WHERE {where}{cursor} ORDER BY name, id LIMIT ?
+        """,
+        params + [limit + 1],
+    ).fetchall()
+    return paginate(response, [dict(r) for r in rows], limit, total)
 
 
 class CustomerCreate(BaseModel):
@@ -203,13 +669,12 @@ class CustomerCreate(BaseModel):
 
 
 @app.post("/api/customers")
-def api_create_customer(body: CustomerCreate, user: Annotated[SessionUser, Depends(get_current_user)]):
+def api_create_customer(body: CustomerCreate, user: Annotated[SessionUser, Depends(get_current_user)], conn: DbConn):
     name = (body.name or "").strip()
     if not name:
         raise HTTPException(status_code=400, detail="Name is required")
-    conn = db()
     try:
-        conn.execute(
+        cur = conn.execute(
             """
             INSERT INTO customers(org_id, name, name_norm, email, phone, address1, city, state, zip, qb_customer_ref, is_active, created_at)
             VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
@@ -229,47 +694,90 @@ def api_create_customer(body: CustomerCreate, user: Annotated[SessionUser, Depen
             ),
         )
         conn.commit()
-        row = conn.execute("SELECT last_insert_rowid() AS id").fetchone()
-        return {"id": row[0], "name": name}
+        sync_customer_index(conn, user.org_id, [cur.lastrowid])
+        return {"id": cur.lastrowid, "name": name}
     except Exception as e:
         if "UNIQUE" in str(e) or "unique" in str(e).lower():
             raise HTTPException(status_code=400, detail="A customer with this name already exists.")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+
+
+@app.post("/api/customers/import")
+def api_import_customers(
+    user: Annotated[SessionUser, Depends(get_current_user)],
+    conn: DbConn,
+    file: Annotated[UploadFile, File()],
+    upsert: Annotated[bool, Form()] = False,
+):
+    """
+    Bulk customer import from CSV (name, email, phone, address1, city, state, zip, qb_customer_ref).
+    With upsert, customers already on file get their non-blank contact fields updated
+    (inactive ones stay inactive). Returns {added, updated, skipped}.
+    """
+    try:
+        imp = pd.read_csv(file.file, dtype=str)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Failed to read CSV: {e}")
+    imp.columns = [str(c).strip().lower() for c in imp.columns]
+    if "name" not in imp.columns:
+        raise HTTPException(status_code=400, detail="CSV must include a 'name' column.")
+    return import_customers(conn, user.org_id, imp, upsert=upsert)
+
+
+class CustomerUpdate(BaseModel):
+    name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    address1: Optional[str] = None
+    city: Optional[str] = None
+    state: Optional[str] = None
+    zip: Optional[str] = None
+    qb_customer_ref: Optional[str] = None
+    is_active: Optional[bool] = None
+
+
+@app.patch("/api/customers/{customer_id}")
+def api_update_customer(
+    customer_id: int,
+    body: CustomerUpdate,
+    user: Annotated[SessionUser, Depends(get_current_user)],
+    conn: DbConn,
+):
+    fields = body.model_dump(exclude_unset=True)
+    updates: Dict[str, Any] = {}
+    if "name" in fields:
+        name = (fields.pop("name") or "").strip()
+        if not name:
+            raise HTTPException(status_code=400, detail="Name is required")
+        updates["name"], updates["name_norm"] = name, normalize_name(name)
+    if "is_active" in fields:
+        updates["is_active"] = 1 if fields.pop("is_active") else 0
+    for k, v in fields.items():
+        updates[k] = (v or "").strip() or None
+    if not updates:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    try:
+        cur = conn.execute(
+            f"UPDATE customers SET {', '.join(f'{k}=?' for k in updates)} WHERE org_id=? AND id=?",
+            (*updates.values(), user.org_id, customer_id),
+        )
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        raise HTTPException(status_code=400, detail="A customer with this name already exists.")
+    if cur.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    conn.commit()
+    sync_customer_index(conn, user.org_id, [customer_id], cur.rowcount)
+    return {"ok": True}
 
 
 # Settings: app.py uses key/value per org. Expose as one object.
-SETTING_KEYS = [
-    "tax_rate_pct",
-    "contingency_pct",
-    "flat_fee",
-    "review_min_tax_saved",
-    "charge_flat_if_no_win",
-    "days_due",
-    "qb_item_name",
-    "qb_desc_prefix",
-    "next_invoice_no",
-]
-
-DEFAULTS = {
-    "tax_rate_pct": "2.500000",
-    "contingency_pct": "25",
-    "flat_fee": "150",
-    "review_min_tax_saved": "700",
-    "charge_flat_if_no_win": "0",
-    "days_due": "30",
-    "qb_item_name": "Property Tax Protest",
-    "qb_desc_prefix": "Tax savings",
-    "next_invoice_no": "1001",
-}
+SETTING_KEYS = list(SETTING_DEFAULTS)
 
 
 @app.get("/api/settings")
-def api_get_settings(user: Annotated[SessionUser, Depends(get_current_user)]):
-    out = {}
-    for k in SETTING_KEYS:
-        out[k] = get_setting(user.org_id, k, DEFAULTS.get(k, ""))
+def api_get_settings(user: Annotated[SessionUser, Depends(get_current_user)], conn: DbConn):
+    out = get_settings(user.org_id, conn=conn)
     # Coerce numeric for frontend
     out["tax_rate_pct"] = float(out["tax_rate_pct"])
     out["contingency_pct"] = float(out["contingency_pct"])
@@ -278,7 +786,9 @@ def api_get_settings(user: Annotated[SessionUser, Depends(get_current_user)]):
     out["charge_flat_if_no_win"] = bool(int(out["charge_flat_if_no_win"]))
     out["days_due"] = int(out["days_due"])
     out["next_invoice_no"] = int(out["next_invoice_no"])
-    return out
+    out["fuzzy_match"] = bool(int(out["fuzzy_match"]))
+    out["fuzzy_match_threshold"] = float(out["fuzzy_match_threshold"])
+    return {k: out[k] for k in SETTING_KEYS}
 
 
 class SettingsUpdate(BaseModel):
@@ -291,19 +801,25 @@ class SettingsUpdate(BaseModel):
     qb_item_name: Optional[str] = None
     qb_desc_prefix: Optional[str] = None
     next_invoice_no: Optional[int] = None
+    fuzzy_match: Optional[bool] = None
+    fuzzy_match_threshold: Optional[float] = None
 
 
 @app.put("/api/settings")
-def api_put_settings(body: SettingsUpdate, user: Annotated[SessionUser, Depends(get_current_user)]):
-    updates = body.model_dump(exclude_none=True)
-    for k, v in updates.items():
+def api_put_settings(body: SettingsUpdate, user: Annotated[SessionUser, Depends(get_current_user)], conn: DbConn):
+    updates = {}
+    for k, v in body.model_dump(exclude_none=True).items():
         if k not in SETTING_KEYS:
             continue
         if isinstance(v, bool):
             v = "1" if v else "0"
         elif isinstance(v, (int, float)):
             v = str(v)
-        set_setting(user.org_id, k, v)
+        updates[k] = v
+    if updates:
+        set_settings(user.org_id, updates, conn=conn)
+        conn.commit()
+        invalidate_settings_cache(user.org_id)
     return {"ok": True}
 
 
@@ -322,6 +838,7 @@ class BatchRowCreate(BaseModel):
     status: str
     matched_customer_id: Optional[int] = None
     matched_customer_name: Optional[str] = None
+    match_confidence: Optional[float] = None
 
 
 class BatchCreate(BaseModel):
@@ -340,114 +857,190 @@ class BatchCreate(BaseModel):
 
 
 @app.post("/api/batches")
-def api_create_batch(body: BatchCreate, user: Annotated[SessionUser, Depends(get_current_user)]):
-    conn = db()
+def api_create_batch(body: BatchCreate, user: Annotated[SessionUser, Depends(get_current_user)], conn: DbConn):
+    rows = pd.DataFrame.from_records(
+        [r.model_dump() for r in body.rows],
+        columns=list(BatchRowCreate.model_fields),
+    )
+    cur = conn.cursor()
+    batch_id = insert_batch(
+        cur,
+        org_id=user.org_id,
+        user_id=user.user_id,
+        source_filename=body.source_filename,
+        tax_rate_pct=body.tax_rate_pct,
+        contingency_pct=body.contingency_pct,
+        flat_fee=body.flat_fee,
+        review_min_tax_saved=body.review_min_tax_saved,
+        charge_flat_if_no_win=body.charge_flat_if_no_win,
+        invoice_date=body.invoice_date,
+        days_due=body.days_due,
+        qb_item_name=body.qb_item_name,
+        qb_desc_prefix=body.qb_desc_prefix,
+        notes=body.notes,
+    )
+    write_batch_rows(cur, batch_id, rows, source={c: c for c in BatchRowCreate.model_fields})
+    refresh_batch_stats(conn, batch_id)
+    conn.commit()
+    return {"id": batch_id, "message": f"Saved batch #{batch_id}."}
+
+
+@app.post("/api/batches/compute")
+def api_compute_batch(
+    user: Annotated[SessionUser, Depends(get_current_user)],
+    conn: DbConn,
+    file: Annotated[UploadFile, File()],
+    col_owner: Annotated[str, Form()],
+    col_propid: Annotated[str, Form()],
+    col_notice: Annotated[str, Form()],
+    col_final: Annotated[str, Form()],
+    tax_rate_pct: Annotated[Optional[float], Form()] = None,
+    contingency_pct: Annotated[Optional[float], Form()] = None,
+    flat_fee: Annotated[Optional[float], Form()] = None,
+    review_min_tax_saved: Annotated[Optional[float], Form()] = None,
+    charge_flat_if_no_win: Annotated[Optional[bool], Form()] = None,
+    invoice_date: Annotated[Optional[str], Form()] = None,
+    days_due: Annotated[Optional[int], Form()] = None,
+    qb_item_name: Annotated[Optional[str], Form()] = None,
+    qb_desc_prefix: Annotated[Optional[str], Form()] = None,
+    notes: Annotated[Optional[str], Form()] = None,
+    fuzzy_match: Annotated[Optional[bool], Form()] = None,
+    sheet: Annotated[Optional[str], Form()] = None,
+    profile: Annotated[bool, Form()] = False,
+    profile_memory: Annotated[bool, Form()] = False,
+):
+    """
+    Compute and save a batch from a raw county sheet (CSV/XLSX, `sheet` picks the XLSX
+    worksheet) plus column mapping. Fee parameters (and fuzzy matching) default to the org
+    settings. Returns the batch id and summary totals only; with profile=true also
+    `timings`, the per-stage StageProfiler report (wall time and rows/s). profile_memory=true
+    adds each stage's tracemalloc peak; tracing slows every concurrent request while it runs,
+    so it is opt-in, and peak_bytes stays null if another run is already measuring memory.
+    """
+    filename = file.filename or "upload.csv"
+    if not filename.lower().endswith((".csv", ".xlsx")):
+        raise HTTPException(status_code=400, detail="Upload a .csv or .xlsx file")
     try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO batches(
-                org_id, created_by_user_id, created_at,
-                source_filename, tax_rate_pct, contingency_pct, flat_fee,
-                review_min_tax_saved, charge_flat_if_no_win,
-                invoice_date, days_due, qb_item_name, qb_desc_prefix, notes
-            )
-            VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                user.org_id,
-                user.user_id,
-                dt.datetime.utcnow().isoformat(),
-                body.source_filename,
-                float(body.tax_rate_pct),
-                float(body.contingency_pct),
-                float(body.flat_fee),
-                float(body.review_min_tax_saved),
-                1 if body.charge_flat_if_no_win else 0,
-                body.invoice_date,
-                int(body.days_due),
-                (body.qb_item_name or "Property Tax Protest").strip(),
-                (body.qb_desc_prefix or "Tax savings").strip(),
-                (body.notes or "").strip() or None,
+        cols = read_county_header(file.file, filename, sheet)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to read file: {e}")
+    missing = [c for c in (col_owner, col_propid, col_notice, col_final) if c not in cols]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Columns not found in file: {', '.join(missing)}")
+
+    invoice_date = invoice_date or dt.date.today().isoformat()
+    try:
+        dt.date.fromisoformat(invoice_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invoice_date must be YYYY-MM-DD")
+
+    cfg = get_settings(user.org_id, conn=conn)
+
+    def setting(value, key: str, cast):
+        return cast(value) if value is not None else cast(cfg[key])
+
+    match_index = customer_match_index(user.org_id, conn=conn)
+    fuzzy_index = None
+    if setting(fuzzy_match, "fuzzy_match", lambda v: bool(int(v))):
+        fuzzy_index = match_index.fuzzy(float(cfg["fuzzy_match_threshold"]))
+
+    profiler = StageProfiler(memory=profile_memory) if profile or profile_memory else None
+    try:
+        batch_id, totals = run_batch_chunked(
+            file.file,
+            filename,
+            org_id=user.org_id,
+            user_id=user.user_id,
+            col_owner=col_owner,
+            col_propid=col_propid,
+            col_notice=col_notice,
+            col_final=col_final,
+            tax_rate_pct=setting(tax_rate_pct, "tax_rate_pct", float),
+            contingency_pct=setting(contingency_pct, "contingency_pct", float),
+            flat_fee=setting(flat_fee, "flat_fee", float),
+            review_min_tax_saved=setting(review_min_tax_saved, "review_min_tax_saved", float),
+            charge_flat_if_no_win=(
+                charge_flat_if_no_win
+                if charge_flat_if_no_win is not None
+                else bool(int(cfg["charge_flat_if_no_win"]))
             ),
+            invoice_date=invoice_date,
+            days_due=setting(days_due, "days_due", int),
+            qb_item_name=setting(qb_item_name, "qb_item_name", str),
+            qb_desc_prefix=setting(qb_desc_prefix, "qb_desc_prefix", str),
+            notes=notes,
+            customers_by_norm=match_index.by_norm,
+            fuzzy_index=fuzzy_index,
+            sheet=sheet,
+            profiler=profiler,
         )
-        batch_id = cur.lastrowid
-        for r in body.rows:
-            cur.execute(
-                """
-                INSERT INTO batch_rows(
-                    batch_id, row_index, raw_client_name, property_id,
-                    notice_value, final_value, reduction, tax_saved,
-                    base_fee, manual_discount, final_invoice,
-                    status, matched_customer_id, matched_customer_name
-                )
-                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    batch_id,
-                    r.row_index,
-                    r.raw_client_name,
-                    r.property_id,
-                    float(r.notice_value),
-                    float(r.final_value),
-                    float(r.reduction),
-                    float(r.tax_saved),
-                    float(r.base_fee),
-                    float(r.manual_discount),
-                    float(r.final_invoice),
-                    r.status,
-                    r.matched_customer_id,
-                    r.matched_customer_name,
-                ),
-            )
-        conn.commit()
-        return {"id": batch_id, "message": f"Saved batch #{batch_id}."}
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Failed to process file: {e}")
     finally:
-        conn.close()
+        report = profiler.report() if profiler is not None else None
+    result = {"id": batch_id, "message": f"Saved batch #{batch_id}.", "summary": totals}
+    if report is not None:
+        result["timings"] = report
+    return result
 
 
 @app.get("/api/batches")
-def api_list_batches(user: Annotated[SessionUser, Depends(get_current_user)]):
-    conn = db()
-    try:
-        rows = conn.execute(
-            """
-            SELECT b.id, b.created_at, b.source_filename, b.invoice_date,
-                   b.tax_rate_pct, b.contingency_pct, b.flat_fee,
-                   (SELECT COUNT(*) FROM batch_rows br WHERE br.batch_id = b.id) AS row_count,
-                   (SELECT COUNT(*) FROM batch_rows br WHERE br.batch_id = b.id AND br.final_invoice > 0) AS billable_count,
-                   (SELECT COALESCE(SUM(br.final_invoice), 0) FROM batch_rows br WHERE br.batch_id = b.id) AS total_invoice
-            FROM batches b
-            WHERE b.org_id = ?
-            ORDER BY b.id DESC
-            """,
-            (user.org_id,),
-        ).fetchall()
-        return [dict(r) for r in rows]
-    finally:
-        conn.close()
+def api_list_batches(
+    user: Annotated[SessionUser, Depends(get_current_user)],
+    conn: DbConn,
+    response: Response,
+    after_id: Optional[int] = None,
+    limit: PageLimit = PAGE_LIMIT_DEFAULT,
+):
+    """Batches newest first; after_id continues below that batch id."""
+    total = conn.execute("SELECT COUNT(*) FROM batches WHERE org_id = ?", (user.org_id,)).fetchone()[0]
+    cursor, params = ("", [user.org_id])
+    if after_id is not None:
+        cursor, params = (" AND b.id < ?", [user.org_id, after_id])
+    rows = conn.execute(
+        f"""
+        SELECT b.id, b.created_at, b.source_filename, b.invoice_date,
+               b.tax_rate_pct, b.contingency_pct, b.flat_fee,
+               b.row_count, b.billable_count, b.total_invoice
+        FROM batches b
+        WHERE b.org_id = ?{cursor}
+        ORDER BY b.id DESC
+        LIMIT ?
+        """,
+        params + [limit + 1],
+    ).fetchall()
+    return paginate(response, [dict(r) for r in rows], limit, total)
 
 
 @app.get("/api/batches/{batch_id}")
 def api_get_batch(
     batch_id: int,
     user: Annotated[SessionUser, Depends(get_current_user)],
+    conn: DbConn,
+    response: Response,
+    after_id: Optional[int] = None,
+    limit: PageLimit = PAGE_LIMIT_DEFAULT,
 ):
-    conn = db()
-    try:
-        b = conn.execute(
-            "SELECT * FROM batches WHERE org_id = ? AND id = ?",
-            (user.org_id, batch_id),
-        ).fetchone()
-        if not b:
-            raise HTTPException(status_code=404, detail="Batch not found")
-        rows = conn.execute(
-            "SELECT * FROM batch_rows WHERE batch_id = ? ORDER BY row_index",
-            (batch_id,),
-        ).fetchall()
-        return {"batch": dict(b), "rows": [dict(r) for r in rows]}
-    finally:
-        conn.close()
+    """Batch header plus one page of rows ordered by (row_index, id); after_id is a batch_rows id."""
+    b = conn.execute(
+        "SELECT * FROM batches WHERE org_id = ? AND id = ?",
+        (user.org_id, batch_id),
+    ).fetchone()
+    if not b:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    cursor, params = ("", [batch_id])
+    if after_id is not None:
+        last = conn.execute("SELECT row_index FROM batch_rows WHERE batch_id = ? AND id = ?", (batch_id, after_id)).fetchone()
+        if not last:
+            raise HTTPException(status_code=400, detail="Unknown after_id")
+        cursor = " AND (row_index > ? OR (row_index = ? AND id > ?))"
+        params.extend([last["row_index"], last["row_index"], after_id])
+    rows = conn.execute(
+        f"SELECT * FROM batch_rows WHERE batch_id = ?{cursor} ORDER BY row_index, id LIMIT ?",
+        params + [limit + 1],
+    ).fetchall()
+    return {"batch": dict(b), "rows": paginate(response, [dict(r) for r in rows], limit, b["row_count"])}
 
 
 class BatchRowUpdate(BaseModel):
@@ -460,23 +1053,101 @@ def api_update_batch_rows(
     batch_id: int,
     body: List[BatchRowUpdate],
     user: Annotated[SessionUser, Depends(get_current_user)],
+    conn: DbConn,
 ):
-    conn = db()
+    b = conn.execute(
+        "SELECT id FROM batches WHERE org_id = ? AND id = ?",
+        (user.org_id, batch_id),
+    ).fetchone()
+    if not b:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    conn.executemany(
+        "UPDATE batch_rows SET manual_discount = ?, final_invoice = MAX(0, base_fee - ?) WHERE id = ? AND batch_id = ?",
+        [(float(item.manual_discount), float(item.manual_discount), item.id, batch_id) for item in body],
+    )
+    refresh_batch_stats(conn, batch_id)
+    conn.commit()
+    return {"ok": True}
+
+
+def release_invoice_numbers(org_id: int, invoice_start_no: int, invoice_count: int) -> bool:
+    """
+    Hand a reserved invoice range back (next_invoice_no returns to its start) if no later
+    reservation has moved past it. Returns False when the numbers could not be released.
+    """
+    with db_session() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        next_inv = int(get_settings(org_id, conn=conn, use_cache=False)["next_invoice_no"])
+        if next_inv != invoice_start_no + invoice_count:
+            conn.rollback()
+            return False
+        set_setting(org_id, "next_invoice_no", str(invoice_start_no), conn=conn)
+        conn.commit()
+    invalidate_settings_cache(org_id)
+    return True
+
+
+def stream_batch_export(
+    conn: sqlite3.Connection,
+    batch_id: int,
+    invoice_start_no: int,
+    invoice_date: dt.date,
+    days_due: int,
+    qb_item: str,
+    qb_prefix: str,
+    store_as: Optional[dict] = None,
+) -> Iterator[bytes]:
+    """
+    Yield the QB CSV from batch_rows on `conn`, a connection of its own (the request's is
+    released before the body is sent) that is still in the read transaction the invoice
+    count was taken in; the stream ends that transaction and closes it. With store_as, the
+    CSV is also spooled and saved to exports once the last chunk has gone out. If the
+    client goes away first, the reserved numbers are released, or when a later export has
+    already reserved past them, the export is recorded anyway.
+    """
+    totals: dict = {}
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) if store_as else None
     try:
-        b = conn.execute(
-            "SELECT id FROM batches WHERE org_id = ? AND id = ?",
-            (user.org_id, batch_id),
-        ).fetchone()
-        if not b:
-            raise HTTPException(status_code=404, detail="Batch not found")
-        for item in body:
-            conn.execute(
-                "UPDATE batch_rows SET manual_discount = ?, final_invoice = MAX(0, base_fee - ?) WHERE id = ? AND batch_id = ?",
-                (float(item.manual_discount), float(item.manual_discount), item.id, batch_id),
+        chunks = iter_qb_export_csv(
+            open_billable_rows(conn, batch_id),
+            invoice_start_no=invoice_start_no,
+            invoice_date=invoice_date,
+            days_due=days_due,
+            qb_item_name=qb_item,
+            qb_desc_prefix=qb_prefix,
+            totals=totals,
+        )
+        try:
+            for chunk in chunks:
+                if spool is not None:
+                    spool.write(chunk)
+                yield chunk
+        except GeneratorExit:
+            if spool is None or release_invoice_numbers(store_as["org_id"], invoice_start_no, store_as["invoice_count"]):
+                raise
+            # Still the same snapshot: spool the rows the rest of the range was reserved for
+            for chunk in chunks:
+                spool.write(chunk)
+        except Exception:
+            if spool is not None:
+                release_invoice_numbers(store_as["org_id"], invoice_start_no, store_as["invoice_count"])
+            raise
+        conn.commit()  # end the read snapshot before writing
+        if spool is not None:
+            insert_export(
+                conn,
+                batch_id=batch_id,
+                user_id=store_as["user_id"],
+                invoice_start_no=invoice_start_no,
+                invoice_count=totals["invoice_count"],
+                total_amount=totals["total_amount"],
+                filename=store_as["filename"],
+                csv_file=spool,
             )
-        conn.commit()
-        return {"ok": True}
+            conn.commit()
     finally:
+        if spool is not None:
+            spool.close()
         conn.close()
 
 
@@ -484,82 +1155,139 @@ def api_update_batch_rows(
 def api_batch_export(
     batch_id: int,
     user: Annotated[SessionUser, Depends(get_current_user)],
+    conn: DbConn,
     store: bool = False,
 ):
-    """Generate QB CSV. If store=True, save export and increment next_invoice_no."""
-    conn = db()
+    """
+    Stream the QB import CSV. If store=True, the invoice numbers are reserved up front
+    (next_invoice_no is bumped before the first byte) and the export is saved once fully sent.
+    The invoice count is taken from batch_rows, not the stored billable_count, in the same
+    read snapshot the CSV is streamed from, so edits made meanwhile cannot change it.
+    """
+    b = conn.execute(
+        "SELECT * FROM batches WHERE org_id = ? AND id = ?",
+        (user.org_id, batch_id),
+    ).fetchone()
+    if not b:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if store:
+        # Reserve under the write lock so concurrent exports never share invoice numbers
+        conn.execute("BEGIN IMMEDIATE")
+        b = conn.execute("SELECT * FROM batches WHERE id = ?", (batch_id,)).fetchone()
+    # The streaming connection's snapshot starts with this count (while we hold the write
+    # lock when storing), so the body numbers exactly the rows that were counted
+    stream_conn = db()
     try:
-        b = conn.execute(
-            "SELECT * FROM batches WHERE org_id = ? AND id = ?",
-            (user.org_id, batch_id),
-        ).fetchone()
-        if not b:
-            raise HTTPException(status_code=404, detail="Batch not found")
-        rows = conn.execute(
-            "SELECT * FROM batch_rows WHERE batch_id = ? AND final_invoice > 0 ORDER BY row_index",
-            (batch_id,),
-        ).fetchall()
-        if not rows:
+        stream_conn.execute("BEGIN")
+        invoice_count = count_billable_rows(stream_conn, batch_id)
+        if not invoice_count:
             raise HTTPException(status_code=400, detail="No billable rows in this batch")
-        # Build billable df with CANON columns for qb_export_csv
-        billable = pd.DataFrame(
-            [
-                {
-                    CANON["client_name"]: r["raw_client_name"],
-                    CANON["property_id"]: r["property_id"],
-                    CANON["tax_saved"]: r["tax_saved"],
-                    CANON["final_invoice"]: r["final_invoice"],
-                    CANON["matched_customer_name"]: r["matched_customer_name"],
-                }
-                for r in rows
-            ]
-        )
-        next_inv = int(get_setting(user.org_id, "next_invoice_no", "1001"))
-        invoice_date = dt.date.fromisoformat(b["invoice_date"])
-        days_due = int(b["days_due"])
-        qb_item = (b["qb_item_name"] or "Property Tax Protest").strip()
-        qb_prefix = (b["qb_desc_prefix"] or "Tax savings").strip()
-        qb_df, csv_bytes = qb_export_csv(
-            billable_df=billable,
-            invoice_start_no=next_inv,
-            invoice_date=invoice_date,
-            days_due=days_due,
-            qb_item_name=qb_item,
-            qb_desc_prefix=qb_prefix,
-        )
-        filename = f"QB_Import_Batch_{batch_id}_{dt.date.today().isoformat()}.csv"
+        # Uncached read: invoice numbering must never repeat
+        next_inv = int(get_settings(user.org_id, conn=conn, use_cache=False)["next_invoice_no"])
         if store:
-            total = sum(r["final_invoice"] for r in rows)
-            conn.execute(
-                """
-                INSERT INTO exports(batch_id, created_at, created_by_user_id,
-                    invoice_start_no, invoice_count, total_amount, filename, csv_blob)
-                VALUES(?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    batch_id,
-                    dt.datetime.utcnow().isoformat(),
-                    user.user_id,
-                    next_inv,
-                    len(qb_df),
-                    float(billable[CANON["final_invoice"]].sum()),
-                    filename,
-                    sqlite3.Binary(csv_bytes),
-                ),
-            )
-            set_setting(user.org_id, "next_invoice_no", str(next_inv + len(qb_df)))
+            set_setting(user.org_id, "next_invoice_no", str(next_inv + invoice_count), conn=conn)
             conn.commit()
-        return {
-            "filename": filename,
-            "csv_base64": base64.b64encode(csv_bytes).decode("utf-8"),
-            "invoice_start_no": next_inv,
-            "invoice_count": len(qb_df),
-            "stored": store,
-        }
-    finally:
-        conn.close()
+            invalidate_settings_cache(user.org_id)
+    except BaseException:
+        conn.rollback()
+        stream_conn.close()
+        raise
+    filename = f"QB_Import_Batch_{batch_id}_{dt.date.today().isoformat()}.csv"
+    body = stream_batch_export(
+        stream_conn,
+        batch_id,
+        invoice_start_no=next_inv,
+        invoice_date=dt.date.fromisoformat(b["invoice_date"]),
+        days_due=int(b["days_due"]),
+        qb_item=(b["qb_item_name"] or "Property Tax Protest").strip(),
+        qb_prefix=(b["qb_desc_prefix"] or "Tax savings").strip(),
+        store_as=(
+            {"org_id": user.org_id, "user_id": user.user_id, "filename": filename, "invoice_count": invoice_count}
+            if store
+            else None
+        ),
+    )
+    return StreamingResponse(
+        body,
+        media_type="text/csv; charset=utf-8",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Invoice-Start-No": str(next_inv),
+            "X-Invoice-Count": str(invoice_count),
+        },
+    )
+
+
+@app.get("/api/batches/{batch_id}/exports")
+def api_list_exports(batch_id: int, user: Annotated[SessionUser, Depends(get_current_user)], conn: DbConn):
+    """Stored exports of a batch, newest first; `size` is the uncompressed CSV size in bytes."""
+    b = conn.execute("SELECT id FROM batches WHERE org_id = ? AND id = ?", (user.org_id, batch_id)).fetchone()
+    if not b:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    rows = conn.execute(
+        """
+        SELECT e.id, e.created_at, e.invoice_start_no, e.invoice_count, e.total_amount, e.filename,
+               COALESCE(eb.size, length(e.csv_blob)) AS size
+        FROM exports e
+        LEFT JOIN export_blobs eb ON eb.sha256 = e.blob_sha256
+        WHERE e.batch_id = ?
+        ORDER BY e.id DESC
+        """,
+        (batch_id,),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def stream_stored_export(export_id: int) -> Iterator[bytes]:
+    """A stored export's CSV, decompressed as it is read, on its own connection."""
+    with db_session() as conn:
+        yield from iter_export_csv(conn, export_id)
+
+
+@app.get("/api/exports/{export_id}/download")
+def api_download_export(export_id: int, user: Annotated[SessionUser, Depends(get_current_user)], conn: DbConn):
+    """Download a stored QB export exactly as it was sent (streamed, never held in memory whole)."""
+    e = conn.execute(
+        """
+        SELECT e.id, e.filename FROM exports e
+        INNER JOIN batches b ON b.id = e.batch_id
+        WHERE e.id = ? AND b.org_id = ?
+        """,
+        (export_id, user.org_id),
+    ).fetchone()
+    if not e:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return StreamingResponse(
+        stream_stored_export(export_id),
+        media_type="text/csv; charset=utf-8",
+        headers={
+            "Content-Disposition": f'attachment; filename="{e["filename"]}"',
+            "Content-Length": str(export_csv_size(conn, export_id)),
+        },
+    )
 
 
 @app.get("/api/health")
-def health():
-    return {"status": "ok", "db": DB_PATH}
+def health(authorization: Annotated[Optional[str], Header(alias="Authorization")] = None):
+    """Liveness; with the metrics token also the password-hashing queue and token cache."""
+    if not metrics_authorized(authorization):
+        return {"status": "ok", "db": DB_PATH}
+    return {
+        "status": "ok",
+        "db": DB_PATH,
+        "password_hashing": hash_queue_stats(),
+        "token_cache": {**token_cache_stats, "size": len(_token_cache), "max_size": TOKEN_CACHE_SIZE},
+    }
+
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+def metrics(authorization: Annotated[Optional[str], Header(alias="Authorization")] = None):
+    """
+    Per-route latency, SQLite time, response size and in-flight counts in Prometheus text
+    format. Needs APP_METRICS_TOKEN as the bearer token; 404 when that is not configured.
+    """
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not metrics_authorized(authorization):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(api_metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,18 +1,39 @@
 from __future__ import annotations
 
+import copy
 import datetime as dt
+import functools
 import hashlib
 import hmac
 import io
+import itertools
+import math
 import os
+import queue
 import re
 import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
 from dataclasses import dataclass
-from typing import Dict, Optional, Tuple
+from difflib import SequenceMatcher
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+try:  # optional: without pyarrow, batches always load from SQLite
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:
+    pa = None
+
 
 # =========================
 # Configuration
@@ -35,37 +56,69 @@ CANON = {
     "status": "Status",
     "matched_customer_id": "Matched_Customer_ID",
     "matched_customer_name": "Matched_Customer_Name",
+    "match_confidence": "Match_Confidence",
+    "money_error": "Money_Parse_Error",
 }
 
 ROLE_ADMIN = "admin"
 ROLE_STAFF = "staff"
 ROLE_VIEW = "view"
 
+# Batch engine implementations accepted by compute_batch_df
+ENGINE_VECTORIZED = "vectorized"
+ENGINE_PYTHON = "python"
+
+# Rows per chunk when streaming a county sheet straight into batch_rows
+BATCH_CHUNK_ROWS = 50_000
+
+# PBKDF2 work factor for new hashes; stored hashes with another count are upgraded on login
+PASSWORD_HASH_ITERATIONS = int(os.environ.get("APP_PASSWORD_HASH_ITERATIONS", "200000"))
+
 
 # =========================
 # Security helpers (simple, local POC)
 # =========================
-def _pbkdf2_hash_password(password: str, salt: bytes, iterations: int = 200_000) -> bytes:
+PASSWORD_HASH_ALGO = "pbkdf2_sha256"
+
+
+def _pbkdf2_hash_password(password: str, salt: bytes, iterations: int = PASSWORD_HASH_ITERATIONS) -> bytes:
     return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
 
 
+def format_password_hash(salt: bytes, iterations: int, dk: bytes) -> str:
+    return f"{PASSWORD_HASH_ALGO}${int(iterations)}${salt.hex()}${dk.hex()}"
+
+
+def parse_password_hash(stored: str) -> Optional[Tuple[int, bytes, bytes]]:
+    """(iterations, salt, derived key) of a stored hash, or None if it is not ours."""
+    try:
+        algo, iters, salt_hex, dk_hex = stored.split("$", 3)
+        if algo != PASSWORD_HASH_ALGO:
+            return None
+        return int(iters), bytes.fromhex(salt_hex), bytes.fromhex(dk_hex)
+    except Exception:
+        return None
+
+
 def hash_password(password: str) -> str:
     salt = os.urandom(16)
     dk = _pbkdf2_hash_password(password, salt)
-    return f"pbkdf2_sha256$200000${salt.hex()}${dk.hex()}"
+    return format_password_hash(salt, PASSWORD_HASH_ITERATIONS, dk)
 
 
 def verify_password(password: str, stored: str) -> bool:
-    try:
-        algo, iters, salt_hex, dk_hex = stored.split("$", 3)
-        if algo != "pbkdf2_sha256":
-            return False
-        salt = bytes.fromhex(salt_hex)
-        expected = bytes.fromhex(dk_hex)
-        dk = _pbkdf2_hash_password(password, salt, int(iters))
-        return hmac.compare_digest(dk, expected)
-    except Exception:
+    parsed = parse_password_hash(stored)
+    if parsed is None:
         return False
+    iters, salt, expected = parsed
+    dk = _pbkdf2_hash_password(password, salt, iters)
+    return hmac.compare_digest(dk, expected)
+
+
+def needs_rehash(stored: str) -> bool:
+    """True when a (verified) hash was made with a different iteration count than configured."""
+    parsed = parse_password_hash(stored)
+    return parsed is not None and parsed[0] != PASSWORD_HASH_ITERATIONS
 
 
 def normalize_name(s: str) -> str:
@@ -75,15 +128,198 @@ def normalize_name(s: str) -> str:
     return s
 
 
+def normalize_names(names: pd.Series) -> pd.Series:
+    """Vectorized normalize_name for a Series of strings."""
+    s = names.fillna("").astype(str).str.strip().str.lower()
+    s = s.str.replace(r"\s+", " ", regex=True)
+    s = s.str.replace(r"[^a-z0-9 \-']", "", regex=True)
+    return s
+
+
 # =========================
 # DB layer
 # =========================
+# Idle connections kept for reuse; db() opens a new one when the pool is empty
+DB_POOL_SIZE = int(os.environ.get("APP_DB_POOL_SIZE", "8"))
+DB_MMAP_BYTES = int(os.environ.get("APP_DB_MMAP_BYTES", str(256 * 1024 * 1024)))
+DB_CACHED_STATEMENTS = 256
+
+
+class QueryTimer:
+    """SQLite time and statement count for one unit of work (see time_queries)."""
+
+    __slots__ = ("seconds", "queries")
+
+    def __init__(self) -> None:
+        self.seconds = 0.0
+        self.queries = 0
+
+
+_query_timer: ContextVar[Optional[QueryTimer]] = ContextVar("query_timer", default=None)
+
+
+@contextmanager
+def time_queries() -> Iterator[QueryTimer]:
+    """
+    Accumulate time spent in SQLite by pooled connections used in this context (and in
+    threads started from a copy of it, as Starlette's threadpool does) into a QueryTimer.
+    """
+    timer = QueryTimer()
+    token = _query_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _query_timer.reset(token)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor that adds execute and fetch time to the active QueryTimer; a plain cursor when
+    none is active. Rows pulled by iterating the cursor are not timed (that stays in C).
+    """
+
+    def execute(self, sql, parameters=()):
+        timer = _query_timer.get()
+        if timer is None:
+            return super().execute(sql, parameters)
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            timer.seconds += time.perf_counter() - t0
+            timer.queries += 1
+
+    def executemany(self, sql, seq_of_parameters):
+        timer = _query_timer.get()
+        if timer is None:
+            return super().executemany(sql, seq_of_parameters)
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            timer.seconds += time.perf_counter() - t0
+            timer.queries += 1
+
+    def _timed_fetch(self, fetch, *args):
+        timer = _query_timer.get()
+        if timer is None:
+            return fetch(*args)
+        t0 = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            timer.seconds += time.perf_counter() - t0
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size: Optional[int] = None):
+        return self._timed_fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    sqlite3 connection whose close() rolls back and returns it to the pool. Its cursors
+    (including the ones behind conn.execute) are TimedCursors.
+    """
+
+    db_path: str = ""
+    idle: bool = False
+
+    def cursor(self, factory=None) -> sqlite3.Cursor:
+        return super().cursor(factory or TimedCursor)
+
+    def execute(self, sql, parameters=()) -> sqlite3.Cursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters) -> sqlite3.Cursor:
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self) -> None:
+        if not self.idle:
+            _release_connection(self)
+
+    def discard(self) -> None:
+        self.idle = True
+        super().close()
+
+
+_db_pool: "queue.LifoQueue[PooledConnection]" = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+
+def _connect() -> PooledConnection:
+    conn = sqlite3.connect(
+        DB_PATH,
+        check_same_thread=False,
+        factory=PooledConnection,
+        cached_statements=DB_CACHED_STATEMENTS,
+    )
+    conn.db_path = DB_PATH
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_BYTES}")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def _release_connection(conn: PooledConnection) -> None:
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = sqlite3.Row
+    except sqlite3.Error:
+        conn.discard()
+        return
+    if conn.db_path != DB_PATH:
+        conn.discard()
+        return
+    conn.idle = True
+    try:
+        _db_pool.put_nowait(conn)
+    except queue.Full:
+        conn.discard()
+
+
 def db() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    """
+    Borrow a connection from the pool (WAL, synchronous=NORMAL, mmap, statement cache).
+    conn.close() returns it to the pool; uncommitted work is rolled back.
+    """
+    while True:
+        try:
+            conn = _db_pool.get_nowait()
+        except queue.Empty:
+            conn = _connect()
+            break
+        if conn.db_path == DB_PATH:
+            break
+        conn.discard()
+    conn.idle = False
     conn.row_factory = sqlite3.Row
     return conn
 
 
+@contextmanager
+def db_session() -> Iterator[sqlite3.Connection]:
+    """One pooled connection for a unit of work (a request, a page render)."""
+    conn = db()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def close_db_pool() -> None:
+    while True:
+        try:
+            _db_pool.get_nowait().discard()
+        except queue.Empty:
+            return
+
+
 def init_db() -> None:
     conn = db()
     cur = conn.cursor()
@@ -214,44 +450,478 @@ def init_db() -> None:
     )
 
     conn.commit()
+    migrate_db(conn)
     conn.close()
 
 
-def set_setting(org_id: int, key: str, value: str) -> None:
-    conn = db()
+# Ordered schema migrations applied by init_db. Append new entries; never edit a shipped one.
+# Steps are SQL strings or callables taking the connection.
+SCHEMA_MIGRATIONS: List[Tuple[int, str, list]] = [
+    (
+        1,
+        "secondary indexes for batch, export and customer lookups",
+        [
+            "CREATE INDEX IF NOT EXISTS idx_batch_rows_batch_row ON batch_rows(batch_id, row_index)",
+            "CREATE INDEX IF NOT EXISTS idx_batches_org_id ON batches(org_id, id)",
+            "CREATE INDEX IF NOT EXISTS idx_exports_batch_id ON exports(batch_id, id)",
+            "CREATE INDEX IF NOT EXISTS idx_customers_org_name ON customers(org_id, name)",
+        ],
+    ),
+    (
+        2,
+        "materialized batch stats on batches",
+        [
+            "ALTER TABLE batches ADD COLUMN row_count INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE batches ADD COLUMN billable_count INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE batches ADD COLUMN total_invoice REAL NOT NULL DEFAULT 0",
+            lambda conn: check_batch_stats(conn, repair=True),
+        ],
+    ),
+    (
+        3,
+        "match confidence on batch rows",
+        ["ALTER TABLE batch_rows ADD COLUMN match_confidence REAL"],
+    ),
+    (
+        4,
+        "customers_version on organizations, bumped by customer triggers",
+        [
+            "ALTER TABLE organizations ADD COLUMN customers_version INTEGER NOT NULL DEFAULT 0",
+            """
+            CREATE TRIGGER IF NOT EXISTS customers_version_ins AFTER INSERT ON customers
+            BEGIN
+                UPDATE organizations SET customers_version = customers_version + 1 WHERE id = NEW.org_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS customers_version_upd AFTER UPDATE ON customers
+            BEGIN
+                UPDATE organizations SET customers_version = customers_version + 1 WHERE id = NEW.org_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS customers_version_del AFTER DELETE ON customers
+            BEGIN
+                UPDATE organizations SET customers_version = customers_version + 1 WHERE id = OLD.org_id;
+            END
+            """,
+        ],
+    ),
+    (
+        5,
+        "rows_version on batches for the batch row cache",
+        ["ALTER TABLE batches ADD COLUMN rows_version INTEGER NOT NULL DEFAULT 0"],
+    ),
+    (
+        6,
+        "org_stats rollup kept by triggers on organizations, customers and batches",
+        [
+            "ALTER TABLE batches ADD COLUMN tax_saved_total REAL NOT NULL DEFAULT 0",
+            "ALTER TABLE batches ADD COLUMN review_count INTEGER NOT NULL DEFAULT 0",
+            """
+            CREATE TABLE IF NOT EXISTS org_stats (
+                org_id INTEGER PRIMARY KEY,
+                customer_count INTEGER NOT NULL DEFAULT 0,
+                batch_count INTEGER NOT NULL DEFAULT 0,
+                row_count INTEGER NOT NULL DEFAULT 0,
+                billable_count INTEGER NOT NULL DEFAULT 0,
+                total_invoice REAL NOT NULL DEFAULT 0,
+                tax_saved_total REAL NOT NULL DEFAULT 0,
+                review_count INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY(org_id) REFERENCES organizations(id)
+            )
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS org_stats_org_ins AFTER INSERT ON organizations
+            BEGIN
+                INSERT OR IGNORE INTO org_stats(org_id) VALUES(NEW.id);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS org_stats_customers_ins AFTER INSERT ON customers
+            BEGIN
+                UPDATE org_stats SET customer_count = customer_count + NEW.is_active WHERE org_id = NEW.org_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS org_stats_customers_upd AFTER UPDATE OF is_active, org_id ON customers
+            BEGIN
+                UPDATE org_stats SET customer_count = customer_count - OLD.is_active WHERE org_id = OLD.org_id;
+                UPDATE org_stats SET customer_count = customer_count + NEW.is_active WHERE org_id = NEW.org_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS org_stats_customers_del AFTER DELETE ON customers
+            BEGIN
+                UPDATE org_stats SET customer_count = customer_count - OLD.is_active WHERE org_id = OLD.org_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS org_stats_batches_ins AFTER INSERT ON batches
+            BEGIN
+                UPDATE org_stats SET batch_count = batch_count + 1,
+                    row_count = row_count + NEW.row_count,
+                    billable_count = billable_count + NEW.billable_count,
+                    total_invoice = total_invoice + NEW.total_invoice,
+                    tax_saved_total = tax_saved_total + NEW.tax_saved_total,
+                    review_count = review_count + NEW.review_count
+                WHERE org_id = NEW.org_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS org_stats_batches_upd
+            AFTER UPDATE OF row_count, billable_count, total_invoice, tax_saved_total, review_count ON batches
+            BEGIN
+                UPDATE org_stats SET
+                    row_count = row_count + NEW.row_count - OLD.row_count,
+                    billable_count = billable_count + NEW.billable_count - OLD.billable_count,
+                    total_invoice = total_invoice + NEW.total_invoice - OLD.total_invoice,
+                    tax_saved_total = tax_saved_total + NEW.tax_saved_total - OLD.tax_saved_total,
+                    review_count = review_count + NEW.review_count - OLD.review_count
+                WHERE org_id = NEW.org_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS org_stats_batches_del AFTER DELETE ON batches
+            BEGIN
+                UPDATE org_stats SET batch_count = batch_count - 1,
+                    row_count = row_count - OLD.row_count,
+                    billable_count = billable_count - OLD.billable_count,
+                    total_invoice = total_invoice - OLD.total_invoice,
+                    tax_saved_total = tax_saved_total - OLD.tax_saved_total,
+                    review_count = review_count - OLD.review_count
+                WHERE org_id = OLD.org_id;
+            END
+            """,
+            lambda conn: rebuild_org_stats(conn),
+        ],
+    ),
+    (
+        7,
+        "gzip export blobs keyed by SHA-256, moved out of exports.csv_blob",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS export_blobs (
+                sha256 TEXT PRIMARY KEY,
+                codec TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                stored_size INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                data BLOB NOT NULL
+            )
+            """,
+            "ALTER TABLE exports ADD COLUMN blob_sha256 TEXT REFERENCES export_blobs(sha256)",
+            lambda conn: move_inline_exports(conn),
+        ],
+    ),
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()
+    return int(row[0])
+
+
+def migrate_db(conn: sqlite3.Connection) -> int:
+    """Apply pending SCHEMA_MIGRATIONS, each in its own transaction. Returns the resulting version."""
     conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+        """
+    )
+    for version, name, steps in SCHEMA_MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        # IMMEDIATE takes the write lock up front so concurrent processes apply each migration once
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= schema_version(conn):
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                "INSERT INTO schema_version(version, name, applied_at) VALUES(?, ?, ?)",
+                (version, name, dt.datetime.utcnow().isoformat()),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return schema_version(conn)
+
+
+# =========================
+# Batch stats (row_count / billable_count / total_invoice / tax_saved_total / review_count kept on batches)
+# =========================
+_BATCH_STATS_SQL = """
+    SELECT COUNT(*) AS row_count,
+           COALESCE(SUM(CASE WHEN final_invoice > 0 THEN 1 ELSE 0 END), 0) AS billable_count,
+           COALESCE(SUM(final_invoice), 0) AS total_invoice,
+           COALESCE(SUM(tax_saved), 0) AS tax_saved_total,
+           COALESCE(SUM(CASE WHEN status='REVIEW' THEN 1 ELSE 0 END), 0) AS review_count
+    FROM batch_rows
+"""
+
+
+def set_batch_stats(
+    conn: sqlite3.Connection,
+    batch_id: int,
+    row_count: int,
+    billable_count: int,
+    total_invoice: float,
+    tax_saved_total: Optional[float] = None,
+    review_count: Optional[int] = None,
+) -> None:
+    """
+    Store a batch's stats; org_stats follows through the batches update trigger.
+    tax_saved_total / review_count are left as they are when None (older schemas lack them).
+    """
+    sets = {"row_count": int(row_count), "billable_count": int(billable_count), "total_invoice": float(total_invoice)}
+    if tax_saved_total is not None:
+        sets["tax_saved_total"] = float(tax_saved_total)
+    if review_count is not None:
+        sets["review_count"] = int(review_count)
+    conn.execute(
+        f"UPDATE batches SET {', '.join(f'{k}=?' for k in sets)} WHERE id=?",
+        (*sets.values(), int(batch_id)),
+    )
+
+
+def refresh_batch_stats(conn: sqlite3.Connection, batch_id: int) -> None:
+    """
+    Recompute a batch's stats from its rows (indexed on batch_id) after they changed; also
+    bumps rows_version, which invalidates the batch's row cache file. Caller commits.
+    """
+    r = conn.execute(_BATCH_STATS_SQL + " WHERE batch_id=?", (int(batch_id),)).fetchone()
+    set_batch_stats(
+        conn, batch_id, r["row_count"], r["billable_count"], r["total_invoice"], r["tax_saved_total"], r["review_count"]
+    )
+    conn.execute("UPDATE batches SET rows_version = rows_version + 1 WHERE id=?", (int(batch_id),))
+
+
+def check_batch_stats(conn: sqlite3.Connection, org_id: Optional[int] = None, repair: bool = False) -> List[dict]:
+    """
+    Compare stored batch stats with batch_rows. Returns the mismatches; with repair=True
+    they are rewritten from batch_rows (caller commits).
+    """
+    where, params = ("WHERE b.org_id=?", (org_id,)) if org_id is not None else ("", ())
+    rows = conn.execute(
+        f"""
+        SELECT b.id, b.row_count, b.billable_count, b.total_invoice,
+               COALESCE(a.row_count, 0) AS actual_row_count,
+               COALESCE(a.billable_count, 0) AS actual_billable_count,
+               COALESCE(a.total_invoice, 0) AS actual_total_invoice
+        FROM batches b
+        LEFT JOIN (
+            SELECT batch_id,
+                   COUNT(*) AS row_count,
+                   SUM(CASE WHEN final_invoice > 0 THEN 1 ELSE 0 END) AS billable_count,
+                   SUM(final_invoice) AS total_invoice
+            FROM batch_rows
+            GROUP BY batch_id
+        ) a ON a.batch_id = b.id
+        {where}
+        ORDER BY b.id
+        """,
+        params,
+    ).fetchall()
+
+    mismatches = [
+        dict(r)
+        for r in rows
+        if r["row_count"] != r["actual_row_count"]
+        or r["billable_count"] != r["actual_billable_count"]
+        or abs(float(r["total_invoice"]) - float(r["actual_total_invoice"])) > 1e-6
+    ]
+    if repair:
+        for m in mismatches:
+            set_batch_stats(conn, m["id"], m["actual_row_count"], m["actual_billable_count"], m["actual_total_invoice"])
+    return mismatches
+
+
+# =========================
+# Org stats (one rollup row per org behind the dashboard)
+# =========================
+# Triggers from migration 6 keep org_stats in step with organizations, customers and the
+# per-batch stats on batches, so every path that saves a batch, patches discounts or adds,
+# imports or deactivates customers moves it without extra calls. rebuild_org_stats recomputes
+# it from the base tables (manage.py rebuild-org-stats).
+ORG_STATS_COLUMNS = [
+    "customer_count",
+    "batch_count",
+    "row_count",
+    "billable_count",
+    "total_invoice",
+    "tax_saved_total",
+    "review_count",
+]
+
+
+def rebuild_org_stats(conn: sqlite3.Connection, org_id: Optional[int] = None) -> int:
+    """
+    Recompute org_stats (and the batch stats it sums) from batch_rows and customers, for one
+    org or all of them. Caller commits. Returns the number of orgs rebuilt.
+    """
+    check_batch_stats(conn, org_id=org_id, repair=True)
+    batch_where, params = ("WHERE org_id=?", (int(org_id),)) if org_id is not None else ("", ())
+    conn.execute(
+        f"""
+        UPDATE batches SET
+            tax_saved_total = (SELECT COALESCE(SUM(tax_saved), 0) FROM batch_rows WHERE batch_id = batches.id),
+            review_count = (SELECT COUNT(*) FROM batch_rows WHERE batch_id = batches.id AND status = 'REVIEW')
+        {batch_where}
+        """,
+        params,
+    )
+    # WHERE is required: it keeps SQLite from reading ON CONFLICT as part of the join
+    org_where = "WHERE o.id=?" if org_id is not None else "WHERE 1"
+    cur = conn.execute(
+        f"""
+        INSERT INTO org_stats(org_id, {', '.join(ORG_STATS_COLUMNS)})
+        SELECT o.id,
+               COALESCE(c.customer_count, 0),
+               COALESCE(b.batch_count, 0),
+               COALESCE(b.row_count, 0),
+               COALESCE(b.billable_count, 0),
+               COALESCE(b.total_invoice, 0),
+               COALESCE(b.tax_saved_total, 0),
+               COALESCE(b.review_count, 0)
+        FROM organizations o
+        LEFT JOIN (
+            SELECT org_id, SUM(is_active) AS customer_count FROM customers GROUP BY org_id
+        ) c ON c.org_id = o.id
+        LEFT JOIN (
+            SELECT org_id,
+                   COUNT(*) AS batch_count,
+                   SUM(row_count) AS row_count,
+                   SUM(billable_count) AS billable_count,
+                   SUM(total_invoice) AS total_invoice,
+                   SUM(tax_saved_total) AS tax_saved_total,
+                   SUM(review_count) AS review_count
+            FROM batches
+            GROUP BY org_id
+        ) b ON b.org_id = o.id
+        {org_where}
+        ON CONFLICT(org_id) DO UPDATE SET {', '.join(f'{c}=excluded.{c}' for c in ORG_STATS_COLUMNS)}
+        """,
+        params,
+    )
+    return int(cur.rowcount)
+
+
+def get_org_stats(conn: sqlite3.Connection, org_id: int) -> Dict[str, float]:
+    """The org's rollup row (a primary-key lookup); rebuilt on the spot if it is missing."""
+    row = conn.execute("SELECT * FROM org_stats WHERE org_id=?", (int(org_id),)).fetchone()
+    if row is None:
+        rebuild_org_stats(conn, org_id)
+        conn.commit()
+        row = conn.execute("SELECT * FROM org_stats WHERE org_id=?", (int(org_id),)).fetchone()
+    return {c: row[c] for c in ORG_STATS_COLUMNS} if row else dict.fromkeys(ORG_STATS_COLUMNS, 0)
+
+
+SETTING_DEFAULTS = {
+    "tax_rate_pct": "2.500000",
+    "contingency_pct": "25",
+    "flat_fee": "150",
+    "review_min_tax_saved": "700",
+    "charge_flat_if_no_win": "0",
+    "days_due": "30",
+    "qb_item_name": "Property Tax Protest",
+    "qb_desc_prefix": "Tax savings",
+    "next_invoice_no": "1001",
+    "fuzzy_match": "0",
+    "fuzzy_match_threshold": "0.85",
+}
+
+# Per-org settings cache. Writes in this process invalidate it; the TTL bounds how long
+# a change made by another process (Streamlit vs API) can go unseen.
+SETTINGS_CACHE_TTL_SECONDS = float(os.environ.get("APP_SETTINGS_CACHE_TTL", "30"))
+_settings_cache: Dict[int, Tuple[float, Dict[str, str]]] = {}
+_settings_generation: Dict[int, int] = {}
+_settings_lock = threading.Lock()
+
+
+def invalidate_settings_cache(org_id: Optional[int] = None) -> None:
+    with _settings_lock:
+        orgs = [org_id] if org_id is not None else list(_settings_cache)
+        for o in orgs:
+            _settings_cache.pop(o, None)
+            _settings_generation[o] = _settings_generation.get(o, 0) + 1
+
+
+def _stored_settings(org_id: int, conn: Optional[sqlite3.Connection], use_cache: bool) -> Dict[str, str]:
+    now = time.monotonic()
+    with _settings_lock:
+        hit = _settings_cache.get(org_id)
+        generation = _settings_generation.get(org_id, 0)
+    if use_cache and hit and now - hit[0] < SETTINGS_CACHE_TTL_SECONDS:
+        return hit[1]
+
+    own = conn is None
+    conn = conn or db()
+    try:
+        rows = conn.execute("SELECT key, value FROM settings WHERE org_id=?", (org_id,)).fetchall()
+    finally:
+        if own:
+            conn.close()
+    stored = {r["key"]: r["value"] for r in rows}
+
+    with _settings_lock:
+        # Skip caching if a write invalidated the org while we were reading
+        if _settings_generation.get(org_id, 0) == generation:
+            _settings_cache[org_id] = (now, stored)
+    return stored
+
+
+def get_settings(org_id: int, conn: Optional[sqlite3.Connection] = None, use_cache: bool = True) -> Dict[str, str]:
+    """All settings of an org over SETTING_DEFAULTS, from one indexed read (cached per org)."""
+    return {**SETTING_DEFAULTS, **_stored_settings(org_id, conn, use_cache)}
+
+
+def set_settings(org_id: int, values: Dict[str, str], conn: Optional[sqlite3.Connection] = None) -> None:
+    """
+    Upsert several settings in one transaction. With `conn` the write joins the caller's
+    transaction: the caller commits, then calls invalidate_settings_cache(org_id). Invalidating
+    any earlier would let a concurrent read cache the old committed row for the whole TTL.
+    """
+    if conn is not None:
+        _write_settings(conn, org_id, values)
+        return
+    conn = db()
+    try:
+        _write_settings(conn, org_id, values)
+        conn.commit()
+    finally:
+        conn.close()
+        invalidate_settings_cache(org_id)
+
+
+def _write_settings(conn: sqlite3.Connection, org_id: int, values: Dict[str, str]) -> None:
+    conn.executemany(
         "INSERT INTO settings(org_id, key, value) VALUES(?, ?, ?) "
         "ON CONFLICT(org_id, key) DO UPDATE SET value=excluded.value",
-        (org_id, key, value),
+        [(org_id, k, str(v)) for k, v in values.items()],
     )
-    conn.commit()
-    conn.close()
 
 
-def get_setting(org_id: int, key: str, default: str) -> str:
-    conn = db()
-    row = conn.execute(
-        "SELECT value FROM settings WHERE org_id=? AND key=?",
-        (org_id, key),
-    ).fetchone()
-    conn.close()
-    return row["value"] if row else default
+def set_setting(org_id: int, key: str, value: str, conn: Optional[sqlite3.Connection] = None) -> None:
+    set_settings(org_id, {key: value}, conn=conn)
+
+
+def get_setting(org_id: int, key: str, default: str, conn: Optional[sqlite3.Connection] = None) -> str:
+    return _stored_settings(org_id, conn, use_cache=True).get(key, default)
 
 
 def bootstrap_org_defaults(org_id: int) -> None:
-    defaults = {
-        "tax_rate_pct": "2.500000",
-        "contingency_pct": "25",
-        "flat_fee": "150",
-        "review_min_tax_saved": "700",
-        "charge_flat_if_no_win": "0",
-        "days_due": "30",
-        "qb_item_name": "Property Tax Protest",
-        "qb_desc_prefix": "Tax savings",
-        "next_invoice_no": "1001",
-    }
-    for k, v in defaults.items():
-        set_setting(org_id, k, v)
+    set_settings(org_id, SETTING_DEFAULTS)
 
 
 # =========================
@@ -281,12 +951,29 @@ def is_admin(u: SessionUser) -> bool:
     return u.role == ROLE_ADMIN
 
 
-def create_org_with_admin(org_name: str, email: str, password: str) -> Tuple[bool, str]:
+def new_org_error(org_name: str, email: str, password: str) -> Optional[str]:
+    """
+    Why create_org_with_admin would turn these down, or None. Lets callers skip hashing
+    the password for a sign-up that cannot succeed.
+    """
+    if not org_name.strip() or not email.strip() or not password:
+        return "All fields are required."
+    with db_session() as conn:
+        if conn.execute("SELECT 1 FROM organizations WHERE name=?", (org_name.strip(),)).fetchone():
+            return "Organization name already exists."
+    return None
+
+
+def create_org_with_admin(
+    org_name: str, email: str, password: str, password_hash: Optional[str] = None
+) -> Tuple[bool, str]:
+    """password_hash lets callers that hash off-thread (the API) pass the finished hash."""
     org_name = org_name.strip()
     email = email.strip().lower()
 
-    if not org_name or not email or not password:
-        return False, "All fields are required."
+    error = new_org_error(org_name, email, password)
+    if error:
+        return False, error
 
     conn = db()
     cur = conn.cursor()
@@ -297,7 +984,7 @@ def create_org_with_admin(org_name: str, email: str, password: str) -> Tuple[boo
 
         cur.execute(
             "INSERT INTO users(org_id, email, password_hash, role, created_at) VALUES(?, ?, ?, ?, ?)",
-            (org_id, email, hash_password(password), ROLE_ADMIN, dt.datetime.utcnow().isoformat()),
+            (org_id, email, password_hash or hash_password(password), ROLE_ADMIN, dt.datetime.utcnow().isoformat()),
         )
 
         conn.commit()
@@ -317,33 +1004,51 @@ def create_org_with_admin(org_name: str, email: str, password: str) -> Tuple[boo
         return False, "Failed to create organization."
 
 
-def authenticate(org_name: str, email: str, password: str) -> Tuple[bool, Optional[SessionUser], str]:
+def find_login(org_name: str, email: str) -> Optional[dict]:
+    """
+    The user row (plus org_name) for a login attempt, or None. DB-only half of
+    authenticate, so callers can verify the password elsewhere.
+    """
     org_name = org_name.strip()
     email = email.strip().lower()
 
-    conn = db()
-    org = conn.execute("SELECT id, name FROM organizations WHERE name=?", (org_name,)).fetchone()
-    if not org:
-        conn.close()
-        return False, None, "Invalid organization or credentials."
+    with db_session() as conn:
+        row = conn.execute(
+            """
+            SELECT u.id, u.org_id, u.email, u.password_hash, u.role, o.name AS org_name
+            FROM organizations o
+            JOIN users u ON u.org_id = o.id
+            WHERE o.name=? AND u.email=?
+            """,
+            (org_name, email),
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def session_user_from_login(login: dict) -> SessionUser:
+    return SessionUser(
+        user_id=int(login["id"]),
+        org_id=int(login["org_id"]),
+        email=login["email"],
+        role=login["role"],
+        org_name=login["org_name"],
+    )
 
-    user = conn.execute(
-        "SELECT id, org_id, email, password_hash, role FROM users WHERE org_id=? AND email=?",
-        (org["id"], email),
-    ).fetchone()
-    conn.close()
 
-    if not user or not verify_password(password, user["password_hash"]):
+def update_password_hash(user_id: int, password_hash: str) -> None:
+    with db_session() as conn:
+        conn.execute("UPDATE users SET password_hash=? WHERE id=?", (password_hash, int(user_id)))
+        conn.commit()
+
+
+def authenticate(org_name: str, email: str, password: str) -> Tuple[bool, Optional[SessionUser], str]:
+    login = find_login(org_name, email)
+    if not login or not verify_password(password, login["password_hash"]):
         return False, None, "Invalid organization or credentials."
 
-    u = SessionUser(
-        user_id=int(user["id"]),
-        org_id=int(user["org_id"]),
-        email=user["email"],
-        role=user["role"],
-        org_name=org["name"],
-    )
-    return True, u, "Signed in."
+    if needs_rehash(login["password_hash"]):
+        update_password_hash(login["id"], hash_password(password))
+    return True, session_user_from_login(login), "Signed in."
 
 
 def logout() -> None:
@@ -354,23 +1059,1369 @@ def logout() -> None:
 # =========================
 # Data / Math engine
 # =========================
+MONEY_MEMO_SIZE = 65_536  # distinct formatted cells remembered across chunks and batches
+_MONEY_DROP = str.maketrans("", "", "$,")
+
+
+@functools.lru_cache(maxsize=MONEY_MEMO_SIZE)
+def _money_value(text: str) -> float:
+    """One formatted cell ("$1,234.50", "(500)") as a float; NaN if it is not a number."""
+    s = text.strip().translate(_MONEY_DROP)
+    if len(s) >= 2 and s[0] == "(" and s[-1] == ")":
+        s = "-" + s[1:-1]
+    if not s.isascii() or "_" in s:  # float() accepts these, pd.to_numeric does not
+        return math.nan
+    try:
+        return float(s)
+    except ValueError:
+        return math.nan
+
+
+def parse_money(series: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """
+    Money column -> (values, unparseable). Numeric columns are cast as they are; text is
+    factorized so each distinct string is parsed once. Blank cells become 0.0; cells that
+    are not a number also become 0.0 but are flagged in the boolean `unparseable` mask.
+    """
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.astype(float).fillna(0.0), pd.Series(False, index=series.index)
+
+    codes, uniques = pd.factorize(series)
+    texts = list(map(str, np.asarray(uniques, dtype=object).tolist()))
+    # A column with more distinct values than the memo holds would only churn it
+    parse = _money_value if len(texts) <= MONEY_MEMO_SIZE else _money_value.__wrapped__
+    parsed = np.array(list(map(parse, texts)) + [0.0])  # code -1 (NA) hits the trailing 0.0
+    bad = np.isnan(parsed)
+    bad[:-1] &= np.array([t.strip() != "" for t in texts], dtype=bool)
+    values = np.where(np.isnan(parsed), 0.0, parsed)
+    return pd.Series(values[codes], index=series.index), pd.Series(bad[codes], index=series.index)
+
+
 def to_money(series: pd.Series) -> pd.Series:
-    s = series.astype(str).str.strip()
-    s = s.str.replace(r"[\$,]", "", regex=True)
-    s = s.str.replace(r"^\((.*)\)$", r"-\1", regex=True)
-    return pd.to_numeric(s, errors="coerce").fillna(0.0)
+    return parse_money(series)[0]
+
+
+def guess_column(cols: list[str], keywords: list[str]) -> str:
+    lower = {c: c.lower() for c in cols}
+    for c in cols:
+        if any(k in lower[c] for k in keywords):
+            return c
+    return cols[0] if cols else ""
+
+
+def compute_batch_df(
+    df_raw: pd.DataFrame,
+    col_owner: str,
+    col_propid: str,
+    col_notice: str,
+    col_final: str,
+    tax_rate_pct: float,
+    contingency_pct: float,
+    flat_fee: float,
+    review_min_tax_saved: float,
+    charge_flat_if_no_win: bool,
+    customers_by_norm: Dict[str, dict],
+    engine: str = ENGINE_VECTORIZED,
+    row_offset: int = 0,
+    fuzzy_index: Optional[FuzzyCustomerIndex] = None,
+    profiler: Optional["StageProfiler"] = None,
+) -> pd.DataFrame:
+    """
+    Compute reductions, fees, status and customer matches for a county sheet.
+    engine="vectorized" (default) uses column operations throughout; engine="python"
+    is the original per-row implementation and produces identical output.
+    row_offset shifts row_id so chunks of one sheet keep sheet-wide row numbers.
+    With fuzzy_index, rows without an exact name match are fuzzy-matched; Match_Confidence
+    is 1.0 for exact matches, the fuzzy score otherwise, NaN when unmatched.
+    Money_Parse_Error flags rows whose notice or final value was not a number (counted as 0).
+    With a StageProfiler, each stage's time and memory are recorded into it.
+    """
+    params = dict(locals())
+    del params["df_raw"], params["profiler"]
+    return compute_batch_stages(df_raw, params, profiler=profiler)
+
+
+# compute_batch_df in stages: (name, function, upstream stages, parameters read).
+# A stage's output holds only the columns it adds; with a cache it is reused until one
+# of its parameters, or an upstream stage's, changes. "match" reads customers_by_norm
+# and fuzzy_index, which the caller identifies through match_key.
+BATCH_STAGES: List[Tuple[str, Callable, Tuple[str, ...], Tuple[str, ...]]] = []
+
+
+def batch_stage(name: str, upstream: Tuple[str, ...], params: Tuple[str, ...]):
+    def register(fn: Callable) -> Callable:
+        BATCH_STAGES.append((name, fn, upstream, params))
+        return fn
+
+    return register
+
+
+@batch_stage("parse", (), ("col_owner", "col_propid", "col_notice", "col_final", "row_offset"))
+def _parse_stage(src: pd.DataFrame, p: dict, up: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    out = pd.DataFrame(index=src.index)
+    out[CANON["row_id"]] = (src.index + int(p["row_offset"])).astype(int)
+    out[CANON["client_name"]] = src[p["col_owner"]].astype(str).fillna("").str.strip()
+    out[CANON["property_id"]] = src[p["col_propid"]].astype(str).fillna("").str.strip()
+    out[CANON["notice_value"]], notice_bad = parse_money(src[p["col_notice"]])
+    out[CANON["final_value"]], final_bad = parse_money(src[p["col_final"]])
+    out[CANON["money_error"]] = notice_bad | final_bad
+    return out
+
+
+@batch_stage("tax", ("parse",), ("tax_rate_pct",))
+def _tax_stage(src: pd.DataFrame, p: dict, up: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    parsed = up["parse"]
+    out = pd.DataFrame(index=src.index)
+    out[CANON["reduction"]] = (parsed[CANON["notice_value"]] - parsed[CANON["final_value"]]).clip(lower=0.0)
+    tax_rate = p["tax_rate_pct"] / 100.0
+    out[CANON["tax_saved"]] = (out[CANON["reduction"]] * tax_rate).clip(lower=0.0)
+    return out
+
+
+@batch_stage(
+    "fees",
+    ("tax",),
+    ("contingency_pct", "flat_fee", "review_min_tax_saved", "charge_flat_if_no_win", "engine"),
+)
+def _fees_stage(src: pd.DataFrame, p: dict, up: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    tax_saved = up["tax"][CANON["tax_saved"]]
+    out = pd.DataFrame(index=src.index)
+    out[CANON["base_fee"]] = 0.0
+    wins = tax_saved > 0
+    out.loc[wins, CANON["base_fee"]] = (tax_saved[wins] * (p["contingency_pct"] / 100.0)) + float(p["flat_fee"])
+    if p["charge_flat_if_no_win"]:
+        out.loc[~wins, CANON["base_fee"]] = float(p["flat_fee"])
+
+    out[CANON["manual_discount"]] = 0.0
+    out[CANON["final_invoice"]] = (out[CANON["base_fee"]] - out[CANON["manual_discount"]]).clip(lower=0.0)
+
+    if p["engine"] == ENGINE_PYTHON:
+        out[CANON["status"]] = _status_python(tax_saved, p["review_min_tax_saved"])
+    else:
+        out[CANON["status"]] = classify_status(tax_saved, p["review_min_tax_saved"])
+    return out
+
+
+@batch_stage("match", ("parse",), ("match_key", "engine"))
+def _match_stage(src: pd.DataFrame, p: dict, up: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    client_names = up["parse"][CANON["client_name"]]
+    if p["engine"] == ENGINE_PYTHON:
+        matched_ids, matched_names = _match_customers_python(client_names, p["customers_by_norm"])
+    else:
+        matched_ids, matched_names = match_customers(client_names, p["customers_by_norm"])
+
+    confidence = [None if cid is None else 1.0 for cid in matched_ids]
+    if p["fuzzy_index"] is not None:
+        fuzzy_fill(client_names, matched_ids, matched_names, confidence, p["fuzzy_index"])
+
+    out = pd.DataFrame(index=src.index)
+    out[CANON["matched_customer_id"]] = matched_ids
+    out[CANON["matched_customer_name"]] = matched_names
+    out[CANON["match_confidence"]] = pd.Series(confidence, index=src.index, dtype=float)
+    return out
+
+
+# tracemalloc is process-wide: only one StageProfiler at a time may measure memory
+_memory_profiling_lock = threading.Lock()
+
+
+class StageProfiler:
+    """
+    Per-stage wall time, rows/s and (memory=True) tracemalloc peak for batch-engine runs.
+    Pass it as profiler= to compute_batch_df, compute_batch_stages or run_batch_chunked;
+    a stage that runs once per chunk is summed into one entry. Without a profiler the
+    engine records nothing. Call report() when the run is done, also on errors.
+    tracemalloc slows down every thread while it traces, and only one profiler can
+    measure memory at a time; a memory profiler that starts while another one is
+    running records timings only (peak_bytes None).
+    """
+
+    def __init__(self, memory: bool = True):
+        self.memory = memory
+        self.stages: Dict[str, dict] = {}
+        self._holds_memory_lock = False
+        self._tracing_started = False
+
+    def _start_memory(self) -> bool:
+        """Take the memory-profiling lock on the first stage; False if another profiler has it."""
+        if not self._holds_memory_lock:
+            if not _memory_profiling_lock.acquire(blocking=False):
+                self.memory = False
+                return False
+            self._holds_memory_lock = True
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._tracing_started = True
+        return True
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 0) -> Iterator[dict]:
+        """
+        Time the block as `name`. The block may set info["cached"] = True on a cache hit,
+        info["rows"] when the row count is only known afterwards, or info["skip"] = True
+        when it turned out to have nothing to do (the call is not recorded).
+        """
+        info = {"cached": False, "rows": rows, "skip": False}
+        base = 0
+        if self.memory and self._start_memory():
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        try:
+            yield info
+        finally:
+            seconds = time.perf_counter() - t0
+            if not info["skip"]:
+                entry = self.stages.setdefault(
+                    name, {"stage": name, "calls": 0, "cached": 0, "rows": 0, "seconds": 0.0, "peak_bytes": None}
+                )
+                entry["calls"] += 1
+                entry["cached"] += int(bool(info["cached"]))
+                entry["rows"] += int(info["rows"])
+                entry["seconds"] += seconds
+                if self.memory:
+                    peak = max(tracemalloc.get_traced_memory()[1] - base, 0)
+                    entry["peak_bytes"] = max(entry["peak_bytes"] or 0, peak)
+
+    def report(self) -> dict:
+        """
+        {"total_seconds", "stages": [...]} in run order. Stops tracemalloc if this profiler
+        started it and lets the next profiler measure memory.
+        """
+        if self._tracing_started:
+            tracemalloc.stop()
+            self._tracing_started = False
+        if self._holds_memory_lock:
+            self._holds_memory_lock = False
+            _memory_profiling_lock.release()
+        stages = []
+        for e in self.stages.values():
+            computed = e["calls"] > e["cached"] and e["rows"] and e["seconds"] > 0
+            stages.append(
+                {**e, "seconds": round(e["seconds"], 6), "rows_per_s": round(e["rows"] / e["seconds"], 1) if computed else None}
+            )
+        return {"total_seconds": round(sum(e["seconds"] for e in self.stages.values()), 6), "stages": stages}
+
+
+_NO_STAGE = nullcontext({})
+
+
+def _no_stage(name: str, rows: int = 0):
+    return _NO_STAGE
+
+
+def compute_batch_stages(
+    df_raw: pd.DataFrame,
+    params: dict,
+    cache: Optional["FrameCache"] = None,
+    source_key: Optional[tuple] = None,
+    profiler: Optional[StageProfiler] = None,
+) -> pd.DataFrame:
+    """
+    Run BATCH_STAGES over df_raw (params: compute_batch_df's keyword arguments, plus an
+    optional hashable match_key). With a cache and a source_key identifying df_raw, stage
+    outputs are reused; "match" is only cached when match_key is given. A profiler also
+    times the input copy ("copy") and merging stage outputs ("assemble").
+    """
+    if params.get("engine", ENGINE_VECTORIZED) not in (ENGINE_VECTORIZED, ENGINE_PYTHON):
+        raise ValueError(f"Unknown batch engine: {params['engine']}")
+    p = {"engine": ENGINE_VECTORIZED, "row_offset": 0, "fuzzy_index": None, "match_key": None, **params}
+    stage = profiler.stage if profiler is not None else _no_stage
+    rows = len(df_raw)
+
+    with stage("copy", rows):
+        df = df_raw.copy().reset_index(drop=True)
+    outputs: Dict[str, pd.DataFrame] = {}
+    keys: Dict[str, tuple] = {}
+    for name, fn, upstream, names in BATCH_STAGES:
+        keys[name] = (name, *(keys[u] for u in upstream), *(p[n] for n in names))
+        cacheable = cache is not None and source_key is not None and (name != "match" or p["match_key"] is not None)
+        with stage(name, rows) as info:
+            out = cache.get(("stage", source_key, keys[name])) if cacheable else None
+            if out is None:
+                out = fn(df, p, outputs)
+                if cacheable:
+                    cache.put(("stage", source_key, keys[name]), out)
+            else:
+                info["cached"] = True
+        outputs[name] = out
+    with stage("assemble", rows):
+        for out in outputs.values():
+            for col in out.columns:
+                df[col] = out[col]
+    return df
+
+
+def classify_status(tax_saved: pd.Series, review_min_tax_saved: float) -> list:
+    """NO_CHARGE / REVIEW / STANDARD tiers, evaluated in the same order as the per-row rules."""
+    values = tax_saved.to_numpy(dtype=float)
+    tiers = np.select(
+        [values <= 0, values < review_min_tax_saved],
+        ["NO_CHARGE", "REVIEW"],
+        default="STANDARD",
+    )
+    return tiers.tolist()
+
+
+def match_customers(client_names: pd.Series, customers_by_norm: Dict[str, dict]) -> Tuple[list, list]:
+    """
+    Exact normalized-name match against the customer index.
+    Returns (matched_ids, matched_names) as plain lists (None where unmatched) so the
+    resulting columns get the same dtypes as the per-row implementation.
+    """
+    keys = normalize_names(client_names)
+    custs = list(customers_by_norm.values())
+    position = {k: i for i, k in enumerate(customers_by_norm.keys())}
+    ids = np.array([int(c["id"]) for c in custs] + [None], dtype=object)
+    names = np.array([str(c["name"]) for c in custs] + [None], dtype=object)
+
+    # Unmatched rows point at the trailing None slot
+    pos = keys.map(position).fillna(len(custs)).to_numpy(dtype=np.int64)
+    return ids[pos].tolist(), names[pos].tolist()
+
+
+def _status_python(tax_saved: pd.Series, review_min_tax_saved: float) -> pd.Series:
+    def status(ts: float) -> str:
+        if ts <= 0:
+            return "NO_CHARGE"
+        if ts < review_min_tax_saved:
+            return "REVIEW"
+        return "STANDARD"
+
+    return tax_saved.apply(status)
+
+
+def _match_customers_python(client_names: pd.Series, customers_by_norm: Dict[str, dict]) -> Tuple[list, list]:
+    matched_ids = []
+    matched_names = []
+    for raw_name in client_names.tolist():
+        key = normalize_name(raw_name)
+        cust = customers_by_norm.get(key)
+        if cust:
+            matched_ids.append(int(cust["id"]))
+            matched_names.append(str(cust["name"]))
+        else:
+            matched_ids.append(None)
+            matched_names.append(None)
+    return matched_ids, matched_names
+
+
+QB_EXPORT_CHUNK_ROWS = 5_000
+
+# batch_rows columns feeding the QB export, in CANON order for qb_export_frame
+QB_EXPORT_SOURCE = {
+    CANON["client_name"]: "raw_client_name",
+    CANON["property_id"]: "property_id",
+    CANON["tax_saved"]: "tax_saved",
+    CANON["final_invoice"]: "final_invoice",
+    CANON["matched_customer_name"]: "matched_customer_name",
+}
+
+
+def qb_export_frame(
+    billable_df: pd.DataFrame,
+    invoice_start_no: int,
+    invoice_date: dt.date,
+    days_due: int,
+    qb_item_name: str,
+    qb_desc_prefix: str,
+) -> pd.DataFrame:
+    due_date = invoice_date + dt.timedelta(days=int(days_due))
+
+    out = billable_df.copy().reset_index(drop=True)
+    out["InvoiceNo"] = range(invoice_start_no, invoice_start_no + len(out))
+
+    customer_name = out[CANON["matched_customer_name"]].fillna(out[CANON["client_name"]]).astype(str)
+
+    item_desc = (
+        qb_desc_prefix
+        + ": $"
+        + out[CANON["tax_saved"]].round(2).astype(str)
+        + " | Prop: "
+        + out[CANON["property_id"]].astype(str)
+    )
+
+    return pd.DataFrame(
+        {
+            "InvoiceNo": out["InvoiceNo"],
+            "Customer": customer_name,
+            "InvoiceDate": invoice_date.strftime("%m/%d/%Y"),
+            "DueDate": due_date.strftime("%m/%d/%Y"),
+            "Item(Product/Service)": qb_item_name,
+            "ItemDescription": item_desc,
+            "ItemQuantity": 1,
+            "ItemRate": out[CANON["final_invoice"]].round(2),
+            "ItemAmount": out[CANON["final_invoice"]].round(2),
+        }
+    )
+
+
+def qb_export_csv(
+    billable_df: pd.DataFrame,
+    invoice_start_no: int,
+    invoice_date: dt.date,
+    days_due: int,
+    qb_item_name: str,
+    qb_desc_prefix: str,
+) -> Tuple[pd.DataFrame, bytes]:
+    qb = qb_export_frame(billable_df, invoice_start_no, invoice_date, days_due, qb_item_name, qb_desc_prefix)
+    csv_bytes = qb.to_csv(index=False).encode("utf-8")
+    return qb, csv_bytes
+
+
+def count_billable_rows(conn: sqlite3.Connection, batch_id: int) -> int:
+    """How many rows open_billable_rows yields right now (not the stored billable_count)."""
+    row = conn.execute(
+        "SELECT COUNT(*) FROM batch_rows WHERE batch_id = ? AND final_invoice > 0", (int(batch_id),)
+    ).fetchone()
+    return int(row[0])
+
+
+def open_billable_rows(conn: sqlite3.Connection, batch_id: int) -> sqlite3.Cursor:
+    """Cursor over a batch's billable rows in export order (uses idx_batch_rows_batch_row)."""
+    cols = ", ".join(QB_EXPORT_SOURCE.values())
+    return conn.execute(
+        f"SELECT {cols} FROM batch_rows WHERE batch_id = ? AND final_invoice > 0 ORDER BY row_index",
+        (int(batch_id),),
+    )
+
+
+def iter_qb_export_csv(
+    cur: sqlite3.Cursor,
+    invoice_start_no: int,
+    invoice_date: dt.date,
+    days_due: int,
+    qb_item_name: str,
+    qb_desc_prefix: str,
+    chunk_rows: int = QB_EXPORT_CHUNK_ROWS,
+    totals: Optional[dict] = None,
+) -> Iterator[bytes]:
+    """
+    QB import CSV in chunks straight from a batch_rows cursor (see open_billable_rows).
+    Same formatting as qb_export_csv; memory is bounded by chunk_rows. If given, totals
+    is filled with invoice_count / total_amount as the rows go by.
+    """
+    if totals is not None:
+        totals.update(invoice_count=0, total_amount=0.0)
+    next_no = int(invoice_start_no)
+    header = True
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows and not header:
+            return
+        chunk = pd.DataFrame.from_records([tuple(r) for r in rows], columns=list(QB_EXPORT_SOURCE))
+        qb = qb_export_frame(chunk, next_no, invoice_date, days_due, qb_item_name, qb_desc_prefix)
+        yield qb.to_csv(index=False, header=header).encode("utf-8")
+        header = False
+        next_no += len(qb)
+        if totals is not None:
+            totals["invoice_count"] += len(qb)
+            totals["total_amount"] += float(chunk[CANON["final_invoice"]].sum())
+        if not rows:
+            return
+
+
+# =========================
+# Export store (gzip blobs keyed by SHA-256)
+# =========================
+# Stored export CSVs live in export_blobs, gzip-compressed and keyed by the SHA-256 of the
+# uncompressed CSV, so identical exports share one blob. exports.blob_sha256 points at it;
+# exports.csv_blob is left empty (x'') and is only read for rows written before migration 7.
+EXPORT_BLOB_CODEC = "gzip"
+EXPORT_COMPRESS_LEVEL = 6
+EXPORT_SPOOL_BYTES = 8 * 1024 * 1024  # compressed exports spill to a temp file past this
+EXPORT_CHUNK_BYTES = 1 << 20
+
+
+def _write_blob(conn: sqlite3.Connection, table: str, column: str, rowid: int, src: io.IOBase) -> None:
+    """Fill a zeroblob column from a file in chunks (incremental blob I/O)."""
+    if not hasattr(conn, "blobopen"):  # Python < 3.11
+        conn.execute(f"UPDATE {table} SET {column}=? WHERE rowid=?", (sqlite3.Binary(src.read()), rowid))
+        return
+    with conn.blobopen(table, column, rowid) as blob:
+        for data in iter(lambda: src.read(EXPORT_CHUNK_BYTES), b""):
+            blob.write(data)
+
+
+def _read_blob(conn: sqlite3.Connection, table: str, column: str, rowid: int) -> Iterator[bytes]:
+    if not hasattr(conn, "blobopen"):  # Python < 3.11
+        row = conn.execute(f"SELECT {column} FROM {table} WHERE rowid=?", (rowid,)).fetchone()
+        yield bytes(row[0])
+        return
+    with conn.blobopen(table, column, rowid, readonly=True) as blob:
+        yield from iter(lambda: blob.read(EXPORT_CHUNK_BYTES), b"")
+
+
+def store_export_blob(conn: sqlite3.Connection, csv_file: io.IOBase) -> str:
+    """
+    Store a CSV file in export_blobs unless an identical one is already there; returns its
+    SHA-256. Neither the CSV nor its compressed form is held in memory whole. Caller commits.
+    """
+    csv_file.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    for data in iter(lambda: csv_file.read(EXPORT_CHUNK_BYTES), b""):
+        digest.update(data)
+        size += len(data)
+    sha = digest.hexdigest()
+    if conn.execute("SELECT 1 FROM export_blobs WHERE sha256=?", (sha,)).fetchone():
+        return sha
+
+    csv_file.seek(0)
+    gz = zlib.compressobj(EXPORT_COMPRESS_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as packed:
+        for data in iter(lambda: csv_file.read(EXPORT_CHUNK_BYTES), b""):
+            packed.write(gz.compress(data))
+        packed.write(gz.flush())
+        stored_size = packed.tell()
+        packed.seek(0)
+        cur = conn.execute(
+            "INSERT INTO export_blobs(sha256, codec, size, stored_size, created_at, data) VALUES(?, ?, ?, ?, ?, zeroblob(?))",
+            (sha, EXPORT_BLOB_CODEC, size, stored_size, dt.datetime.utcnow().isoformat(), stored_size),
+        )
+        _write_blob(conn, "export_blobs", "data", int(cur.lastrowid), packed)
+    return sha
+
+
+def insert_export(
+    conn: sqlite3.Connection,
+    batch_id: int,
+    user_id: int,
+    invoice_start_no: int,
+    invoice_count: int,
+    total_amount: float,
+    filename: str,
+    csv_file: io.IOBase,
+) -> int:
+    """Record an export whose CSV sits in a (spooled) file; the CSV goes to export_blobs. Caller commits."""
+    sha = store_export_blob(conn, csv_file)
+    cur = conn.execute(
+        """
+        INSERT INTO exports(batch_id, created_at, created_by_user_id,
+            invoice_start_no, invoice_count, total_amount, filename, csv_blob, blob_sha256)
+        VALUES(?, ?, ?, ?, ?, ?, ?, x'', ?)
+        """,
+        (
+            int(batch_id),
+            dt.datetime.utcnow().isoformat(),
+            int(user_id),
+            int(invoice_start_no),
+            int(invoice_count),
+            float(total_amount),
+            filename,
+            sha,
+        ),
+    )
+    return int(cur.lastrowid)
+
+
+def export_csv_size(conn: sqlite3.Connection, export_id: int) -> int:
+    """Uncompressed CSV size of a stored export."""
+    row = conn.execute(
+        """
+        SELECT COALESCE(eb.size, length(e.csv_blob)) FROM exports e
+        LEFT JOIN export_blobs eb ON eb.sha256 = e.blob_sha256
+        WHERE e.id=?
+        """,
+        (int(export_id),),
+    ).fetchone()
+    return int(row[0]) if row else 0
+
+
+def iter_export_csv(conn: sqlite3.Connection, export_id: int) -> Iterator[bytes]:
+    """A stored export's CSV, decompressed chunk by chunk from export_blobs."""
+    row = conn.execute(
+        """
+        SELECT e.rowid AS export_rowid, eb.rowid AS blob_rowid, eb.codec FROM exports e
+        LEFT JOIN export_blobs eb ON eb.sha256 = e.blob_sha256
+        WHERE e.id=?
+        """,
+        (int(export_id),),
+    ).fetchone()
+    if row is None:
+        return
+    if row["blob_rowid"] is None:
+        yield from _read_blob(conn, "exports", "csv_blob", int(row["export_rowid"]))
+        return
+    if row["codec"] != EXPORT_BLOB_CODEC:
+        raise ValueError(f"Unknown export codec: {row['codec']}")
+    gz = zlib.decompressobj(31)
+    for data in _read_blob(conn, "export_blobs", "data", int(row["blob_rowid"])):
+        out = gz.decompress(data)
+        if out:
+            yield out
+    tail = gz.flush()
+    if tail:
+        yield tail
+
+
+def move_inline_exports(conn: sqlite3.Connection) -> int:
+    """
+    Move CSVs still held inline in exports.csv_blob into export_blobs (migration 7).
+    Runs in the caller's transaction; returns the number of exports moved. The freed pages
+    are reused by later writes; VACUUM returns them to the filesystem.
+    """
+    ids = [r[0] for r in conn.execute("SELECT id FROM exports WHERE blob_sha256 IS NULL ORDER BY id")]
+    for export_id in ids:
+        with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as spool:
+            for data in _read_blob(conn, "exports", "csv_blob", export_id):
+                spool.write(data)
+            sha = store_export_blob(conn, spool)
+        conn.execute("UPDATE exports SET blob_sha256=?, csv_blob=x'' WHERE id=?", (sha, export_id))
+    return len(ids)
+
+
+# =========================
+# Fuzzy customer matching
+# =========================
+# Owner-name tokens that carry no identity ("SMITH JOHN & MARY ET UX")
+FUZZY_STOPWORDS = frozenset({"and", "the", "of", "et", "al", "ux", "etal", "etux", "vir", "etvir"})
+FUZZY_MATCH_THRESHOLD = 0.85  # default; orgs override via the fuzzy_match_threshold setting
+FUZZY_TOKEN_THRESHOLD = 0.6  # bigram dice for a token to count as a spelling variant
+FUZZY_SUBSET_BASE = 0.8  # score floor when a customer's tokens are a subset of the owner's
+FUZZY_SUBSET_MAX_TOKENS = 6  # owner names longer than this skip subset matching
+
+
+def token_sort_key(name: str) -> str:
+    """normalize_name, stopwords dropped, tokens sorted: "SMITH JOHN & MARY" -> "john mary smith"."""
+    tokens = normalize_name(name).replace("-", " ").split()
+    return " ".join(sorted(t for t in tokens if t not in FUZZY_STOPWORDS))
+
+
+def char_ngrams(text: str, n: int) -> frozenset:
+    padded = " " * (n - 1) + text + " "
+    return frozenset(padded[i : i + n] for i in range(len(padded) - n + 1))
+
+
+def _dice(a: frozenset, b: frozenset) -> float:
+    return 2.0 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+
+class FuzzyCustomerIndex:
+    """
+    Token-level inverted index over one org's customers, built once and reused per batch.
+
+    Candidates are blocked, never scanned: each owner token is expanded to the customer
+    vocabulary tokens within FUZZY_TOKEN_THRESHOLD (an n-gram index over the vocabulary,
+    memoized per token), and only customers holding a variant of every owner token are
+    scored (token-sort ratio). Customers whose whole name is a subset of the owner's
+    tokens ("JOHN SMITH" in "SMITH JOHN & MARY") are found by exact key lookups.
+
+    add()/remove() change it in place (views from with_threshold share the same structures
+    and lock). An edited customer keeps its slot; removed slots stay as gaps until copy()
+    compacts them. CustomerMatchIndex updates a copy(), so a running batch keeps its snapshot.
+    """
+
+    def __init__(self, customers: Iterable[dict], threshold: float = FUZZY_MATCH_THRESHOLD):
+        self.threshold = float(threshold)
+        self.customers: List[dict] = []
+        self.keys: List[str] = []
+        self.positions: Dict[int, int] = {}  # customer id -> slot; removed slots stay as gaps
+        self.by_key: Dict[str, int] = {}
+        self.token_postings: Dict[str, set] = {}
+        self.vocab_grams: Dict[str, frozenset] = {}
+        self.gram_index: Dict[str, List[str]] = {}
+        self._variants: Dict[str, Tuple[frozenset, set]] = {}
+        self._lock = threading.RLock()
+        for c in customers:
+            self.add(c)
+
+    def with_threshold(self, threshold: float) -> "FuzzyCustomerIndex":
+        view = copy.copy(self)
+        view.threshold = float(threshold)
+        return view
+
+    def copy(self) -> "FuzzyCustomerIndex":
+        """An independent copy to update; rebuilt without gaps once they outnumber live customers."""
+        with self._lock:
+            if len(self.customers) > 2 * len(self.positions):
+                live = (self.customers[p] for p in sorted(self.positions.values()))
+                return FuzzyCustomerIndex(live, threshold=self.threshold)
+            dup = copy.copy(self)
+            dup.customers = list(self.customers)
+            dup.keys = list(self.keys)
+            dup.positions = dict(self.positions)
+            dup.by_key = dict(self.by_key)
+            dup.token_postings = {tok: set(postings) for tok, postings in self.token_postings.items()}
+            dup.vocab_grams = dict(self.vocab_grams)
+            dup.gram_index = {g: list(toks) for g, toks in self.gram_index.items()}
+            dup._variants = {}
+            dup._lock = threading.RLock()
+            return dup
+
+    def add(self, customer: dict) -> None:
+        with self._lock:
+            key = token_sort_key(customer["name"])
+            pos = self.positions.get(int(customer["id"]))
+            if pos is None:
+                pos = len(self.customers)
+                self.customers.append(customer)
+                self.keys.append(key)
+                self.positions[int(customer["id"])] = pos
+            else:
+                self._unlink(pos)
+                self.customers[pos] = customer
+                self.keys[pos] = key
+            if self.by_key.get(key, pos) >= pos:
+                self.by_key[key] = pos
+            for tok in set(key.split()):
+                postings = self.token_postings.get(tok)
+                if postings is None:
+                    postings = self.token_postings[tok] = set()
+                    grams = self.vocab_grams[tok] = char_ngrams(tok, 2)
+                    for g in grams:
+                        self.gram_index.setdefault(g, []).append(tok)
+                postings.add(pos)
+            self._variants.clear()  # memoized holder sets are copies; drop them
+
+    def remove(self, customer_id: int) -> None:
+        with self._lock:
+            pos = self.positions.pop(int(customer_id), None)
+            if pos is not None:
+                self._unlink(pos)
+
+    def _unlink(self, pos: int) -> None:
+        """Take slot `pos` out of the postings and by_key (caller holds the lock)."""
+        key = self.keys[pos]
+        tokens = set(key.split())
+        for tok in tokens:
+            self.token_postings[tok].discard(pos)
+        if self.by_key.get(key) == pos:
+            del self.by_key[key]
+            same = set.intersection(*(self.token_postings[t] for t in tokens)) if tokens else set()
+            rest = sorted(p for p in same if self.keys[p] == key)
+            if rest:
+                self.by_key[key] = rest[0]
+        self._variants.clear()
+
+    def variants(self, token: str) -> Tuple[frozenset, set]:
+        """(vocabulary tokens spelled like `token`, customers holding any of them)."""
+        with self._lock:
+            return self._variants.get(token) or self._expand(token)
+
+    def _expand(self, token: str) -> Tuple[frozenset, set]:
+        grams = char_ngrams(token, 2)
+        t = FUZZY_TOKEN_THRESHOLD
+        # Prefix filter: a variant shares >= need grams, so it sits in one of the rarest len-need+1 postings
+        need = math.ceil(t * len(grams) / (2 - t))
+        postings = sorted((self.gram_index.get(g, ()) for g in grams), key=len)[: len(grams) - need + 1]
+        lo, hi = len(token) - 2, len(token) + 2
+        near = frozenset(
+            v for v in set().union(*postings) if lo <= len(v) <= hi and _dice(grams, self.vocab_grams[v]) >= t
+        )
+        holders = set().union(*(self.token_postings[v] for v in near)) if near else set()
+        self._variants[token] = (near, holders)
+        return near, holders
+
+    def match(self, key: str) -> Optional[Tuple[dict, float]]:
+        """Best customer for a token_sort_key and its confidence, or None below the threshold."""
+        tokens = key.split()
+        if not tokens:
+            return None
+        best, best_score = -1, 0.0
+
+        expanded = sorted((self.variants(t)[1] for t in tokens), key=len)
+        candidates = expanded[0]
+        for holders in expanded[1:]:
+            if not candidates:
+                break
+            candidates = candidates & holders
+        for pos in candidates:
+            score = SequenceMatcher(None, key, self.keys[pos]).ratio()
+            if score > best_score or (score == best_score and pos < best):
+                best, best_score = pos, score
+
+        n = len(tokens)
+        if 2 <= n <= FUZZY_SUBSET_MAX_TOKENS:
+            for size in range(n, 1, -1):
+                score = FUZZY_SUBSET_BASE + (1.0 - FUZZY_SUBSET_BASE) * size / n
+                if score < best_score:
+                    break
+                for combo in itertools.combinations(tokens, size):
+                    pos = self.by_key.get(" ".join(combo))
+                    if pos is not None and (score > best_score or (score == best_score and pos < best)):
+                        best, best_score = pos, score
+
+        if best < 0 or best_score < self.threshold:
+            return None
+        return self.customers[best], round(best_score, 4)
+
+
+def build_fuzzy_index(customers_by_norm: Dict[str, dict], threshold: float = FUZZY_MATCH_THRESHOLD) -> FuzzyCustomerIndex:
+    return FuzzyCustomerIndex(customers_by_norm.values(), threshold=threshold)
+
+
+def fuzzy_fill(
+    client_names: pd.Series,
+    matched_ids: list,
+    matched_names: list,
+    confidence: list,
+    fuzzy_index: FuzzyCustomerIndex,
+) -> None:
+    """Fill rows left unmatched by the exact pass, in place. Each distinct owner name is matched once."""
+    todo = [i for i, cid in enumerate(matched_ids) if cid is None]
+    if not todo:
+        return
+    names = client_names.iloc[todo]
+    keys = {name: token_sort_key(name) for name in pd.unique(names)}
+    found = {name: fuzzy_index.match(key) for name, key in keys.items()}
+    for i, name in zip(todo, names.tolist()):
+        hit = found[name]
+        if hit is not None:
+            cust, score = hit
+            matched_ids[i] = int(cust["id"])
+            matched_names[i] = str(cust["name"])
+            confidence[i] = score
+
+
+# =========================
+# Customer match index (per org, kept between batch runs)
+# =========================
+CUSTOMER_INDEX_COLUMNS = "id, name, name_norm, email, qb_customer_ref, is_active"
+CUSTOMER_SYNC_CHUNK = 500  # ids per IN (...) lookup, under SQLite's bound-parameter limit
+
+
+class CustomerMatchIndex:
+    """
+    An org's active customers keyed by name_norm, plus a FuzzyCustomerIndex built on first use.
+
+    `version` is the organizations.customers_version it reflects. Triggers bump that column on
+    every customer write, so a copy that missed one (other process, manage.py, raw SQL) is
+    detected and reloaded. by_norm and the fuzzy index are replaced rather than mutated: a
+    batch run keeps the snapshot it started with.
+    """
+
+    def __init__(self, org_id: int, version: int, customers: Iterable[dict]):
+        self.org_id = int(org_id)
+        self.version = int(version)
+        self.by_norm: Dict[str, dict] = {c["name_norm"]: c for c in customers}
+        self._norm_by_id: Dict[int, str] = {int(c["id"]): k for k, c in self.by_norm.items()}
+        self._fuzzy: Optional[FuzzyCustomerIndex] = None
+        self._lock = threading.Lock()
+
+    def fuzzy(self, threshold: float = FUZZY_MATCH_THRESHOLD) -> FuzzyCustomerIndex:
+        with self._lock:
+            if self._fuzzy is None:
+                self._fuzzy = FuzzyCustomerIndex(self.by_norm.values())
+            return self._fuzzy.with_threshold(threshold)
+
+    def apply(self, version: int, changes: int, rows: List[dict]) -> bool:
+        """
+        Fold in the current state of `changes` customer writes (rows: the written customers,
+        inactive ones included). False if the index is not exactly `changes` writes behind.
+        """
+        with self._lock:
+            if self.version + changes != version:
+                return False
+            by_norm, norm_by_id = dict(self.by_norm), dict(self._norm_by_id)
+            fuzzy = self._fuzzy.copy() if self._fuzzy is not None else None
+            for r in rows:
+                old = norm_by_id.pop(int(r["id"]), None)
+                if old is not None:
+                    by_norm.pop(old, None)
+                if fuzzy is not None and not r["is_active"]:
+                    fuzzy.remove(int(r["id"]))
+            # Removals first: a rename may take a name another written row just gave up
+            for r in rows:
+                if r["is_active"]:
+                    by_norm[r["name_norm"]] = r
+                    norm_by_id[int(r["id"])] = r["name_norm"]
+                    if fuzzy is not None:
+                        fuzzy.add(r)
+            self.by_norm, self._norm_by_id, self._fuzzy = by_norm, norm_by_id, fuzzy
+            self.version = int(version)
+            return True
+
+
+_customer_indexes: Dict[int, CustomerMatchIndex] = {}
+_customer_indexes_lock = threading.Lock()
+
+
+def customers_version(conn: sqlite3.Connection, org_id: int) -> int:
+    row = conn.execute("SELECT customers_version FROM organizations WHERE id=?", (int(org_id),)).fetchone()
+    return int(row[0]) if row else 0
+
+
+def customer_match_index(org_id: int, conn: Optional[sqlite3.Connection] = None) -> CustomerMatchIndex:
+    """The org's match index; the customer table is read only when customers_version moved."""
+    own = conn is None
+    conn = conn or db()
+    try:
+        version = customers_version(conn, org_id)
+        with _customer_indexes_lock:
+            cached = _customer_indexes.get(org_id)
+        if cached is not None and cached.version == version:
+            return cached
+        rows = conn.execute(
+            f"SELECT {CUSTOMER_INDEX_COLUMNS} FROM customers WHERE org_id=? AND is_active=1 ORDER BY id",
+            (org_id,),
+        ).fetchall()
+    finally:
+        if own:
+            conn.close()
+    index = CustomerMatchIndex(org_id, version, [dict(r) for r in rows])
+    with _customer_indexes_lock:
+        current = _customer_indexes.get(org_id)
+        if current is None or current.version <= version:
+            _customer_indexes[org_id] = index
+    return index
+
+
+def sync_customer_index(conn: sqlite3.Connection, org_id: int, customer_ids: Iterable[int], changes: Optional[int] = None) -> None:
+    """
+    Update the cached index after committed customer writes. `changes` is the number of rows
+    written (cursor.rowcount; defaults to len(customer_ids)); customer_ids may also hold rows
+    that were not changed. If other writes slipped in between, the cached copy is dropped and
+    the next batch run reloads it.
+    """
+    ids = [int(i) for i in customer_ids]
+    changes = len(ids) if changes is None else int(changes)
+    with _customer_indexes_lock:
+        cached = _customer_indexes.get(org_id)
+    if cached is None or changes <= 0:
+        return
+    version = customers_version(conn, org_id)
+    rows: List[dict] = []
+    for start in range(0, len(ids), CUSTOMER_SYNC_CHUNK):
+        chunk = ids[start : start + CUSTOMER_SYNC_CHUNK]
+        rows.extend(
+            dict(r)
+            for r in conn.execute(
+                # +org_id keeps the planner on the primary key instead of scanning the org's rows
+                f"SELECT {CUSTOMER_INDEX_COLUMNS} FROM customers WHERE +org_id=? AND id IN ({', '.join('?' * len(chunk))})",
+                (org_id, *chunk),
+            )
+        )
+    if not cached.apply(version, changes, rows):
+        with _customer_indexes_lock:
+            if _customer_indexes.get(org_id) is cached:
+                del _customer_indexes[org_id]
+
+
+# =========================
+# Customer import
+# =========================
+CUSTOMER_IMPORT_FIELDS = ["email", "phone", "address1", "city", "state", "zip", "qb_customer_ref"]
+
+
+def customer_import_frame(imp: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+    """
+    Clean a customer CSV (lower-cased headers, must include 'name'): values stripped, blank
+    names dropped, first row kept per normalized name. Returns (frame, rows dropped).
+    """
+    out = pd.DataFrame({"name": imp["name"].fillna("").astype(str).str.strip()}, index=imp.index)
+    for col in CUSTOMER_IMPORT_FIELDS:
+        out[col] = imp[col].fillna("").astype(str).str.strip() if col in imp.columns else ""
+    out = out[out["name"] != ""]
+    out.insert(1, "name_norm", normalize_names(out["name"]))
+    out = out.drop_duplicates("name_norm", keep="first")
+    return out, len(imp) - len(out)
+
+
+def import_customers(conn: sqlite3.Connection, org_id: int, imp: pd.DataFrame, upsert: bool = False) -> Dict[str, int]:
+    """
+    Bulk-insert a customer CSV frame in one transaction. Existing customers (same normalized
+    name) are skipped, or with upsert=True get their non-blank contact fields overwritten.
+    is_active is never changed: a deactivated customer gets its fields updated but stays
+    inactive. Returns {"added", "updated", "skipped"}; updated counts only customers whose
+    fields actually changed, skipped everything else (unchanged, blank names, duplicates).
+    """
+    frame, dropped = customer_import_frame(imp)
+    now = dt.datetime.utcnow().isoformat()
+    cols = ["name", "name_norm", *CUSTOMER_IMPORT_FIELDS]
+    fields = [frame[c].to_numpy(dtype=object).tolist() for c in CUSTOMER_IMPORT_FIELDS]
+    rows = [
+        (org_id, name, norm, *(v or None for v in r), now)
+        for name, norm, *r in zip(frame["name"].tolist(), frame["name_norm"].tolist(), *fields)
+    ]
+    on_conflict = (
+        "DO UPDATE SET "
+        + ", ".join(f"{c}=COALESCE(excluded.{c}, customers.{c})" for c in CUSTOMER_IMPORT_FIELDS)
+        # Rows nothing would change are left alone: no rowcount, no customers_version bump
+        + " WHERE "
+        + " OR ".join(f"COALESCE(excluded.{c}, customers.{c}) IS NOT customers.{c}" for c in CUSTOMER_IMPORT_FIELDS)
+        if upsert
+        else "DO NOTHING"
+    )
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        existing = {
+            r[0]: r[1] for r in conn.execute("SELECT name_norm, id FROM customers WHERE org_id=?", (org_id,))
+        }
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM customers").fetchone()[0]
+        cur = conn.executemany(
+            f"""
+            INSERT INTO customers(org_id, {', '.join(cols)}, is_active, created_at)
+            VALUES(?, {', '.join('?' * len(cols))}, 1, ?)
+            ON CONFLICT(org_id, name_norm) {on_conflict}
+            """,
+            rows,
+        )
+        changes = cur.rowcount
+        added_ids = [r[0] for r in conn.execute("SELECT id FROM customers WHERE +org_id=? AND id>?", (org_id, max_id))]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # changes = inserts + rows the upsert actually changed; the candidates cover both
+    candidate_ids = [existing[k] for k in frame["name_norm"] if k in existing] if upsert else []
+    sync_customer_index(conn, org_id, added_ids + candidate_ids, changes)
+    updated = changes - len(added_ids)
+    return {
+        "added": len(added_ids),
+        "updated": updated,
+        "skipped": dropped + len(frame) - len(added_ids) - updated,
+    }
+
+
+# =========================
+# Batch persistence / streaming pipeline
+# =========================
+BATCH_ROW_COLUMNS = [
+    "batch_id",
+    "row_index",
+    "raw_client_name",
+    "property_id",
+    "notice_value",
+    "final_value",
+    "reduction",
+    "tax_saved",
+    "base_fee",
+    "manual_discount",
+    "final_invoice",
+    "status",
+    "matched_customer_id",
+    "matched_customer_name",
+    "match_confidence",
+]
+
+
+def read_county_header(source, filename: str, sheet: Optional[str] = None) -> List[str]:
+    """Column names of a county sheet without loading its rows (XLSX: `sheet`, default the active one)."""
+    if filename.lower().endswith(".csv"):
+        cols = list(pd.read_csv(source, nrows=0).columns)
+    else:
+        cols = _xlsx_header(source, sheet)
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return [str(c) for c in cols]
+
+
+def iter_county_chunks(
+    source,
+    filename: str,
+    usecols: Optional[List[str]] = None,
+    text_cols: Optional[List[str]] = None,
+    chunksize: int = BATCH_CHUNK_ROWS,
+    sheet: Optional[str] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Yield a county sheet (CSV or XLSX) as DataFrames of at most `chunksize` rows.
+    Only `usecols` are kept; `text_cols` are read as strings so IDs are parsed the same
+    way in every chunk regardless of what the other chunks contain.
+    """
+    usecols = list(dict.fromkeys(usecols)) if usecols else None
+    if filename.lower().endswith(".csv"):
+        dtype = {c: str for c in (text_cols or [])}
+        yield from pd.read_csv(source, usecols=usecols, dtype=dtype, chunksize=int(chunksize))
+        return
+
+    for frame in _iter_xlsx_frames(source, chunksize=int(chunksize), sheet=sheet, usecols=usecols):
+        for c in text_cols or []:
+            if c in frame.columns:
+                frame[c] = frame[c].map(_xlsx_cell_text)
+        yield frame
+
+
+def read_county_frame(
+    source,
+    filename: str,
+    usecols: List[str],
+    text_cols: Optional[List[str]] = None,
+    sheet: Optional[str] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> pd.DataFrame:
+    """A whole county sheet restricted to `usecols`, read chunk by chunk (progress gets rows read so far)."""
+    frames = []
+    rows_done = 0
+    for frame in iter_county_chunks(source, filename, usecols=usecols, text_cols=text_cols, sheet=sheet):
+        frames.append(frame)
+        rows_done += len(frame)
+        if progress:
+            progress(rows_done)
+    if hasattr(source, "seek"):
+        source.seek(0)
+    if not frames:
+        return pd.DataFrame(columns=list(dict.fromkeys(usecols)))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _xlsx_cell_text(v) -> object:
+    if v is None:
+        return np.nan
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+
+def _xlsx_header_names(header_row) -> List[str]:
+    return [str(h) if h is not None else f"Unnamed: {i}" for i, h in enumerate(header_row or ())]
+
+
+def _xlsx_sheet(wb, sheet: Optional[str]):
+    if sheet is None:
+        return wb.active
+    if sheet not in wb.sheetnames:
+        raise ValueError(f"Sheet not found: {sheet}")
+    return wb[sheet]
+
+
+def xlsx_sheet_names(source) -> List[str]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(source, read_only=True)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+        if hasattr(source, "seek"):
+            source.seek(0)
+
+
+def xlsx_data_rows(source, sheet: Optional[str] = None) -> Optional[int]:
+    """Data rows (excluding the header) from the sheet's stored dimension; None if the file has none."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(source, read_only=True)
+    try:
+        max_row = _xlsx_sheet(wb, sheet).max_row
+        return max(int(max_row) - 1, 0) if max_row else None
+    finally:
+        wb.close()
+        if hasattr(source, "seek"):
+            source.seek(0)
+
+
+def _xlsx_header(source, sheet: Optional[str] = None) -> List[str]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        return _xlsx_header_names(next(_xlsx_sheet(wb, sheet).iter_rows(max_row=1, values_only=True), None))
+    finally:
+        wb.close()
+
+
+def _iter_xlsx_frames(
+    source, chunksize: int, sheet: Optional[str] = None, usecols: Optional[List[str]] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream a sheet in read-only mode. With usecols only those cells are kept (and nothing
+    right of the last one is read); rows whose kept cells are all empty are skipped.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        ws = _xlsx_sheet(wb, sheet)
+        header = _xlsx_header_names(next(ws.iter_rows(max_row=1, values_only=True), None))
+        columns = usecols or header
+        missing = [c for c in columns if c not in header]
+        if missing:
+            raise ValueError(f"Columns not found in sheet: {', '.join(missing)}")
+        positions = [header.index(c) for c in columns]
+        rows = ws.iter_rows(min_row=2, max_col=max(positions, default=0) + 1, values_only=True)
+        buf: list = []
+        for r in rows:
+            picked = tuple(r[i] if i < len(r) else None for i in positions)
+            if all(v is None for v in picked):
+                continue
+            buf.append(picked)
+            if len(buf) >= chunksize:
+                yield pd.DataFrame.from_records(buf, columns=columns)
+                buf = []
+        if buf:
+            yield pd.DataFrame.from_records(buf, columns=columns)
+    finally:
+        wb.close()
+
+
+def summarize_batch_df(df_calc: pd.DataFrame) -> Dict[str, float]:
+    """Headline totals for a computed batch (or one chunk of it)."""
+    final_invoice = df_calc[CANON["final_invoice"]]
+    return {
+        "rows": int(len(df_calc)),
+        "total_tax_saved": float(df_calc[CANON["tax_saved"]].sum()),
+        "total_base_fee": float(df_calc[CANON["base_fee"]].sum()),
+        "total_invoice": float(final_invoice.sum()),
+        "review_count": int((df_calc[CANON["status"]] == "REVIEW").sum()),
+        "no_charge_count": int((final_invoice <= 0).sum()),
+        "billable_count": int((final_invoice > 0).sum()),
+        "matched_count": int(df_calc[CANON["matched_customer_id"]].notna().sum()),
+        "fuzzy_matched_count": int((df_calc[CANON["match_confidence"]] < 1.0).sum()),
+        "unparseable_count": int(df_calc[CANON["money_error"]].sum()),
+    }
+
+
+def empty_batch_totals() -> Dict[str, float]:
+    return {
+        "rows": 0,
+        "total_tax_saved": 0.0,
+        "total_base_fee": 0.0,
+        "total_invoice": 0.0,
+        "review_count": 0,
+        "no_charge_count": 0,
+        "billable_count": 0,
+        "matched_count": 0,
+        "fuzzy_matched_count": 0,
+        "unparseable_count": 0,
+    }
+
+
+def add_batch_totals(totals: Dict[str, float], chunk: Dict[str, float]) -> Dict[str, float]:
+    return {k: totals.get(k, 0) + v for k, v in chunk.items()}
+
+
+def insert_batch(
+    cur: sqlite3.Cursor,
+    org_id: int,
+    user_id: int,
+    source_filename: str,
+    tax_rate_pct: float,
+    contingency_pct: float,
+    flat_fee: float,
+    review_min_tax_saved: float,
+    charge_flat_if_no_win: bool,
+    invoice_date: str,
+    days_due: int,
+    qb_item_name: str,
+    qb_desc_prefix: str,
+    notes: Optional[str],
+) -> int:
+    cur.execute(
+        """
+        INSERT INTO batches(
+            org_id, created_by_user_id, created_at,
+            source_filename, tax_rate_pct, contingency_pct, flat_fee,
+            review_min_tax_saved, charge_flat_if_no_win,
+            invoice_date, days_due, qb_item_name, qb_desc_prefix, notes
+        )
+        VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            org_id,
+            user_id,
+            dt.datetime.utcnow().isoformat(),
+            source_filename,
+            float(tax_rate_pct),
+            float(contingency_pct),
+            float(flat_fee),
+            float(review_min_tax_saved),
+            1 if charge_flat_if_no_win else 0,
+            invoice_date,
+            int(days_due),
+            (qb_item_name or "").strip() or "Property Tax Protest",
+            (qb_desc_prefix or "").strip() or "Tax savings",
+            (notes or "").strip() or None,
+        ),
+    )
+    return int(cur.lastrowid)
+
+
+# batch_rows column -> CANON column of a computed batch frame
+BATCH_ROW_SOURCE = {
+    "row_index": CANON["row_id"],
+    "raw_client_name": CANON["client_name"],
+    "property_id": CANON["property_id"],
+    "notice_value": CANON["notice_value"],
+    "final_value": CANON["final_value"],
+    "reduction": CANON["reduction"],
+    "tax_saved": CANON["tax_saved"],
+    "base_fee": CANON["base_fee"],
+    "manual_discount": CANON["manual_discount"],
+    "final_invoice": CANON["final_invoice"],
+    "status": CANON["status"],
+    "matched_customer_id": CANON["matched_customer_id"],
+    "matched_customer_name": CANON["matched_customer_name"],
+    "match_confidence": CANON["match_confidence"],
+}
+
+_BATCH_ROW_FLOATS = ["notice_value", "final_value", "reduction", "tax_saved", "base_fee", "manual_discount", "final_invoice"]
+
+# Rows bound per executemany call; keeps the Python-side parameter lists bounded
+BATCH_WRITE_ROWS = 50_000
+
+
+def _nullable_ints(s: pd.Series) -> list:
+    return s.astype("Float64").astype("Int64").astype(object).where(s.notna(), None).tolist()
+
+
+def _nullable_strs(s: pd.Series) -> list:
+    return s.astype(object).where(s.notna(), None).tolist()
 
 
-def guess_column(cols: list[str], keywords: list[str]) -> str:
-    lower = {c: c.lower() for c in cols}
-    for c in cols:
-        if any(k in lower[c] for k in keywords):
-            return c
-    return cols[0] if cols else ""
+def _nullable_floats(s: pd.Series) -> list:
+    return s.astype(float).astype(object).where(s.notna(), None).tolist()
 
 
-def compute_batch_df(
-    df_raw: pd.DataFrame,
+def batch_row_params(batch_id: int, df: pd.DataFrame, source: Optional[Dict[str, str]] = None) -> Iterator[tuple]:
+    """
+    Parameter tuples for INSERT INTO batch_rows, built column-at-a-time from `df`.
+    `source` maps batch_rows columns to df columns (defaults to the CANON names
+    produced by compute_batch_df).
+    """
+    source = source or BATCH_ROW_SOURCE
+    cols = [
+        _nullable_ints(df[source["row_index"]]),
+        df[source["raw_client_name"]].astype(str).tolist(),
+        df[source["property_id"]].astype(str).tolist(),
+        *[df[source[c]].astype(float).tolist() for c in _BATCH_ROW_FLOATS],
+        df[source["status"]].astype(str).tolist(),
+        _nullable_ints(df[source["matched_customer_id"]]),
+        _nullable_strs(df[source["matched_customer_name"]]),
+        _nullable_floats(df[source["match_confidence"]]) if source.get("match_confidence") in df else [None] * len(df),
+    ]
+    return zip(itertools.repeat(int(batch_id)), *cols)
+
+
+@contextmanager
+def bulk_write_pragmas(conn: sqlite3.Connection) -> Iterator[None]:
+    """Larger page cache and in-memory temp storage for the duration of a bulk write."""
+    prev_cache = conn.execute("PRAGMA cache_size").fetchone()[0]
+    prev_temp = conn.execute("PRAGMA temp_store").fetchone()[0]
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    try:
+        yield
+    finally:
+        conn.execute(f"PRAGMA cache_size={int(prev_cache)}")
+        conn.execute(f"PRAGMA temp_store={int(prev_temp)}")
+
+
+def write_batch_rows(
+    cur: sqlite3.Cursor,
+    batch_id: int,
+    df: pd.DataFrame,
+    source: Optional[Dict[str, str]] = None,
+) -> int:
+    """
+    Bulk-insert batch rows with executemany, BATCH_WRITE_ROWS at a time.
+    Runs inside the caller's transaction; the caller commits. Returns rows written.
+    """
+    sql = f"INSERT INTO batch_rows({', '.join(BATCH_ROW_COLUMNS)}) VALUES({', '.join('?' * len(BATCH_ROW_COLUMNS))})"
+    with bulk_write_pragmas(cur.connection):
+        for start in range(0, len(df), BATCH_WRITE_ROWS):
+            cur.executemany(sql, batch_row_params(batch_id, df.iloc[start : start + BATCH_WRITE_ROWS], source))
+    return int(len(df))
+
+
+def run_batch_chunked(
+    source,
+    source_filename: str,
+    org_id: int,
+    user_id: int,
     col_owner: str,
     col_propid: str,
     col_notice: str,
@@ -380,96 +2431,232 @@ def compute_batch_df(
     flat_fee: float,
     review_min_tax_saved: float,
     charge_flat_if_no_win: bool,
+    invoice_date: str,
+    days_due: int,
+    qb_item_name: str,
+    qb_desc_prefix: str,
+    notes: Optional[str],
     customers_by_norm: Dict[str, dict],
-) -> pd.DataFrame:
-    df = df_raw.copy().reset_index(drop=True)
-    df[CANON["row_id"]] = df.index.astype(int)
-
-    df[CANON["client_name"]] = df[col_owner].astype(str).fillna("").str.strip()
-    df[CANON["property_id"]] = df[col_propid].astype(str).fillna("").str.strip()
-
-    df[CANON["notice_value"]] = to_money(df[col_notice])
-    df[CANON["final_value"]] = to_money(df[col_final])
-
-    df[CANON["reduction"]] = (df[CANON["notice_value"]] - df[CANON["final_value"]]).clip(lower=0.0)
-    tax_rate = tax_rate_pct / 100.0
-    df[CANON["tax_saved"]] = (df[CANON["reduction"]] * tax_rate).clip(lower=0.0)
+    chunksize: int = BATCH_CHUNK_ROWS,
+    progress: Optional[Callable[[int], None]] = None,
+    fuzzy_index: Optional[FuzzyCustomerIndex] = None,
+    sheet: Optional[str] = None,
+    profiler: Optional[StageProfiler] = None,
+) -> Tuple[int, Dict[str, float]]:
+    """
+    Read a county sheet in fixed-size chunks, compute each chunk with compute_batch_df
+    and append it to batch_rows, keeping only running totals in memory.
+    The whole batch is written in one transaction. Returns (batch_id, totals).
+    A profiler also gets "read" (parsing chunks) and "write" (batch_rows inserts).
+    """
+    stage = profiler.stage if profiler is not None else _no_stage
+    conn = db()
+    try:
+        cur = conn.cursor()
+        batch_id = insert_batch(
+            cur,
+            org_id=org_id,
+            user_id=user_id,
+            source_filename=source_filename,
+            tax_rate_pct=tax_rate_pct,
+            contingency_pct=contingency_pct,
+            flat_fee=flat_fee,
+            review_min_tax_saved=review_min_tax_saved,
+            charge_flat_if_no_win=charge_flat_if_no_win,
+            invoice_date=invoice_date,
+            days_due=days_due,
+            qb_item_name=qb_item_name,
+            qb_desc_prefix=qb_desc_prefix,
+            notes=notes,
+        )
 
-    df[CANON["base_fee"]] = 0.0
-    wins = df[CANON["tax_saved"]] > 0
-    df.loc[wins, CANON["base_fee"]] = (df.loc[wins, CANON["tax_saved"]] * (contingency_pct / 100.0)) + float(flat_fee)
-    if charge_flat_if_no_win:
-        df.loc[~wins, CANON["base_fee"]] = float(flat_fee)
+        totals = empty_batch_totals()
+        chunks = iter_county_chunks(
+            source,
+            source_filename,
+            usecols=[col_owner, col_propid, col_notice, col_final],
+            text_cols=[col_owner, col_propid],
+            chunksize=chunksize,
+            sheet=sheet,
+        )
+        while True:
+            with stage("read") as info:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    info["skip"] = True  # the end-of-file probe is not a chunk read
+                else:
+                    info["rows"] = len(chunk)
+            if chunk is None:
+                break
+            df_calc = compute_batch_df(
+                df_raw=chunk,
+                col_owner=col_owner,
+                col_propid=col_propid,
+                col_notice=col_notice,
+                col_final=col_final,
+                tax_rate_pct=float(tax_rate_pct),
+                contingency_pct=float(contingency_pct),
+                flat_fee=float(flat_fee),
+                review_min_tax_saved=float(review_min_tax_saved),
+                charge_flat_if_no_win=bool(charge_flat_if_no_win),
+                customers_by_norm=customers_by_norm,
+                row_offset=int(totals["rows"]),
+                fuzzy_index=fuzzy_index,
+                profiler=profiler,
+            )
+            with stage("write", len(df_calc)):
+                write_batch_rows(cur, batch_id, df_calc)
+            totals = add_batch_totals(totals, summarize_batch_df(df_calc))
+            del df_calc
+            if progress:
+                progress(int(totals["rows"]))
+
+        set_batch_stats(
+            conn,
+            batch_id,
+            totals["rows"],
+            totals["billable_count"],
+            totals["total_invoice"],
+            totals["total_tax_saved"],
+            totals["review_count"],
+        )
+        conn.commit()
+        return batch_id, totals
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
-    df[CANON["manual_discount"]] = 0.0
-    df[CANON["final_invoice"]] = (df[CANON["base_fee"]] - df[CANON["manual_discount"]]).clip(lower=0.0)
 
-    def status(ts: float) -> str:
-        if ts <= 0:
-            return "NO_CHARGE"
-        if ts < review_min_tax_saved:
-            return "REVIEW"
-        return "STANDARD"
+# =========================
+# Batch row cache (Arrow IPC files beside the database)
+# =========================
+# SQLite stays the source of truth. A file is only used while its stamp matches the batch's
+# created_at and rows_version, so a discount patch (refresh_batch_stats) retires it.
+BATCH_CACHE_DIR = os.environ.get("APP_BATCH_CACHE_DIR", "")
 
-    df[CANON["status"]] = df[CANON["tax_saved"]].apply(status)
 
-    # Customer matching (exact normalized name match)
-    matched_ids = []
-    matched_names = []
-    for raw_name in df[CANON["client_name"]].tolist():
-        key = normalize_name(raw_name)
-        cust = customers_by_norm.get(key)
-        if cust:
-            matched_ids.append(int(cust["id"]))
-            matched_names.append(str(cust["name"]))
-        else:
-            matched_ids.append(None)
-            matched_names.append(None)
+def batch_cache_path(batch_id: int) -> str:
+    base = BATCH_CACHE_DIR or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "batch_cache")
+    db_name = os.path.splitext(os.path.basename(DB_PATH))[0]
+    return os.path.join(base, f"{db_name}-{int(batch_id)}.arrow")
 
-    df[CANON["matched_customer_id"]] = matched_ids
-    df[CANON["matched_customer_name"]] = matched_names
 
+def _read_batch_cache(path: str, stamp: str) -> Optional[pd.DataFrame]:
+    try:
+        with pa.memory_map(path) as source:
+            table = pa_ipc.open_file(source).read_all()
+    except (OSError, pa.ArrowException):
+        return None
+    if (table.schema.metadata or {}).get(b"stamp") != stamp.encode():
+        return None
+    # Numeric columns without nulls stay backed by the mapped file
+    return table.to_pandas(split_blocks=True)
+
+
+def _write_batch_cache(path: str, stamp: str, df: pd.DataFrame) -> None:
+    """Write atomically; a batch that can't be cached just keeps loading from SQLite."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata({"stamp": stamp})
+        with pa.OSFile(tmp, "wb") as sink, pa_ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+    except (OSError, pa.ArrowException):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def load_batch_rows(conn: sqlite3.Connection, batch_id: int) -> pd.DataFrame:
+    """
+    All batch_rows of a batch ordered by (row_index, id) as a DataFrame. With pyarrow, served
+    from a memory-mapped Arrow file while it is current, else read once and cached.
+    """
+    b = conn.execute("SELECT created_at, rows_version FROM batches WHERE id=?", (int(batch_id),)).fetchone()
+    if not b:
+        return pd.DataFrame()
+    stamp = f"{b['created_at']}#{b['rows_version']}"
+    path = batch_cache_path(batch_id)
+    if pa is not None:
+        cached = _read_batch_cache(path, stamp)
+        if cached is not None:
+            return cached
+
+    cur = conn.execute("SELECT * FROM batch_rows WHERE batch_id=? ORDER BY row_index, id", (int(batch_id),))
+    columns = [d[0] for d in cur.description]
+    df = pd.DataFrame.from_records([tuple(r) for r in cur.fetchall()], columns=columns)
+    if pa is not None and not df.empty:
+        _write_batch_cache(path, stamp, df)
     return df
 
 
-def qb_export_csv(
-    billable_df: pd.DataFrame,
-    invoice_start_no: int,
-    invoice_date: dt.date,
-    days_due: int,
-    qb_item_name: str,
-    qb_desc_prefix: str,
-) -> Tuple[pd.DataFrame, bytes]:
-    due_date = invoice_date + dt.timedelta(days=int(days_due))
-
-    out = billable_df.copy().reset_index(drop=True)
-    out["InvoiceNo"] = range(invoice_start_no, invoice_start_no + len(out))
-
-    customer_name = out[CANON["matched_customer_name"]].fillna(out[CANON["client_name"]]).astype(str)
-
-    item_desc = (
-        qb_desc_prefix
-        + ": $"
-        + out[CANON["tax_saved"]].round(2).astype(str)
-        + " | Prop: "
-        + out[CANON["property_id"]].astype(str)
-    )
-
-    qb = pd.DataFrame(
-        {
-            "InvoiceNo": out["InvoiceNo"],
-            "Customer": customer_name,
-            "InvoiceDate": invoice_date.strftime("%m/%d/%Y"),
-            "DueDate": due_date.strftime("%m/%d/%Y"),
-            "Item(Product/Service)": qb_item_name,
-            "ItemDescription": item_desc,
-            "ItemQuantity": 1,
-            "ItemRate": out[CANON["final_invoice"]].round(2),
-            "ItemAmount": out[CANON["final_invoice"]].round(2),
-        }
-    )
-    csv_bytes = qb.to_csv(index=False).encode("utf-8")
-    return qb, csv_bytes
+# =========================
+# Upload cache (Run Batch reruns)
+# =========================
+# Streamlit reruns page_run_batch on every widget change; parsed and computed frames are
+# kept here, keyed by file content, so a discount edit doesn't reparse the sheet.
+UPLOAD_CACHE_BYTES = int(os.environ.get("APP_UPLOAD_CACHE_MB", "512")) * 1024 * 1024
+
+
+class FrameCache:
+    """Thread-safe LRU of DataFrames bounded by their total in-memory size. Cached frames are shared: don't mutate them."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self.nbytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._frames: "OrderedDict[tuple, Tuple[pd.DataFrame, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[pd.DataFrame]:
+        with self._lock:
+            hit = self._frames.get(key)
+            if hit is None:
+                self.stats["misses"] += 1
+                return None
+            self._frames.move_to_end(key)
+            self.stats["hits"] += 1
+            return hit[0]
+
+    def put(self, key: tuple, df: pd.DataFrame) -> pd.DataFrame:
+        """Store df (unless it alone exceeds the cap), evicting least recently used frames. Returns df."""
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return df
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self._frames[key] = (df, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._frames.popitem(last=False)
+                self.nbytes -= evicted
+                self.stats["evictions"] += 1
+        return df
+
+
+_upload_cache = FrameCache(UPLOAD_CACHE_BYTES)
+
+
+def upload_digest(up) -> str:
+    """SHA-256 of an uploaded file, hashed once per upload (memoized on Streamlit's file_id)."""
+    memo = st.session_state.setdefault("_upload_digests", {})
+    file_id = getattr(up, "file_id", None)
+    if file_id is not None and file_id in memo:
+        return memo[file_id]
+    h = hashlib.sha256()
+    up.seek(0)
+    for block in iter(lambda: up.read(1024 * 1024), b""):
+        h.update(block)
+    up.seek(0)
+    digest = h.hexdigest()
+    if file_id is not None:
+        memo.clear()  # one upload widget; older uploads are gone
+        memo[file_id] = digest
+    return digest
 
 
 # =========================
@@ -533,16 +2720,7 @@ def sidebar_nav(u: SessionUser) -> str:
 
 
 def fetch_customers_by_norm(org_id: int) -> Dict[str, dict]:
-    conn = db()
-    rows = conn.execute(
-        "SELECT id, name, name_norm, email, qb_customer_ref, is_active FROM customers WHERE org_id=? AND is_active=1",
-        (org_id,),
-    ).fetchall()
-    conn.close()
-    out: Dict[str, dict] = {}
-    for r in rows:
-        out[r["name_norm"]] = dict(r)
-    return out
+    return customer_match_index(org_id).by_norm
 
 
 def page_customers(u: SessionUser) -> None:
@@ -575,6 +2753,31 @@ def page_customers(u: SessionUser) -> None:
     df = pd.DataFrame([dict(r) for r in rows]) if rows else pd.DataFrame(columns=["id", "name", "email", "phone", "city", "state", "zip", "qb_customer_ref", "is_active", "created_at"])
     st.dataframe(df, use_container_width=True, hide_index=True)
 
+    if not df.empty:
+        c1, c2 = st.columns([3, 1])
+        with c1:
+            pick = st.selectbox(
+                "Customer",
+                df["id"].tolist(),
+                format_func=lambda cid: f"#{cid} {df.loc[df['id'] == cid, 'name'].iloc[0]}",
+                key="cust_toggle",
+            )
+        active = bool(df.loc[df["id"] == pick, "is_active"].iloc[0])
+        with c2:
+            st.write("")
+            if st.button("Deactivate" if active else "Reactivate"):
+                conn = db()
+                try:
+                    cur = conn.execute(
+                        "UPDATE customers SET is_active=? WHERE org_id=? AND id=?",
+                        (0 if active else 1, u.org_id, int(pick)),
+                    )
+                    conn.commit()
+                    sync_customer_index(conn, u.org_id, [int(pick)], cur.rowcount)
+                finally:
+                    conn.close()
+                st.rerun()
+
     st.divider()
     st.subheader("Add customer")
 
@@ -597,7 +2800,7 @@ def page_customers(u: SessionUser) -> None:
         else:
             conn = db()
             try:
-                conn.execute(
+                cur = conn.execute(
                     """
                     INSERT INTO customers(org_id, name, name_norm, email, phone, address1, city, state, zip, qb_customer_ref, is_active, created_at)
                     VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
@@ -617,6 +2820,7 @@ def page_customers(u: SessionUser) -> None:
                     ),
                 )
                 conn.commit()
+                sync_customer_index(conn, u.org_id, [cur.lastrowid])
                 st.success("Customer added.")
                 st.rerun()
             except sqlite3.IntegrityError:
@@ -630,48 +2834,24 @@ def page_customers(u: SessionUser) -> None:
 
     st.caption("CSV columns supported: name, email, phone, address1, city, state, zip, qb_customer_ref")
     up = st.file_uploader("Upload CSV", type=["csv"], key="cust_import")
+    upsert = st.checkbox("Update contact fields of existing customers", value=False)
     if up and st.button("Import CSV", type="primary"):
         try:
-            imp = pd.read_csv(up)
+            imp = pd.read_csv(up, dtype=str)
             imp.columns = [c.strip().lower() for c in imp.columns]
             if "name" not in imp.columns:
                 st.error("CSV must include a 'name' column.")
                 return
 
             conn = db()
-            added = 0
-            skipped = 0
-            for _, r in imp.iterrows():
-                nm = str(r.get("name", "")).strip()
-                if not nm:
-                    continue
-                try:
-                    conn.execute(
-                        """
-                        INSERT INTO customers(org_id, name, name_norm, email, phone, address1, city, state, zip, qb_customer_ref, is_active, created_at)
-                        VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
-                        """,
-                        (
-                            u.org_id,
-                            nm,
-                            normalize_name(nm),
-                            (str(r.get("email", "")).strip() or None),
-                            (str(r.get("phone", "")).strip() or None),
-                            (str(r.get("address1", "")).strip() or None),
-                            (str(r.get("city", "")).strip() or None),
-                            (str(r.get("state", "")).strip() or None),
-                            (str(r.get("zip", "")).strip() or None),
-                            (str(r.get("qb_customer_ref", "")).strip() or None),
-                            dt.datetime.utcnow().isoformat(),
-                        ),
-                    )
-                    added += 1
-                except sqlite3.IntegrityError:
-                    skipped += 1
-            conn.commit()
-            conn.close()
+            try:
+                counts = import_customers(conn, u.org_id, imp, upsert=upsert)
+            finally:
+                conn.close()
 
-            st.success(f"Import complete. Added={added}, skipped(duplicates)={skipped}.")
+            st.success(
+                f"Import complete. Added={counts['added']}, updated={counts['updated']}, skipped(duplicates)={counts['skipped']}."
+            )
             st.rerun()
         except Exception as e:
             st.error(f"Import failed: {e}")
@@ -680,15 +2860,18 @@ def page_customers(u: SessionUser) -> None:
 def page_settings(u: SessionUser) -> None:
     st.header("Settings")
 
-    tax_rate_pct = float(get_setting(u.org_id, "tax_rate_pct", "2.500000"))
-    contingency_pct = float(get_setting(u.org_id, "contingency_pct", "25"))
-    flat_fee = float(get_setting(u.org_id, "flat_fee", "150"))
-    review_min_tax_saved = float(get_setting(u.org_id, "review_min_tax_saved", "700"))
-    charge_flat_if_no_win = int(get_setting(u.org_id, "charge_flat_if_no_win", "0"))
-    days_due = int(get_setting(u.org_id, "days_due", "30"))
-    qb_item_name = get_setting(u.org_id, "qb_item_name", "Property Tax Protest")
-    qb_desc_prefix = get_setting(u.org_id, "qb_desc_prefix", "Tax savings")
-    next_invoice_no = int(get_setting(u.org_id, "next_invoice_no", "1001"))
+    cfg = get_settings(u.org_id)
+    tax_rate_pct = float(cfg["tax_rate_pct"])
+    contingency_pct = float(cfg["contingency_pct"])
+    flat_fee = float(cfg["flat_fee"])
+    review_min_tax_saved = float(cfg["review_min_tax_saved"])
+    charge_flat_if_no_win = int(cfg["charge_flat_if_no_win"])
+    days_due = int(cfg["days_due"])
+    qb_item_name = cfg["qb_item_name"]
+    qb_desc_prefix = cfg["qb_desc_prefix"]
+    next_invoice_no = int(cfg["next_invoice_no"])
+    fuzzy_match = bool(int(cfg["fuzzy_match"]))
+    fuzzy_match_threshold = float(cfg["fuzzy_match_threshold"])
 
     c1, c2, c3 = st.columns(3)
     with c1:
@@ -704,16 +2887,29 @@ def page_settings(u: SessionUser) -> None:
         qb_desc_prefix = st.text_input("QuickBooks description prefix", value=qb_desc_prefix)
         next_invoice_no = st.number_input("Next invoice number", value=next_invoice_no, step=1)
 
+    st.subheader("Customer matching")
+    fuzzy_match = st.checkbox("Fuzzy-match owner names to customers by default", value=fuzzy_match)
+    fuzzy_match_threshold = st.slider(
+        "Fuzzy match threshold", min_value=0.5, max_value=1.0, value=fuzzy_match_threshold, step=0.01
+    )
+
     if st.button("Save settings", type="primary"):
-        set_setting(u.org_id, "tax_rate_pct", f"{tax_rate_pct:.6f}")
-        set_setting(u.org_id, "contingency_pct", str(int(contingency_pct)))
-        set_setting(u.org_id, "flat_fee", str(float(flat_fee)))
-        set_setting(u.org_id, "review_min_tax_saved", str(float(review_min_tax_saved)))
-        set_setting(u.org_id, "charge_flat_if_no_win", "1" if charge_flat_if_no_win else "0")
-        set_setting(u.org_id, "days_due", str(int(days_due)))
-        set_setting(u.org_id, "qb_item_name", qb_item_name.strip() or "Property Tax Protest")
-        set_setting(u.org_id, "qb_desc_prefix", qb_desc_prefix.strip() or "Tax savings")
-        set_setting(u.org_id, "next_invoice_no", str(int(next_invoice_no)))
+        set_settings(
+            u.org_id,
+            {
+                "tax_rate_pct": f"{tax_rate_pct:.6f}",
+                "contingency_pct": str(int(contingency_pct)),
+                "flat_fee": str(float(flat_fee)),
+                "review_min_tax_saved": str(float(review_min_tax_saved)),
+                "charge_flat_if_no_win": "1" if charge_flat_if_no_win else "0",
+                "days_due": str(int(days_due)),
+                "qb_item_name": qb_item_name.strip() or "Property Tax Protest",
+                "qb_desc_prefix": qb_desc_prefix.strip() or "Tax savings",
+                "next_invoice_no": str(int(next_invoice_no)),
+                "fuzzy_match": "1" if fuzzy_match else "0",
+                "fuzzy_match_threshold": f"{float(fuzzy_match_threshold):.2f}",
+            },
+        )
         st.success("Saved.")
         st.rerun()
 
@@ -762,18 +2958,173 @@ def page_users(u: SessionUser) -> None:
             conn.close()
 
 
+def map_columns_ui(cols: List[str]) -> Tuple[str, str, str, str]:
+    st.subheader("Map columns")
+    guess_owner = guess_column(cols, ["owner", "name", "taxpayer", "client"])
+    guess_propid = guess_column(cols, ["prop", "property", "id", "account", "pid"])
+    guess_notice = guess_column(cols, ["notice", "initial", "appraised", "market", "value"])
+    guess_final = guess_column(cols, ["final", "certified", "settled", "value"])
+
+    m1, m2, m3, m4 = st.columns(4)
+    with m1:
+        col_owner = st.selectbox("Owner/Client column", cols, index=cols.index(guess_owner) if guess_owner in cols else 0)
+    with m2:
+        col_propid = st.selectbox("Property ID column", cols, index=cols.index(guess_propid) if guess_propid in cols else 0)
+    with m3:
+        col_notice = st.selectbox("Notice/Initial value column", cols, index=cols.index(guess_notice) if guess_notice in cols else 0)
+    with m4:
+        col_final = st.selectbox("Final value column", cols, index=cols.index(guess_final) if guess_final in cols else 0)
+    return col_owner, col_propid, col_notice, col_final
+
+
+def show_batch_summary(totals: Dict[str, float]) -> None:
+    total_clients = int(totals["rows"])
+    matched_count = int(totals["matched_count"])
+
+    a, b, c, d, e = st.columns(5)
+    a.metric("Rows", total_clients)
+    b.metric("Total Tax Saved", f"${totals['total_tax_saved']:,.2f}")
+    c.metric("Total Calculated Fees", f"${totals['total_base_fee']:,.2f}")
+    d.metric("Review", int(totals["review_count"]))
+    e.metric("Matched Customers", matched_count)
+
+    st.caption(f"Rows with zero invoice: {int(totals['no_charge_count'])}. Unmatched customers: {total_clients - matched_count}.")
+    if int(totals.get("fuzzy_matched_count", 0)):
+        st.caption(f"Fuzzy matches (check Match Confidence): {int(totals['fuzzy_matched_count'])}.")
+    if int(totals.get("unparseable_count", 0)):
+        st.warning(
+            f"{int(totals['unparseable_count'])} rows have a notice or final value that is not a number; "
+            "those values were counted as $0."
+        )
+
+
+def show_stage_timings(report: dict) -> None:
+    """StageProfiler.report() as an expandable table."""
+    with st.expander(f"Stage timings ({report['total_seconds']:.2f}s)"):
+        frame = pd.DataFrame(report["stages"])
+        frame["peak_mb"] = pd.to_numeric(frame["peak_bytes"]) / (1024 * 1024)
+        st.dataframe(
+            frame[["stage", "seconds", "rows", "rows_per_s", "peak_mb", "calls", "cached"]],
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "seconds": st.column_config.NumberColumn("Seconds", format="%.3f"),
+                "rows_per_s": st.column_config.NumberColumn("Rows/s", format="%.0f"),
+                "peak_mb": st.column_config.NumberColumn("Peak MB", format="%.1f"),
+            },
+        )
+        st.caption(
+            "Cached stages were reused from an earlier run of this upload. Peak MB is tracemalloc's peak per stage; "
+            "it is left empty while another run is measuring memory."
+        )
+
+
+def county_progress(up, sheet: Optional[str], bar, label: str) -> Callable[[int], None]:
+    """Progress callback for reading an upload: XLSX uses the sheet's stored row count, CSV the file position."""
+    is_csv = up.name.lower().endswith(".csv")
+    size = getattr(up, "size", 0) or 0
+    total = None if is_csv else xlsx_data_rows(up, sheet)
+
+    def on_progress(rows_done: int) -> None:
+        if total:
+            frac = rows_done / total
+        else:
+            # CSV row count is unknown up front; file position gives a close enough fraction
+            frac = up.tell() / size if is_csv and size else 0.0
+        bar.progress(min(frac, 1.0), text=f"{label} {rows_done:,} rows")
+
+    return on_progress
+
+
+def run_batch_streaming_section(
+    u: SessionUser,
+    up,
+    tax_rate_pct: float,
+    contingency_pct: float,
+    flat_fee: float,
+    review_min_tax_saved: float,
+    charge_flat_if_no_win: bool,
+    invoice_date: dt.date,
+    days_due: int,
+    qb_item_name: str,
+    qb_desc_prefix: str,
+    fuzzy_threshold: Optional[float] = None,
+    sheet: Optional[str] = None,
+    profile: bool = False,
+) -> None:
+    try:
+        cols = read_county_header(up, up.name, sheet)
+    except Exception as e:
+        st.error(f"Failed to read file: {e}")
+        return
+    if not cols:
+        st.error("No columns detected.")
+        return
+
+    col_owner, col_propid, col_notice, col_final = map_columns_ui(cols)
+    notes = st.text_input("Batch notes (optional)", key="stream_batch_notes")
+
+    if st.button("Process and save batch", type="primary"):
+        bar = st.progress(0.0, text="Processing...")
+        on_progress = county_progress(up, sheet, bar, "Processed")
+        profiler = StageProfiler() if profile else None
+        try:
+            match_index = customer_match_index(u.org_id)
+            customers_by_norm = match_index.by_norm
+            fuzzy_index = match_index.fuzzy(fuzzy_threshold) if fuzzy_threshold is not None else None
+            batch_id, totals = run_batch_chunked(
+                up,
+                up.name,
+                org_id=u.org_id,
+                user_id=u.user_id,
+                col_owner=col_owner,
+                col_propid=col_propid,
+                col_notice=col_notice,
+                col_final=col_final,
+                tax_rate_pct=tax_rate_pct,
+                contingency_pct=contingency_pct,
+                flat_fee=flat_fee,
+                review_min_tax_saved=review_min_tax_saved,
+                charge_flat_if_no_win=charge_flat_if_no_win,
+                invoice_date=invoice_date.isoformat(),
+                days_due=days_due,
+                qb_item_name=qb_item_name,
+                qb_desc_prefix=qb_desc_prefix,
+                notes=notes,
+                customers_by_norm=customers_by_norm,
+                progress=on_progress,
+                fuzzy_index=fuzzy_index,
+                sheet=sheet,
+                profiler=profiler,
+            )
+        except Exception as e:
+            st.error(f"Batch failed: {e}")
+            return
+        finally:
+            report = profiler.report() if profiler is not None else None
+
+        bar.progress(1.0, text=f"Processed {int(totals['rows']):,} rows")
+        st.session_state["active_batch_id"] = batch_id
+        st.success(f"Saved batch #{batch_id}. Open it from the Batches page to edit discounts and export.")
+        show_batch_summary(totals)
+        if report is not None:
+            show_stage_timings(report)
+
+
 def page_run_batch(u: SessionUser) -> None:
     st.header("Run Batch")
 
     # Load org settings defaults
-    tax_rate_pct = float(get_setting(u.org_id, "tax_rate_pct", "2.500000"))
-    contingency_pct = float(get_setting(u.org_id, "contingency_pct", "25"))
-    flat_fee = float(get_setting(u.org_id, "flat_fee", "150"))
-    review_min_tax_saved = float(get_setting(u.org_id, "review_min_tax_saved", "700"))
-    charge_flat_if_no_win = bool(int(get_setting(u.org_id, "charge_flat_if_no_win", "0")))
-    days_due = int(get_setting(u.org_id, "days_due", "30"))
-    qb_item_name = get_setting(u.org_id, "qb_item_name", "Property Tax Protest")
-    qb_desc_prefix = get_setting(u.org_id, "qb_desc_prefix", "Tax savings")
+    cfg = get_settings(u.org_id)
+    tax_rate_pct = float(cfg["tax_rate_pct"])
+    contingency_pct = float(cfg["contingency_pct"])
+    flat_fee = float(cfg["flat_fee"])
+    review_min_tax_saved = float(cfg["review_min_tax_saved"])
+    charge_flat_if_no_win = bool(int(cfg["charge_flat_if_no_win"]))
+    days_due = int(cfg["days_due"])
+    qb_item_name = cfg["qb_item_name"]
+    qb_desc_prefix = cfg["qb_desc_prefix"]
+    fuzzy_match = bool(int(cfg["fuzzy_match"]))
 
     st.subheader("Batch parameters")
     c1, c2, c3 = st.columns(3)
@@ -789,6 +3140,13 @@ def page_run_batch(u: SessionUser) -> None:
         days_due = st.number_input("Days due", value=days_due, step=1)
         qb_item_name = st.text_input("QB item name", value=qb_item_name)
         qb_desc_prefix = st.text_input("QB description prefix", value=qb_desc_prefix)
+        fuzzy_match = st.checkbox("Fuzzy-match owner names", value=fuzzy_match)
+        profile = st.checkbox(
+            "Profile engine stages",
+            value=False,
+            help="Time and peak memory per stage. Memory tracing makes the run 2-3x slower.",
+        )
+    fuzzy_threshold = float(cfg["fuzzy_match_threshold"]) if fuzzy_match else None
 
     st.divider()
     st.subheader("Upload county sheet")
@@ -798,74 +3156,116 @@ def page_run_batch(u: SessionUser) -> None:
         st.info("Upload a file to continue.")
         return
 
-    # Load file
+    is_csv = up.name.lower().endswith(".csv")
+    sheet = None
+    if not is_csv:
+        try:
+            sheets = xlsx_sheet_names(up)
+        except Exception as e:
+            st.error(f"Failed to read file: {e}")
+            return
+        if len(sheets) > 1:
+            sheet = st.selectbox("Sheet", sheets)
+
+    stream_to_db = st.checkbox(
+        "Large file: stream straight into a saved batch (skips preview and discount editing)",
+        value=False,
+    )
+    if stream_to_db:
+        run_batch_streaming_section(
+            u,
+            up,
+            tax_rate_pct=float(tax_rate_pct),
+            contingency_pct=float(contingency_pct),
+            flat_fee=float(flat_fee),
+            review_min_tax_saved=float(review_min_tax_saved),
+            charge_flat_if_no_win=bool(charge_flat_if_no_win),
+            invoice_date=invoice_date,
+            days_due=int(days_due),
+            qb_item_name=qb_item_name,
+            qb_desc_prefix=qb_desc_prefix,
+            fuzzy_threshold=fuzzy_threshold,
+            sheet=sheet,
+            profile=profile,
+        )
+        return
+
     try:
-        if up.name.lower().endswith(".csv"):
-            df_raw = pd.read_csv(up)
-        else:
-            df_raw = pd.read_excel(up)
+        cols = read_county_header(up, up.name, sheet)
     except Exception as e:
         st.error(f"Failed to read file: {e}")
         return
-
-    if df_raw.empty:
-        st.error("The uploaded file contains 0 rows.")
-        return
-
-    cols = list(df_raw.columns)
     if not cols:
         st.error("No columns detected.")
         return
 
-    st.subheader("Map columns")
-    guess_owner = guess_column(cols, ["owner", "name", "taxpayer", "client"])
-    guess_propid = guess_column(cols, ["prop", "property", "id", "account", "pid"])
-    guess_notice = guess_column(cols, ["notice", "initial", "appraised", "market", "value"])
-    guess_final = guess_column(cols, ["final", "certified", "settled", "value"])
+    col_owner, col_propid, col_notice, col_final = map_columns_ui(cols)
 
-    m1, m2, m3, m4 = st.columns(4)
-    with m1:
-        col_owner = st.selectbox("Owner/Client column", cols, index=cols.index(guess_owner) if guess_owner in cols else 0)
-    with m2:
-        col_propid = st.selectbox("Property ID column", cols, index=cols.index(guess_propid) if guess_propid in cols else 0)
-    with m3:
-        col_notice = st.selectbox("Notice/Initial value column", cols, index=cols.index(guess_notice) if guess_notice in cols else 0)
-    with m4:
-        col_final = st.selectbox("Final value column", cols, index=cols.index(guess_final) if guess_final in cols else 0)
+    # Load only the mapped columns, parsed once per distinct content/sheet/mapping
+    usecols = [col_owner, col_propid, col_notice, col_final]
+    raw_key = ("raw", upload_digest(up), is_csv, sheet, *usecols)
+    df_raw = _upload_cache.get(raw_key)
+    if df_raw is None:
+        bar = st.progress(0.0, text="Reading file...")
+        try:
+            df_raw = read_county_frame(
+                up,
+                up.name,
+                usecols,
+                text_cols=[col_owner, col_propid],
+                sheet=sheet,
+                progress=county_progress(up, sheet, bar, "Read"),
+            )
+        except Exception as e:
+            st.error(f"Failed to read file: {e}")
+            return
+        bar.empty()
+        _upload_cache.put(raw_key, df_raw)
 
-    customers_by_norm = fetch_customers_by_norm(u.org_id)
-
-    df_calc = compute_batch_df(
-        df_raw=df_raw,
-        col_owner=col_owner,
-        col_propid=col_propid,
-        col_notice=col_notice,
-        col_final=col_final,
-        tax_rate_pct=float(tax_rate_pct),
-        contingency_pct=float(contingency_pct),
-        flat_fee=float(flat_fee),
-        review_min_tax_saved=float(review_min_tax_saved),
-        charge_flat_if_no_win=bool(charge_flat_if_no_win),
-        customers_by_norm=customers_by_norm,
-    )
+    if df_raw.empty:
+        st.error("The uploaded file contains 0 rows.")
+        return
+
+    # Stages are cached per upload: a fee tweak recomputes fees/status only, not parsing or matching
+    match_index = customer_match_index(u.org_id)
+    profiler = StageProfiler() if profile else None
+    try:
+        df_calc = compute_batch_stages(
+            df_raw,
+            dict(
+                col_owner=col_owner,
+                col_propid=col_propid,
+                col_notice=col_notice,
+                col_final=col_final,
+                tax_rate_pct=float(tax_rate_pct),
+                contingency_pct=float(contingency_pct),
+                flat_fee=float(flat_fee),
+                review_min_tax_saved=float(review_min_tax_saved),
+                charge_flat_if_no_win=bool(charge_flat_if_no_win),
+                customers_by_norm=match_index.by_norm,
+                fuzzy_index=match_index.fuzzy(fuzzy_threshold) if fuzzy_threshold is not None else None,
+                match_key=(u.org_id, match_index.version, fuzzy_threshold),
+            ),
+            cache=_upload_cache,
+            source_key=raw_key,
+            profiler=profiler,
+        )
+    finally:
+        report = profiler.report() if profiler is not None else None
 
     st.divider()
     st.subheader("Summary")
-    total_clients = len(df_calc)
-    total_tax_saved = float(df_calc[CANON["tax_saved"]].sum())
-    total_base = float(df_calc[CANON["base_fee"]].sum())
-    review_count = int((df_calc[CANON["status"]] == "REVIEW").sum())
-    no_charge_count = int((df_calc[CANON["final_invoice"]] <= 0).sum())
-    matched_count = int(df_calc[CANON["matched_customer_id"]].notna().sum())
-
-    a, b, c, d, e = st.columns(5)
-    a.metric("Rows", total_clients)
-    b.metric("Total Tax Saved", f"${total_tax_saved:,.2f}")
-    c.metric("Total Calculated Fees", f"${total_base:,.2f}")
-    d.metric("Review", review_count)
-    e.metric("Matched Customers", matched_count)
-
-    st.caption(f"Rows with zero invoice: {no_charge_count}. Unmatched customers: {total_clients - matched_count}.")
+    show_batch_summary(summarize_batch_df(df_calc))
+    bad_money = df_calc[df_calc[CANON["money_error"]]]
+    if not bad_money.empty:
+        with st.expander(f"Unparseable values ({len(bad_money)} rows)"):
+            st.dataframe(
+                bad_money[[CANON["row_id"], CANON["client_name"], col_notice, col_final]],
+                use_container_width=True,
+                hide_index=True,
+            )
+    if report is not None:
+        show_stage_timings(report)
 
     st.divider()
     st.subheader("Review and edit discounts")
@@ -881,6 +3281,7 @@ def page_run_batch(u: SessionUser) -> None:
             CANON["final_invoice"],
             CANON["status"],
             CANON["matched_customer_name"],
+            CANON["match_confidence"],
         ]
     ].copy()
 
@@ -897,6 +3298,7 @@ def page_run_batch(u: SessionUser) -> None:
             CANON["base_fee"],
             CANON["status"],
             CANON["matched_customer_name"],
+            CANON["match_confidence"],
             CANON["final_invoice"],
         ],
         column_config={
@@ -908,6 +3310,7 @@ def page_run_batch(u: SessionUser) -> None:
             CANON["final_invoice"]: st.column_config.NumberColumn("Final Invoice", format="$%.2f"),
             CANON["status"]: st.column_config.TextColumn("Status"),
             CANON["matched_customer_name"]: st.column_config.TextColumn("Matched Customer"),
+            CANON["match_confidence"]: st.column_config.NumberColumn("Match Confidence", format="%.2f"),
         },
     )
 
@@ -938,65 +3341,24 @@ def page_run_batch(u: SessionUser) -> None:
         if st.button("Save batch to database", type="primary"):
             conn = db()
             cur = conn.cursor()
-            cur.execute(
-                """
-                INSERT INTO batches(
-                    org_id, created_by_user_id, created_at,
-                    source_filename, tax_rate_pct, contingency_pct, flat_fee,
-                    review_min_tax_saved, charge_flat_if_no_win,
-                    invoice_date, days_due, qb_item_name, qb_desc_prefix, notes
-                )
-                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    u.org_id,
-                    u.user_id,
-                    dt.datetime.utcnow().isoformat(),
-                    up.name,
-                    float(tax_rate_pct),
-                    float(contingency_pct),
-                    float(flat_fee),
-                    float(review_min_tax_saved),
-                    1 if charge_flat_if_no_win else 0,
-                    invoice_date.isoformat(),
-                    int(days_due),
-                    qb_item_name.strip() or "Property Tax Protest",
-                    qb_desc_prefix.strip() or "Tax savings",
-                    notes.strip() or None,
-                ),
+            batch_id = insert_batch(
+                cur,
+                org_id=u.org_id,
+                user_id=u.user_id,
+                source_filename=up.name,
+                tax_rate_pct=float(tax_rate_pct),
+                contingency_pct=float(contingency_pct),
+                flat_fee=float(flat_fee),
+                review_min_tax_saved=float(review_min_tax_saved),
+                charge_flat_if_no_win=bool(charge_flat_if_no_win),
+                invoice_date=invoice_date.isoformat(),
+                days_due=int(days_due),
+                qb_item_name=qb_item_name,
+                qb_desc_prefix=qb_desc_prefix,
+                notes=notes,
             )
-            batch_id = cur.lastrowid
-
-            # Insert rows
-            for _, r in df_calc.iterrows():
-                cur.execute(
-                    """
-                    INSERT INTO batch_rows(
-                        batch_id, row_index,
-                        raw_client_name, property_id,
-                        notice_value, final_value, reduction, tax_saved,
-                        base_fee, manual_discount, final_invoice,
-                        status, matched_customer_id, matched_customer_name
-                    )
-                    VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        batch_id,
-                        int(r[CANON["row_id"]]),
-                        str(r[CANON["client_name"]]),
-                        str(r[CANON["property_id"]]),
-                        float(r[CANON["notice_value"]]),
-                        float(r[CANON["final_value"]]),
-                        float(r[CANON["reduction"]]),
-                        float(r[CANON["tax_saved"]]),
-                        float(r[CANON["base_fee"]]),
-                        float(r[CANON["manual_discount"]]),
-                        float(r[CANON["final_invoice"]]),
-                        str(r[CANON["status"]]),
-                        int(r[CANON["matched_customer_id"]]) if pd.notna(r[CANON["matched_customer_id"]]) else None,
-                        str(r[CANON["matched_customer_name"]]) if pd.notna(r[CANON["matched_customer_name"]]) else None,
-                    ),
-                )
+            write_batch_rows(cur, batch_id, df_calc)
+            refresh_batch_stats(conn, batch_id)
 
             conn.commit()
             conn.close()
@@ -1015,8 +3377,8 @@ def page_run_batch(u: SessionUser) -> None:
     if st.session_state.get("active_batch_id"):
         batch_id = int(st.session_state["active_batch_id"])
 
-        # Pull next invoice number from settings
-        next_inv = int(get_setting(u.org_id, "next_invoice_no", "1001"))
+        # Pull next invoice number from settings (uncached: numbering must never repeat)
+        next_inv = int(get_settings(u.org_id, use_cache=False)["next_invoice_no"])
         qb_df, csv_bytes = qb_export_csv(
             billable_df=billable,
             invoice_start_no=next_inv,
@@ -1038,30 +3400,21 @@ def page_run_batch(u: SessionUser) -> None:
 
         if st.button("Store export in database and increment invoice numbers"):
             conn = db()
-            conn.execute(
-                """
-                INSERT INTO exports(
-                    batch_id, created_at, created_by_user_id,
-                    invoice_start_no, invoice_count, total_amount,
-                    filename, csv_blob
-                )
-                VALUES(?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    batch_id,
-                    dt.datetime.utcnow().isoformat(),
-                    u.user_id,
-                    next_inv,
-                    int(len(qb_df)),
-                    float(billable[CANON["final_invoice"]].sum()),
-                    filename,
-                    sqlite3.Binary(csv_bytes),
-                ),
+            insert_export(
+                conn,
+                batch_id=batch_id,
+                user_id=u.user_id,
+                invoice_start_no=next_inv,
+                invoice_count=int(len(qb_df)),
+                total_amount=float(billable[CANON["final_invoice"]].sum()),
+                filename=filename,
+                csv_file=io.BytesIO(csv_bytes),
             )
             # Increment invoice number
-            set_setting(u.org_id, "next_invoice_no", str(next_inv + int(len(qb_df))))
+            set_setting(u.org_id, "next_invoice_no", str(next_inv + int(len(qb_df))), conn=conn)
             conn.commit()
             conn.close()
+            invalidate_settings_cache(u.org_id)
             st.success("Export stored and next invoice number updated.")
             st.rerun()
 
@@ -1076,9 +3429,7 @@ def page_batches(u: SessionUser) -> None:
     batches = conn.execute(
         """
         SELECT b.id, b.created_at, b.source_filename, b.invoice_date, b.tax_rate_pct, b.contingency_pct, b.flat_fee,
-               (SELECT COUNT(*) FROM batch_rows br WHERE br.batch_id=b.id) AS row_count,
-               (SELECT COUNT(*) FROM batch_rows br WHERE br.batch_id=b.id AND br.final_invoice > 0) AS billable_count,
-               (SELECT COALESCE(SUM(br.final_invoice), 0) FROM batch_rows br WHERE br.batch_id=b.id) AS total_invoice
+               b.row_count, b.billable_count, b.total_invoice
         FROM batches b
         WHERE b.org_id=?
         ORDER BY b.id DESC
@@ -1104,19 +3455,10 @@ def page_batches(u: SessionUser) -> None:
         st.error("Batch not found in your organization.")
         return
 
-    rows = conn.execute(
-        """
-        SELECT * FROM batch_rows
-        WHERE batch_id=?
-        ORDER BY row_index
-        """,
-        (int(batch_id),),
-    ).fetchall()
-
     st.subheader(f"Batch #{batch_id}")
     st.caption(f"Source: {b['source_filename']} | Created: {b['created_at']} | Invoice date: {b['invoice_date']}")
 
-    dfr = pd.DataFrame([dict(r) for r in rows]) if rows else pd.DataFrame()
+    dfr = load_batch_rows(conn, int(batch_id))
     if dfr.empty:
         st.info("No rows in this batch.")
         conn.close()
@@ -1134,6 +3476,7 @@ def page_batches(u: SessionUser) -> None:
             "final_invoice",
             "status",
             "matched_customer_name",
+            "match_confidence",
         ]
     ].copy()
 
@@ -1143,7 +3486,17 @@ def page_batches(u: SessionUser) -> None:
         hide_index=True,
         use_container_width=True,
         height=520,
-        disabled=["id", "raw_client_name", "property_id", "tax_saved", "base_fee", "status", "matched_customer_name", "final_invoice"],
+        disabled=[
+            "id",
+            "raw_client_name",
+            "property_id",
+            "tax_saved",
+            "base_fee",
+            "status",
+            "matched_customer_name",
+            "match_confidence",
+            "final_invoice",
+        ],
         column_config={
             "raw_client_name": st.column_config.TextColumn("Client Name"),
             "property_id": st.column_config.TextColumn("Property ID"),
@@ -1153,6 +3506,7 @@ def page_batches(u: SessionUser) -> None:
             "final_invoice": st.column_config.NumberColumn("Final Invoice", format="$%.2f"),
             "status": st.column_config.TextColumn("Status"),
             "matched_customer_name": st.column_config.TextColumn("Matched Customer"),
+            "match_confidence": st.column_config.NumberColumn("Match Confidence", format="%.2f"),
         },
     )
 
@@ -1161,12 +3515,16 @@ def page_batches(u: SessionUser) -> None:
     edited["final_invoice"] = (edited["base_fee"] - edited["manual_discount"]).clip(lower=0.0)
 
     if st.button("Save discount changes"):
-        cur = conn.cursor()
-        for _, r in edited.iterrows():
-            cur.execute(
-                "UPDATE batch_rows SET manual_discount=?, final_invoice=? WHERE id=?",
-                (float(r["manual_discount"]), float(r["final_invoice"]), int(r["id"])),
-            )
+        conn.executemany(
+            "UPDATE batch_rows SET manual_discount=?, final_invoice=? WHERE id=? AND batch_id=?",
+            zip(
+                edited["manual_discount"].astype(float).tolist(),
+                edited["final_invoice"].astype(float).tolist(),
+                edited["id"].astype(int).tolist(),
+                itertools.repeat(int(batch_id)),
+            ),
+        )
+        refresh_batch_stats(conn, int(batch_id))
         conn.commit()
         st.success("Saved.")
         st.rerun()
@@ -1176,7 +3534,7 @@ def page_batches(u: SessionUser) -> None:
     st.write(f"Billable invoices: {len(billable)}")
     st.write(f"Billable total: ${float(billable['final_invoice'].sum()):,.2f}")
 
-    next_inv = int(get_setting(u.org_id, "next_invoice_no", "1001"))
+    next_inv = int(get_settings(u.org_id, conn=conn, use_cache=False)["next_invoice_no"])
     invoice_date = dt.date.fromisoformat(b["invoice_date"])
     days_due = int(b["days_due"])
     qb_item_name = b["qb_item_name"]
@@ -1213,28 +3571,19 @@ def page_batches(u: SessionUser) -> None:
     )
 
     if st.button("Store export and increment invoice numbers", key="store_export_from_batches"):
-        conn.execute(
-            """
-            INSERT INTO exports(
-                batch_id, created_at, created_by_user_id,
-                invoice_start_no, invoice_count, total_amount,
-                filename, csv_blob
-            )
-            VALUES(?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                int(batch_id),
-                dt.datetime.utcnow().isoformat(),
-                u.user_id,
-                next_inv,
-                int(len(qb_df)),
-                float(tmp[CANON["final_invoice"]].sum()),
-                filename,
-                sqlite3.Binary(csv_bytes),
-            ),
+        insert_export(
+            conn,
+            batch_id=int(batch_id),
+            user_id=u.user_id,
+            invoice_start_no=next_inv,
+            invoice_count=int(len(qb_df)),
+            total_amount=float(tmp[CANON["final_invoice"]].sum()),
+            filename=filename,
+            csv_file=io.BytesIO(csv_bytes),
         )
-        set_setting(u.org_id, "next_invoice_no", str(next_inv + int(len(qb_df))))
+        set_setting(u.org_id, "next_invoice_no", str(next_inv + int(len(qb_df))), conn=conn)
         conn.commit()
+        invalidate_settings_cache(u.org_id)
         st.success("Export stored and invoice numbers incremented.")
         st.rerun()
 
@@ -1250,11 +3599,11 @@ def page_batches(u: SessionUser) -> None:
         st.dataframe(dfe, use_container_width=True, hide_index=True)
 
         export_id = st.number_input("Download stored export ID", min_value=1, value=int(dfe.iloc[0]["id"]), step=1)
-        exp = conn.execute("SELECT filename, csv_blob FROM exports WHERE id=? AND batch_id=?", (int(export_id), int(batch_id))).fetchone()
+        exp = conn.execute("SELECT id, filename FROM exports WHERE id=? AND batch_id=?", (int(export_id), int(batch_id))).fetchone()
         if exp:
             st.download_button(
                 "Download stored export",
-                data=bytes(exp["csv_blob"]),
+                data=b"".join(iter_export_csv(conn, exp["id"])),
                 file_name=exp["filename"],
                 mime="text/csv",
             )
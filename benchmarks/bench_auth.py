@@ -0,0 +1,71 @@
+"""
+Benchmark per-request auth overhead: jwt.decode on every call vs the verified-token cache.
+Run: python benchmarks/bench_auth.py --calls 20000 --requests 2000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def per_call_us(fn, token: str, calls: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        fn(token)
+    return (time.perf_counter() - t0) / calls * 1e6
+
+
+def per_request_us(client, headers: dict, requests: int) -> float:
+    client.get("/api/settings", headers=headers)
+    t0 = time.perf_counter()
+    for _ in range(requests):
+        client.get("/api/settings", headers=headers)
+    return (time.perf_counter() - t0) / requests * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--calls", type=int, default=20_000, help="direct decode/verify calls")
+    ap.add_argument("--requests", type=int, default=2_000, help="GET /api/settings round trips")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.DB_PATH = os.path.join(tmp, "bench.db")
+        import api  # noqa: E402  (init_db runs on import, after DB_PATH is set)
+        from fastapi.testclient import TestClient
+
+        ok, msg = app.create_org_with_admin("Bench Org", "bench@example.com", "bench-pass")
+        assert ok, msg
+        ok, user, msg = app.authenticate("Bench Org", "bench@example.com", "bench-pass")
+        token = api.encode_token(user)
+        headers = {"Authorization": f"Bearer {token}"}
+
+        uncached = per_call_us(api.decode_token, token, args.calls)
+        cached = per_call_us(api.verify_token, token, args.calls)
+        print(f"{'get_current_user path':<28}  {'us/call':>10}")
+        print(f"{'jwt.decode + SessionUser':<28}  {uncached:>10.1f}")
+        print(f"{'verified-token cache hit':<28}  {cached:>10.1f}")
+
+        client = TestClient(api.app)
+        with_cache = per_request_us(client, headers, args.requests)
+        size = api.TOKEN_CACHE_SIZE
+        api.TOKEN_CACHE_SIZE = 0
+        without_cache = per_request_us(client, headers, args.requests)
+        api.TOKEN_CACHE_SIZE = size
+        print()
+        print(f"{'GET /api/settings':<28}  {'us/request':>10}")
+        print(f"{'token cache off':<28}  {without_cache:>10.1f}")
+        print(f"{'token cache on':<28}  {with_cache:>10.1f}")
+        print(f"{'auth saving per request':<28}  {without_cache - with_cache:>10.1f}")
+        app.close_db_pool()
+
+
+if __name__ == "__main__":
+    main()
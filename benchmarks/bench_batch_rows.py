@@ -0,0 +1,105 @@
+"""
+Benchmark batch_rows persistence: bulk write_batch_rows vs the old per-row iterrows insert.
+Run: python benchmarks/bench_batch_rows.py --sizes 10000 100000 1000000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from app import CANON  # noqa: E402
+
+
+def synthetic_batch(n: int, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    notice = rng.integers(50_000, 900_000, n).astype(float)
+    final = notice - rng.integers(0, 60_000, n)
+    reduction = np.clip(notice - final, 0, None)
+    tax_saved = reduction * 0.025
+    base_fee = np.where(tax_saved > 0, tax_saved * 0.25 + 150.0, 0.0)
+    matched = rng.random(n) < 0.6
+    return pd.DataFrame(
+        {
+            CANON["row_id"]: np.arange(n),
+            CANON["client_name"]: [f"OWNER {i % 5000}" for i in range(n)],
+            CANON["property_id"]: [f"R{i:08d}" for i in range(n)],
+            CANON["notice_value"]: notice,
+            CANON["final_value"]: final,
+            CANON["reduction"]: reduction,
+            CANON["tax_saved"]: tax_saved,
+            CANON["base_fee"]: base_fee,
+            CANON["manual_discount"]: 0.0,
+            CANON["final_invoice"]: base_fee,
+            CANON["status"]: np.where(tax_saved <= 0, "NO_CHARGE", np.where(tax_saved < 700, "REVIEW", "STANDARD")),
+            CANON["matched_customer_id"]: np.where(matched, rng.integers(1, 5000, n), np.nan),
+            CANON["matched_customer_name"]: np.where(matched, "Customer", None),
+        }
+    )
+
+
+def legacy_insert(cur, batch_id: int, df_calc: pd.DataFrame) -> None:
+    for _, r in df_calc.iterrows():
+        cur.execute(
+            f"INSERT INTO batch_rows({', '.join(app.BATCH_ROW_COLUMNS)}) VALUES({', '.join('?' * len(app.BATCH_ROW_COLUMNS))})",
+            (
+                batch_id,
+                int(r[CANON["row_id"]]),
+                str(r[CANON["client_name"]]),
+                str(r[CANON["property_id"]]),
+                float(r[CANON["notice_value"]]),
+                float(r[CANON["final_value"]]),
+                float(r[CANON["reduction"]]),
+                float(r[CANON["tax_saved"]]),
+                float(r[CANON["base_fee"]]),
+                float(r[CANON["manual_discount"]]),
+                float(r[CANON["final_invoice"]]),
+                str(r[CANON["status"]]),
+                int(r[CANON["matched_customer_id"]]) if pd.notna(r[CANON["matched_customer_id"]]) else None,
+                str(r[CANON["matched_customer_name"]]) if pd.notna(r[CANON["matched_customer_name"]]) else None,
+                None,
+            ),
+        )
+
+
+def time_insert(writer, df: pd.DataFrame) -> float:
+    conn = app.db()
+    try:
+        cur = conn.cursor()
+        t0 = time.perf_counter()
+        writer(cur, 1, df)
+        conn.commit()
+        return time.perf_counter() - t0
+    finally:
+        conn.close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--legacy-max", type=int, default=100_000, help="skip the iterrows baseline above this many rows")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.DB_PATH = os.path.join(tmp, "bench.db")
+        app.init_db()
+
+        print(f"{'rows':>10}  {'bulk rows/s':>14}  {'iterrows rows/s':>16}")
+        for n in args.sizes:
+            df = synthetic_batch(n)
+            bulk = time_insert(app.write_batch_rows, df)
+            legacy = time_insert(legacy_insert, df) if n <= args.legacy_max else None
+            legacy_txt = f"{n / legacy:>16,.0f}" if legacy else f"{'skipped':>16}"
+            print(f"{n:>10,}  {n / bulk:>14,.0f}  {legacy_txt}")
+
+
+if __name__ == "__main__":
+    main()
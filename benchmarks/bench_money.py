@@ -0,0 +1,67 @@
+"""
+Benchmark money parsing: parse_money (factorized, memoized) vs the old three-pass regex to_money.
+Run: python benchmarks/bench_money.py --sizes 100000 1000000 --distinct 5000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def legacy_to_money(series: pd.Series) -> pd.Series:
+    s = series.astype(str).str.strip()
+    s = s.str.replace(r"[\$,]", "", regex=True)
+    s = s.str.replace(r"^\((.*)\)$", r"-\1", regex=True)
+    return pd.to_numeric(s, errors="coerce").fillna(0.0)
+
+
+def synthetic_money(n: int, distinct: int, seed: int = 7) -> pd.Series:
+    """County-style formatted values: `distinct` amounts repeated, a few negatives and blanks."""
+    rng = np.random.default_rng(seed)
+    amounts = rng.integers(50_000, 900_000, distinct) * 10
+    pool = [f"(${a:,.2f})" if i % 50 == 0 else f"${a:,.2f}" for i, a in enumerate(amounts)] + [""]
+    return pd.Series(np.array(pool, dtype=object)[rng.integers(0, len(pool), n)])
+
+
+def best_of(fn, series: pd.Series, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        app._money_value.cache_clear()
+        t0 = time.perf_counter()
+        fn(series)
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    ap.add_argument("--distinct", type=int, default=5_000, help="distinct formatted values per column")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    print(f"{'rows':>10}  {'kind':>8}  {'legacy s':>9}  {'parse_money s':>13}  {'speedup':>8}")
+    for n in args.sizes:
+        text = synthetic_money(n, args.distinct)
+        numeric = legacy_to_money(text)
+        for kind, series in (("text", text), ("numeric", numeric)):
+            expected = legacy_to_money(series).to_numpy()
+            got = app.parse_money(series)[0].to_numpy()
+            if not np.array_equal(expected, got):
+                raise SystemExit(f"parse_money disagrees with the legacy parser ({kind}, {n} rows)")
+            legacy = best_of(legacy_to_money, series, args.repeat)
+            fast = best_of(app.parse_money, series, args.repeat)
+            print(f"{n:>10,}  {kind:>8}  {legacy:>9.3f}  {fast:>13.3f}  {legacy / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Benchmark suite: the money parser, the batch engine, QB export, batch persistence and the main
+api.py endpoints on seeded synthetic county sheets (benchmarks/synthetic.py), written as JSON so
+runs can be compared.
+Run: python benchmarks/run_suite.py --sizes 1000 100000 1000000 --out bench.json
+     python benchmarks/run_suite.py --sizes 1000 100000 --compare bench.json
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+from app import CANON  # noqa: E402
+import synthetic  # noqa: E402
+
+FEES = dict(tax_rate_pct=2.5, contingency_pct=25.0, flat_fee=150.0, review_min_tax_saved=700.0, charge_flat_if_no_win=False)
+INVOICE = dict(invoice_date="2026-01-31", days_due=30, qb_item_name="Property Tax Protest", qb_desc_prefix="Tax savings")
+
+
+class Suite:
+    """Times cases and collects them as JSON-ready records."""
+
+    def __init__(self, repeat: int, only: Optional[List[str]] = None):
+        self.repeat = repeat
+        self.only = only
+        self.results: List[dict] = []
+
+    def wanted(self, case: str) -> bool:
+        return not self.only or any(case.startswith(o) for o in self.only)
+
+    def time(
+        self,
+        case: str,
+        rows: int,
+        fn: Callable[[], object],
+        setup: Optional[Callable[[], None]] = None,
+        throughput: bool = True,
+    ):
+        """
+        Run fn `repeat` times (setup untimed before each); records min/median and returns fn's
+        last result. throughput=False marks cases whose cost should not scale with rows
+        (point reads on a batch of that size), so no rows/s is reported for them.
+        """
+        if not self.wanted(case):
+            return None
+        runs = []
+        result = None
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            t0 = time.perf_counter()
+            result = fn()
+            runs.append(time.perf_counter() - t0)
+        best = min(runs)
+        rate = rows / best if throughput and best > 0 and rows else None
+        self.results.append(
+            {
+                "case": case,
+                "rows": int(rows),
+                "seconds": round(best, 6),
+                "median_seconds": round(statistics.median(runs), 6),
+                "runs": [round(r, 6) for r in runs],
+                "rows_per_s": round(rate, 1) if rate else None,
+            }
+        )
+        rate_txt = f"{rate:>14,.0f}" if rate else f"{'-':>14}"
+        print(f"{case:<34}  {rows:>10,}  {best:>10.4f}  {rate_txt}", flush=True)
+        return result
+
+
+def git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_engine_cases(suite: Suite, n: int, sheet: pd.DataFrame, by_norm: Dict[str, dict], org_id: int, user_id: int) -> None:
+    notice = sheet[synthetic.COUNTY_NOTICE]
+    suite.time("to_money", n, lambda: app.to_money(notice), setup=app._money_value.cache_clear)
+
+    df_calc = suite.time(
+        "compute_batch_df",
+        n,
+        lambda: app.compute_batch_df(sheet, **synthetic.COUNTY_MAPPING, **FEES, customers_by_norm=by_norm),
+        setup=app._money_value.cache_clear,
+    )
+    if df_calc is None:
+        df_calc = app.compute_batch_df(sheet, **synthetic.COUNTY_MAPPING, **FEES, customers_by_norm=by_norm)
+
+    billable = df_calc[df_calc[CANON["final_invoice"]] > 0]
+    invoice_date = dt.date.fromisoformat(INVOICE["invoice_date"])
+    suite.time(
+        "qb_export_csv",
+        len(billable),
+        lambda: app.qb_export_csv(billable, 1001, invoice_date, INVOICE["days_due"], INVOICE["qb_item_name"], INVOICE["qb_desc_prefix"]),
+    )
+
+    def persist() -> int:
+        with app.db_session() as conn:
+            cur = conn.cursor()
+            batch_id = app.insert_batch(
+                cur, org_id=org_id, user_id=user_id, source_filename="bench.csv", notes=None, **FEES, **INVOICE
+            )
+            app.write_batch_rows(cur, batch_id, df_calc)
+            app.refresh_batch_stats(conn, batch_id)
+            conn.commit()
+            return batch_id
+
+    suite.time("write_batch_rows", n, persist)
+
+
+def run_api_cases(suite: Suite, client, headers: dict, n: int, csv_bytes: bytes) -> None:
+    def compute() -> int:
+        res = client.post(
+            "/api/batches/compute",
+            headers=headers,
+            files={"file": ("county.csv", csv_bytes, "text/csv")},
+            data=synthetic.COUNTY_MAPPING,
+        )
+        res.raise_for_status()
+        return res.json()["id"]
+
+    batch_id = suite.time("api POST /api/batches/compute", n, compute)
+    if batch_id is None:
+        # The read cases below still need a batch of this size
+        batch_id = compute()
+
+    def get_ok(url: str):
+        def call():
+            res = client.get(url, headers=headers)
+            res.raise_for_status()
+            return res
+
+        return call
+
+    suite.time("api GET /api/dashboard/stats", n, get_ok("/api/dashboard/stats"), throughput=False)
+    suite.time("api GET /api/batches/{id}", n, get_ok(f"/api/batches/{batch_id}?limit=500"), throughput=False)
+    suite.time("api GET /api/batches/{id}/export", n, get_ok(f"/api/batches/{batch_id}/export"))
+
+    page = client.get(f"/api/batches/{batch_id}?limit=200", headers=headers).json()["rows"]
+    body = [{"id": r["id"], "manual_discount": 25.0} for r in page]
+
+    def patch():
+        res = client.patch(f"/api/batches/{batch_id}/rows", headers=headers, json=body)
+        res.raise_for_status()
+
+    suite.time("api PATCH /api/batches/{id}/rows", n, patch, throughput=False)
+
+
+def compare(old_path: str, results: List[dict], threshold: float) -> int:
+    """Print old vs new seconds per (case, rows); returns how many cases got slower than threshold."""
+    with open(old_path, encoding="utf-8") as f:
+        old = {(r["case"], r["rows"]): r for r in json.load(f)["results"]}
+    slower = 0
+    print()
+    print(f"{'case':<34}  {'rows':>10}  {'old s':>10}  {'new s':>10}  {'ratio':>7}")
+    for r in results:
+        prev = old.get((r["case"], r["rows"]))
+        if not prev:
+            continue
+        ratio = r["seconds"] / prev["seconds"] if prev["seconds"] else float("inf")
+        flag = "  slower" if ratio > threshold else ""
+        slower += ratio > threshold
+        print(f"{r['case']:<34}  {r['rows']:>10,}  {prev['seconds']:>10.4f}  {r['seconds']:>10.4f}  {ratio:>6.2f}x{flag}")
+    return slower
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--customers", type=int, default=5_000, help="synthetic customers loaded before the runs")
+    ap.add_argument("--repeat", type=int, default=3, help="runs per case; the fastest is reported")
+    ap.add_argument("--api-max", type=int, default=1_000_000, help="skip the API cases above this many rows")
+    ap.add_argument("--only", nargs="+", default=None, help="case name prefixes to run (e.g. to_money api)")
+    ap.add_argument("--out", default=None, help="write results as JSON to this file")
+    ap.add_argument("--compare", default=None, help="earlier JSON results to compare against")
+    ap.add_argument("--threshold", type=float, default=1.10, help="ratio above which --compare reports a case as slower")
+    args = ap.parse_args()
+
+    suite = Suite(args.repeat, args.only)
+    with tempfile.TemporaryDirectory() as tmp:
+        app.DB_PATH = os.path.join(tmp, "bench.db")
+        import api  # noqa: E402  (init_db runs on import, after DB_PATH is set)
+        from fastapi.testclient import TestClient
+
+        ok, msg = app.create_org_with_admin("Bench Org", "bench@example.com", "bench-pass")
+        assert ok, msg
+        ok, user, msg = app.authenticate("Bench Org", "bench@example.com", "bench-pass")
+        headers = {"Authorization": f"Bearer {api.encode_token(user)}"}
+        client = TestClient(api.app)
+
+        with app.db_session() as conn:
+            app.import_customers(conn, user.org_id, synthetic.customer_base(args.customers, args.seed))
+        by_norm = app.customer_match_index(user.org_id).by_norm
+
+        print(f"{'case':<34}  {'rows':>10}  {'best s':>10}  {'rows/s':>14}")
+        for n in args.sizes:
+            sheet = synthetic.county_sheet(n, args.seed, customers=args.customers)
+            run_engine_cases(suite, n, sheet, by_norm, user.org_id, user.user_id)
+            if n <= args.api_max and suite.wanted("api"):
+                csv_bytes = sheet.to_csv(index=False).encode("utf-8")
+                run_api_cases(suite, client, headers, n, csv_bytes)
+            del sheet
+        client.close()
+        app.close_db_pool()
+
+    report = {
+        "meta": {
+            "created_at": dt.datetime.utcnow().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "customers": args.customers,
+            "repeat": args.repeat,
+        },
+        "results": suite.results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {len(suite.results)} results to {args.out}")
+    if args.compare:
+        return 1 if compare(args.compare, suite.results, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,145 @@
+"""
+Seeded synthetic data for the benchmark suite: appraisal-district sheets and a customer base.
+The same (rows, seed) always produces the same frame, so timings are comparable run to run.
+Run: python benchmarks/synthetic.py --rows 100000 --out county.csv
+"""
+from __future__ import annotations
+
+import argparse
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+# Column names as a typical appraisal-district notice export spells them
+COUNTY_OWNER = "OWNER_NAME"
+COUNTY_PROPID = "PROP_ID"
+COUNTY_NOTICE = "NOTICE_MKT_VAL"
+COUNTY_FINAL = "FINAL_MKT_VAL"
+COUNTY_MAPPING = {
+    "col_owner": COUNTY_OWNER,
+    "col_propid": COUNTY_PROPID,
+    "col_notice": COUNTY_NOTICE,
+    "col_final": COUNTY_FINAL,
+}
+
+_FIRST = ["JAMES", "MARY", "ROBERT", "PATRICIA", "JOHN", "JENNIFER", "MICHAEL", "LINDA", "DAVID", "ELIZABETH",
+          "WILLIAM", "BARBARA", "RICHARD", "SUSAN", "JOSEPH", "JESSICA", "THOMAS", "SARAH", "CARLOS", "MARIA"]
+_LAST = ["SMITH", "JOHNSON", "WILLIAMS", "BROWN", "JONES", "GARCIA", "MILLER", "DAVIS", "RODRIGUEZ", "MARTINEZ",
+         "HERNANDEZ", "LOPEZ", "GONZALEZ", "WILSON", "ANDERSON", "THOMAS", "TAYLOR", "MOORE", "JACKSON", "NGUYEN"]
+_ENTITY = ["LLC", "LP", "TRUST", "HOLDINGS LLC", "PROPERTIES LTD", "FAMILY TRUST", "INVESTMENTS INC"]
+_CITIES = ["HOUSTON", "AUSTIN", "DALLAS", "SAN ANTONIO", "EL PASO", "PLANO", "KATY", "SUGAR LAND"]
+
+
+def owner_pool(n: int, seed: int = 7) -> List[str]:
+    """
+    `n` distinct owner names: people ("SMITH JOHN A") and entities ("GARCIA JOHN HOLDINGS LLC").
+    Drawn in fixed blocks, so owner_pool(k) is always the first k names of owner_pool(n) for n > k.
+    """
+    block = 4096
+    names: List[str] = []
+    for b in range(-(-n // block)):
+        rng = np.random.default_rng([seed, b])
+        last = np.asarray(_LAST)[rng.integers(0, len(_LAST), block)]
+        first = np.asarray(_FIRST)[rng.integers(0, len(_FIRST), block)]
+        initial = rng.integers(65, 91, block)
+        entity = np.asarray(_ENTITY)[rng.integers(0, len(_ENTITY), block)]
+        is_entity = rng.random(block) < 0.25
+        names.extend(
+            f"{l} {f} {e}" if ent else f"{l} {f} {chr(i)}"
+            for l, f, i, e, ent in zip(last, first, initial.tolist(), entity, is_entity.tolist())
+        )
+    s = pd.Series(names[:n])
+    # Repeats get a numeric suffix; generated names never end in a digit, so these stay unique
+    dup = s.groupby(s, sort=False).cumcount()
+    return s.where(dup == 0, s + " " + dup.astype(str)).tolist()
+
+
+def customer_base(n: int, seed: int = 7) -> pd.DataFrame:
+    """Customers as a customer CSV import would carry them (see CUSTOMER_IMPORT_FIELDS)."""
+    rng = np.random.default_rng(seed + 1)
+    names = owner_pool(n, seed)
+    return pd.DataFrame(
+        {
+            "name": [name.title() for name in names],
+            "email": [f"owner{i}@example.com" if rng.random() < 0.7 else "" for i in range(n)],
+            "phone": [f"713-555-{rng.integers(0, 10_000):04d}" if rng.random() < 0.5 else "" for _ in range(n)],
+            "city": [_CITIES[i] for i in rng.integers(0, len(_CITIES), n)],
+            "state": "TX",
+        }
+    )
+
+
+def messy_money(values: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Format whole-dollar amounts the ways county exports do: "$123,456", "123456.00",
+    " $ 98,000 ", "98,000.00", bare numbers, accounting negatives "(1,234)", blanks and "N/A".
+    """
+    styles = [
+        (0.40, lambda v: f"${v:,.0f}"),
+        (0.20, lambda v: f"{v:.2f}"),
+        (0.10, lambda v: f" $ {v:,.0f} "),
+        (0.10, lambda v: f"{v:,.2f}"),
+        (0.12, lambda v: v),
+        (0.03, lambda v: f"({v:,.0f})"),
+        (0.03, lambda v: ""),
+        (0.02, lambda v: "N/A"),
+    ]
+    pick = rng.choice(len(styles), size=len(values), p=[w for w, _ in styles])
+    out = np.empty(len(values), dtype=object)
+    for k, (_, fmt) in enumerate(styles):
+        mask = pick == k
+        out[mask] = [fmt(v) for v in values[mask].tolist()]
+    return out
+
+
+def county_sheet(rows: int, seed: int = 7, owners: int = 0, customers: int = 0) -> pd.DataFrame:
+    """
+    A notice-value sheet of `rows` parcels. Owners are drawn Zipf-style from a pool of
+    `owners` names (default rows // 4), so large owners hold many parcels. The first
+    `customers` names of the pool are the ones customer_base(customers) returns (in the
+    county's upper-case spelling), i.e. the customers are the most frequent owners.
+    """
+    rng = np.random.default_rng(seed)
+    pool = owner_pool(max(owners or rows // 4, customers, 1), seed)
+    ranks = (rng.zipf(1.2, rows) - 1) % len(pool)
+    owner = np.asarray(pool, dtype=object)[ranks]
+    # A few owner cells carry the padding and case noise real exports have
+    noisy = rng.random(rows) < 0.05
+    owner[noisy] = [f"  {o.lower()} " for o in owner[noisy]]
+
+    notice = rng.lognormal(12.4, 0.6, rows).round(-2)
+    cut = np.where(rng.random(rows) < 0.35, 0.0, rng.uniform(0.0, 0.18, rows))
+    final = (notice * (1.0 - cut)).round(-2)
+    return pd.DataFrame(
+        {
+            COUNTY_PROPID: [f"R{p:09d}" for p in rng.permutation(rows) + 100_000],
+            "GEO_ID": [f"{g:013d}" for g in rng.integers(10**11, 10**12, rows)],
+            COUNTY_OWNER: owner,
+            "SITUS_ADDR": [f"{a} MAIN ST" for a in rng.integers(100, 99_999, rows)],
+            "STATE_CD": rng.choice(["A1", "A2", "F1", "C1"], rows),
+            COUNTY_NOTICE: messy_money(notice, rng),
+            COUNTY_FINAL: messy_money(final, rng),
+            "HS_EXEMPT": rng.choice(["Y", "N"], rows),
+        }
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--customers", type=int, default=0, help="also write this many customers to --customers-out")
+    ap.add_argument("--out", default="county.csv")
+    ap.add_argument("--customers-out", default="customers.csv")
+    args = ap.parse_args()
+
+    county_sheet(args.rows, args.seed, customers=args.customers).to_csv(args.out, index=False)
+    print(f"Wrote {args.rows:,} rows to {args.out}")
+    if args.customers:
+        customer_base(args.customers, args.seed).to_csv(args.customers_out, index=False)
+        print(f"Wrote {args.customers:,} customers to {args.customers_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import { createContext, useContext, useEffect, useState, useCallback } from 'react';
 import { supabase } from '../lib/supabase';
-import { apiLogin, apiRegister, getApiUrl } from '../lib/api';
+import { apiLogin, apiLogout, apiRegister, getApiUrl } from '../lib/api';
 import {
   DEFAULT_PLAN,
   PLANS,
@@ -148,6 +148,7 @@ export function AuthProvider({ children }) {
   };
 
   const signOut = async () => {
+    if (apiToken) await apiLogout(getApiUrl(), apiToken).catch(() => {});
     const { error } = await supabase.auth.signOut();
     if (error) throw error;
     setSession(null);
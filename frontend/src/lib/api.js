@@ -34,6 +34,15 @@ export async function apiRegister(baseUrl, orgName, email, password) {
   return handleResponse(res);
 }
 
+/** Revoke the API token server-side; callers clear local state regardless of the result. */
+export async function apiLogout(baseUrl, token) {
+  const res = await fetch(`${baseUrl}/api/auth/logout`, {
+    method: 'POST',
+    headers: getAuthHeaders(token),
+  });
+  return handleResponse(res);
+}
+
 export async function apiDashboardStats(baseUrl, token) {
   const res = await fetch(`${baseUrl}/api/dashboard/stats`, {
     headers: getAuthHeaders(token),
@@ -41,14 +50,59 @@ export async function apiDashboardStats(baseUrl, token) {
   return handleResponse(res);
 }
 
-export async function apiGetCustomers(baseUrl, token, { q, show_inactive } = {}) {
-  const params = new URLSearchParams();
+/** One keyset page: { items, total, nextAfterId } (nextAfterId is null on the last page). */
+async function fetchPage(url, token) {
+  const res = await fetch(url, { headers: getAuthHeaders(token) });
+  const data = await handleResponse(res);
+  const next = res.headers.get('X-Next-After-Id');
+  return {
+    items: Array.isArray(data) ? data : data.rows,
+    batch: Array.isArray(data) ? undefined : data.batch,
+    total: parseInt(res.headers.get('X-Total-Count') || '0', 10),
+    nextAfterId: next ? parseInt(next, 10) : null,
+  };
+}
+
+function pageParams({ after_id, limit } = {}, params = new URLSearchParams()) {
+  if (after_id != null) params.set('after_id', String(after_id));
+  if (limit != null) params.set('limit', String(limit));
+  return params;
+}
+
+/** Page size when a helper fetches every page (the API's PAGE_LIMIT_MAX). */
+const ALL_PAGES_LIMIT = 10000;
+
+/** Follow X-Next-After-Id from the first page to the last; returns { items, total, batch }. */
+async function fetchAllPages(fetchOne) {
+  let page = await fetchOne({ limit: ALL_PAGES_LIMIT });
+  const items = [...page.items];
+  const { total, batch } = page;
+  while (page.nextAfterId != null) {
+    page = await fetchOne({ after_id: page.nextAfterId, limit: ALL_PAGES_LIMIT });
+    items.push(...page.items);
+  }
+  return { items, total, batch };
+}
+
+export async function apiGetCustomersPage(baseUrl, token, { q, show_inactive, after_id, limit } = {}) {
+  const params = pageParams({ after_id, limit });
   if (q) params.set('q', q);
   if (show_inactive) params.set('show_inactive', 'true');
-  const res = await fetch(`${baseUrl}/api/customers?${params}`, {
-    headers: getAuthHeaders(token),
-  });
-  return handleResponse(res);
+  return fetchPage(`${baseUrl}/api/customers?${params}`, token);
+}
+
+export async function apiListBatchesPage(baseUrl, token, page = {}) {
+  return fetchPage(`${baseUrl}/api/batches?${pageParams(page)}`, token);
+}
+
+export async function apiGetBatchRowsPage(baseUrl, token, batchId, page = {}) {
+  return fetchPage(`${baseUrl}/api/batches/${batchId}?${pageParams(page)}`, token);
+}
+
+/** Every customer (all pages). */
+export async function apiGetCustomers(baseUrl, token, { q, show_inactive } = {}) {
+  const { items } = await fetchAllPages((page) => apiGetCustomersPage(baseUrl, token, { q, show_inactive, ...page }));
+  return items;
 }
 
 export async function apiCreateCustomer(baseUrl, token, customer) {
@@ -60,6 +114,19 @@ export async function apiCreateCustomer(baseUrl, token, customer) {
   return handleResponse(res);
 }
 
+/** Bulk CSV import; returns { added, updated, skipped }. upsert updates existing customers' contact fields. */
+export async function apiImportCustomers(baseUrl, token, file, upsert = false) {
+  const form = new FormData();
+  form.append('file', file);
+  form.append('upsert', String(upsert));
+  const res = await fetch(`${baseUrl}/api/customers/import`, {
+    method: 'POST',
+    headers: getAuthHeaders(token),
+    body: form,
+  });
+  return handleResponse(res);
+}
+
 export async function apiUpdateCustomer(baseUrl, token, customerId, payload) {
   const res = await fetch(`${baseUrl}/api/customers/${customerId}`, {
     method: 'PATCH',
@@ -94,18 +161,41 @@ export async function apiCreateBatch(baseUrl, token, batch) {
   return handleResponse(res);
 }
 
-export async function apiListBatches(baseUrl, token) {
-  const res = await fetch(`${baseUrl}/api/batches`, {
+/** Upload the raw county sheet; the server computes, saves and returns { id, summary }. */
+export async function apiComputeBatch(baseUrl, token, file, mapping, options = {}) {
+  const form = new FormData();
+  form.append('file', file);
+  form.append('col_owner', mapping.owner_name);
+  form.append('col_propid', mapping.property_id);
+  form.append('col_notice', mapping.notice_value);
+  form.append('col_final', mapping.final_value);
+  Object.entries(options).forEach(([key, value]) => {
+    if (value !== undefined && value !== null) form.append(key, String(value));
+  });
+  const res = await fetch(`${baseUrl}/api/batches/compute`, {
+    method: 'POST',
     headers: getAuthHeaders(token),
+    body: form,
   });
   return handleResponse(res);
 }
 
+/** Every batch, newest first (all pages). */
+export async function apiListBatches(baseUrl, token) {
+  const { items } = await fetchAllPages((page) => apiListBatchesPage(baseUrl, token, page));
+  return items;
+}
+
+/** Saved batch count without fetching the list. */
+export async function apiCountBatches(baseUrl, token) {
+  const { total } = await apiListBatchesPage(baseUrl, token, { limit: 1 });
+  return total;
+}
+
+/** Batch header and all of its rows: { batch, rows }. */
 export async function apiGetBatch(baseUrl, token, batchId) {
-  const res = await fetch(`${baseUrl}/api/batches/${batchId}`, {
-    headers: getAuthHeaders(token),
-  });
-  return handleResponse(res);
+  const { items, batch } = await fetchAllPages((page) => apiGetBatchRowsPage(baseUrl, token, batchId, page));
+  return { batch, rows: items };
 }
 
 export async function apiUpdateBatch(baseUrl, token, batchId, payload) {
@@ -126,13 +216,40 @@ export async function apiUpdateBatchRows(baseUrl, token, batchId, rows) {
   return handleResponse(res);
 }
 
+/** QuickBooks CSV as a Blob; the server streams it, so nothing is base64-wrapped. */
 export async function apiBatchExport(baseUrl, token, batchId, store = false) {
   const res = await fetch(`${baseUrl}/api/batches/${batchId}/export?store=${store}`, {
     headers: getAuthHeaders(token),
   });
+  if (!res.ok) await handleResponse(res);
+  const disposition = res.headers.get('Content-Disposition') || '';
+  const match = disposition.match(/filename="([^"]+)"/);
+  return {
+    blob: await res.blob(),
+    filename: match ? match[1] : `QB_Import_Batch_${batchId}.csv`,
+    invoiceStartNo: parseInt(res.headers.get('X-Invoice-Start-No') || '0', 10),
+    invoiceCount: parseInt(res.headers.get('X-Invoice-Count') || '0', 10),
+  };
+}
+
+export async function apiListExports(baseUrl, token, batchId) {
+  const res = await fetch(`${baseUrl}/api/batches/${batchId}/exports`, {
+    headers: getAuthHeaders(token),
+  });
   return handleResponse(res);
 }
 
+/** A stored export's CSV as a Blob, byte-for-byte what was originally exported. */
+export async function apiDownloadExport(baseUrl, token, exportId) {
+  const res = await fetch(`${baseUrl}/api/exports/${exportId}/download`, {
+    headers: getAuthHeaders(token),
+  });
+  if (!res.ok) await handleResponse(res);
+  const disposition = res.headers.get('Content-Disposition') || '';
+  const match = disposition.match(/filename="([^"]+)"/);
+  return { blob: await res.blob(), filename: match ? match[1] : `QB_Export_${exportId}.csv` };
+}
+
 export async function apiDeleteBatch(baseUrl, token, batchId) {
   const res = await fetch(`${baseUrl}/api/batches/${batchId}`, {
     method: 'DELETE',
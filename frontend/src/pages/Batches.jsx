@@ -214,9 +214,7 @@ export default function Batches() {
       setMessage(null);
       try {
         const data = await apiBatchExport(apiBaseUrl, apiToken, selectedBatch.id, store);
-        const bytes = Uint8Array.from(atob(data.csv_base64), (c) => c.charCodeAt(0));
-        const blob = new Blob([bytes], { type: 'text/csv;charset=utf-8' });
-        const url = URL.createObjectURL(blob);
+        const url = URL.createObjectURL(data.blob);
         const a = document.createElement('a');
         a.href = url;
         a.download = data.filename;
@@ -12,7 +12,7 @@ import {
 } from '@heroicons/react/24/outline';
 import { useAuth } from '../context/AuthContext';
 import { GlassCard } from '../components/GlassCard';
-import { apiDashboardStats, apiListBatches } from '../lib/api';
+import { apiDashboardStats, apiCountBatches } from '../lib/api';
 import { supabase } from '../lib/supabase';
 
 const statKeys = [
@@ -44,12 +44,12 @@ export default function Dashboard() {
     setStatsError(null);
     try {
       if (apiToken && apiBaseUrl) {
-        const [data, batchData] = await Promise.all([
+        const [data, batchCount] = await Promise.all([
           apiDashboardStats(apiBaseUrl, apiToken),
-          apiListBatches(apiBaseUrl, apiToken),
+          apiCountBatches(apiBaseUrl, apiToken),
         ]);
         setStats(data);
-        setSavedUploadsCount(Array.isArray(batchData) ? batchData.length : 0);
+        setSavedUploadsCount(batchCount);
       } else if (isSupabaseUser && user?.id) {
         const [batchesRes, customersRes] = await Promise.all([
           supabase.from('batches').select('id').eq('user_id', user.id),
@@ -108,8 +108,8 @@ export default function Dashboard() {
     }
     let cancelled = false;
     if (apiToken && apiBaseUrl) {
-      apiListBatches(apiBaseUrl, apiToken)
-        .then((data) => { if (!cancelled) setSavedUploadsCount(Array.isArray(data) ? data.length : 0); })
+      apiCountBatches(apiBaseUrl, apiToken)
+        .then((count) => { if (!cancelled) setSavedUploadsCount(count); })
         .catch(() => { if (!cancelled) setSavedUploadsCount(0); });
     } else if (isSupabaseUser) {
       supabase.from('batches').select('id', { count: 'exact', head: true }).eq('user_id', user.id)
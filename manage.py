@@ -0,0 +1,56 @@
+"""
+Maintenance commands for app.db.
+Run: python manage.py check-batch-stats [--org-id N] [--repair]
+     python manage.py rebuild-org-stats [--org-id N]
+"""
+from __future__ import annotations
+
+import argparse
+
+from app import check_batch_stats, db_session, init_db, rebuild_org_stats
+
+
+def cmd_check_batch_stats(args: argparse.Namespace) -> int:
+    with db_session() as conn:
+        mismatches = check_batch_stats(conn, org_id=args.org_id, repair=args.repair)
+        if args.repair:
+            conn.commit()
+    for m in mismatches:
+        print(
+            f"batch #{m['id']}: rows {m['row_count']} -> {m['actual_row_count']}, "
+            f"billable {m['billable_count']} -> {m['actual_billable_count']}, "
+            f"total {m['total_invoice']:.2f} -> {m['actual_total_invoice']:.2f}"
+        )
+    verb = "Repaired" if args.repair else "Found"
+    print(f"{verb} {len(mismatches)} batch(es) with stale stats.")
+    return 1 if mismatches and not args.repair else 0
+
+
+def cmd_rebuild_org_stats(args: argparse.Namespace) -> int:
+    with db_session() as conn:
+        n = rebuild_org_stats(conn, org_id=args.org_id)
+        conn.commit()
+    print(f"Rebuilt stats for {n} org(s).")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="TaxPilot maintenance commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("check-batch-stats", help="compare stored batch stats with batch_rows")
+    p.add_argument("--org-id", type=int, default=None)
+    p.add_argument("--repair", action="store_true", help="rewrite stale stats from batch_rows")
+    p.set_defaults(func=cmd_check_batch_stats)
+
+    p = sub.add_parser("rebuild-org-stats", help="recompute the dashboard rollups from batch rows and customers")
+    p.add_argument("--org-id", type=int, default=None)
+    p.set_defaults(func=cmd_rebuild_org_stats)
+
+    args = parser.parse_args()
+    init_db()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,74 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+import pytest
+
+import app
+
+# api runs init_db on import; keep that (and anything else unpatched) off the real app.db
+_session_dir = tempfile.mkdtemp(prefix="taxpilot-tests-")
+atexit.register(shutil.rmtree, _session_dir, ignore_errors=True)
+app.DB_PATH = os.path.join(_session_dir, "app.db")
+
+COUNTY_MAPPING = {"col_owner": "Owner", "col_propid": "Prop ID", "col_notice": "Notice", "col_final": "Final"}
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """app.DB_PATH pointed at a fresh, fully migrated database; in-process caches cleared."""
+    path = str(tmp_path / "app.db")
+    monkeypatch.setattr(app, "DB_PATH", path)
+    app.close_db_pool()
+    app.invalidate_settings_cache()
+    app._customer_indexes.clear()
+    app.init_db()
+    yield path
+    app.close_db_pool()
+
+
+@pytest.fixture
+def org(temp_db):
+    """An org with an admin user, as a SessionUser."""
+    ok, msg = app.create_org_with_admin("Test Org", "admin@example.com", "test-pass")
+    assert ok, msg
+    login = app.find_login("Test Org", "admin@example.com")
+    return app.session_user_from_login(login)
+
+
+@pytest.fixture
+def client(org):
+    """TestClient for api.app, signed in as the org's admin."""
+    import api
+    from fastapi.testclient import TestClient
+
+    api._token_cache.clear()
+    with TestClient(api.app) as c:
+        c.headers["Authorization"] = f"Bearer {api.encode_token(org)}"
+        yield c
+
+
+@pytest.fixture
+def compute_batch(client):
+    """Save a batch of `rows` synthetic parcels through POST /api/batches/compute; returns its id."""
+
+    def compute(rows: int) -> int:
+        sheet = pd.DataFrame(
+            {
+                "Owner": [f"Owner {i % 7}" for i in range(rows)],
+                "Prop ID": [f"R{i:06d}" for i in range(rows)],
+                "Notice": [200_000 + i for i in range(rows)],
+                "Final": [150_000] * rows,
+            }
+        )
+        res = client.post(
+            "/api/batches/compute",
+            files={"file": ("county.csv", sheet.to_csv(index=False).encode("utf-8"), "text/csv")},
+            data=COUNTY_MAPPING,
+        )
+        assert res.status_code == 200, res.text
+        return res.json()["id"]
+
+    return compute
@@ -0,0 +1,115 @@
+import asyncio
+import csv
+import gc
+import io
+
+import app
+
+
+def csv_rows(res):
+    return list(csv.DictReader(io.StringIO(res.content.decode("utf-8"))))
+
+
+def test_export_counts_streamed_rows(client, org, compute_batch):
+    batch_id = compute_batch(20)
+    res = client.get(f"/api/batches/{batch_id}/export")
+    assert res.status_code == 200
+    assert int(res.headers["X-Invoice-Count"]) == len(csv_rows(res)) == 20
+    assert res.headers["X-Invoice-Start-No"] == "1001"
+    # Without store the numbers are not reserved
+    assert app.get_settings(org.org_id, use_cache=False)["next_invoice_no"] == "1001"
+
+
+def test_store_reserves_the_rows_actually_exported(client, org, compute_batch):
+    batch_id = compute_batch(20)
+    with app.db_session() as conn:
+        # Stale stored stats must not decide how many invoice numbers are taken
+        conn.execute("UPDATE batches SET billable_count = 3 WHERE id = ?", (batch_id,))
+        conn.execute("UPDATE batch_rows SET manual_discount = base_fee, final_invoice = 0 WHERE batch_id = ? AND row_index < 5", (batch_id,))
+        conn.commit()
+
+    res = client.get(f"/api/batches/{batch_id}/export", params={"store": True})
+    rows = csv_rows(res)
+    assert int(res.headers["X-Invoice-Count"]) == len(rows) == 15
+    assert app.get_settings(org.org_id)["next_invoice_no"] == "1016"
+
+    res = client.get(f"/api/batches/{batch_id}/export", params={"store": True})
+    assert res.headers["X-Invoice-Start-No"] == "1016"
+    exports = client.get(f"/api/batches/{batch_id}/exports").json()
+    assert [e["invoice_count"] for e in exports] == [15, 15]
+
+
+def test_export_without_billable_rows(client, compute_batch):
+    batch_id = compute_batch(3)
+    with app.db_session() as conn:
+        conn.execute("UPDATE batch_rows SET final_invoice = 0 WHERE batch_id = ?", (batch_id,))
+        conn.commit()
+    assert client.get(f"/api/batches/{batch_id}/export", params={"store": True}).status_code == 400
+
+
+def open_export(org, batch_id, store=True):
+    """api_batch_export called directly, so the body can be read after other writes."""
+    import api
+
+    with app.db_session() as conn:
+        return api.api_batch_export(batch_id, user=org, conn=conn, store=store)
+
+
+def read_body(res, chunks=None):
+    """The streamed body; with `chunks`, only that many chunks before the client goes away."""
+
+    async def collect():
+        parts = []
+        async for part in res.body_iterator:
+            parts.append(part)
+            if chunks is not None and len(parts) == chunks:
+                await res.body_iterator.aclose()
+                break
+        return b"".join(parts)
+
+    body = asyncio.run(collect())
+    gc.collect()
+    return body
+
+
+def test_store_streams_the_rows_it_reserved(client, org, compute_batch):
+    batch_id = compute_batch(20)
+    with app.db_session() as conn:
+        conn.execute("UPDATE batch_rows SET final_invoice = 0 WHERE batch_id = ? AND row_index < 5", (batch_id,))
+        conn.commit()
+
+    res = open_export(org, batch_id)
+    # Rows made billable after the reservation belong to the next export
+    with app.db_session() as conn:
+        conn.execute("UPDATE batch_rows SET final_invoice = base_fee WHERE batch_id = ?", (batch_id,))
+        app.refresh_batch_stats(conn, batch_id)
+        conn.commit()
+    rows = list(csv.DictReader(io.StringIO(read_body(res).decode("utf-8"))))
+
+    assert res.headers["X-Invoice-Count"] == "15"
+    assert [int(r["InvoiceNo"]) for r in rows] == list(range(1001, 1016))
+    exports = client.get(f"/api/batches/{batch_id}/exports").json()
+    assert [e["invoice_count"] for e in exports] == [15]
+    res = client.get(f"/api/batches/{batch_id}/export", params={"store": True})
+    assert (res.headers["X-Invoice-Start-No"], res.headers["X-Invoice-Count"]) == ("1016", "20")
+
+
+def test_aborted_store_releases_the_range(client, org, compute_batch):
+    batch_id = compute_batch(20)
+    read_body(open_export(org, batch_id), chunks=1)
+    assert app.get_settings(org.org_id)["next_invoice_no"] == "1001"
+    assert client.get(f"/api/batches/{batch_id}/exports").json() == []
+
+
+def test_aborted_store_is_recorded_once_numbers_moved_on(client, org, compute_batch):
+    batch_id = compute_batch(20)
+    first = open_export(org, batch_id)
+    second = client.get(f"/api/batches/{batch_id}/export", params={"store": True})
+    assert second.headers["X-Invoice-Start-No"] == "1021"
+    read_body(first, chunks=1)
+
+    assert app.get_settings(org.org_id)["next_invoice_no"] == "1041"
+    exports = client.get(f"/api/batches/{batch_id}/exports").json()
+    assert sorted((e["invoice_start_no"], e["invoice_count"]) for e in exports) == [(1001, 20), (1021, 20)]
+    stored = client.get(f"/api/exports/{exports[-1]['id']}/download")
+    assert len(csv_rows(stored)) == 20
@@ -0,0 +1,108 @@
+import pytest
+
+
+def walk(client, url, limit, **params):
+    """Follow X-Next-After-Id through every page; returns (pages of ids, headers of each page)."""
+    pages, headers, after_id = [], [], None
+    while True:
+        query = {**params, "limit": limit, **({"after_id": after_id} if after_id is not None else {})}
+        res = client.get(url, params=query)
+        assert res.status_code == 200, res.text
+        body = res.json()
+        items = body if isinstance(body, list) else body["rows"]
+        pages.append([r["id"] for r in items])
+        headers.append(res.headers)
+        after_id = res.headers.get("X-Next-After-Id")
+        if after_id is None:
+            return pages, headers
+
+
+def assert_cursor_headers(pages, headers, total):
+    for ids, h in zip(pages[:-1], headers[:-1]):
+        assert int(h["X-Total-Count"]) == total
+        assert int(h["X-Next-After-Id"]) == ids[-1]
+    assert int(headers[-1]["X-Total-Count"]) == total
+    assert "X-Next-After-Id" not in headers[-1]
+
+
+def add_customers(client, names):
+    return [client.post("/api/customers", json={"name": n}).json()["id"] for n in names]
+
+
+def test_customers_pages(client):
+    names = [f"Customer {i:02d}" for i in range(25)][::-1]
+    ids = add_customers(client, names)
+    pages, headers = walk(client, "/api/customers", 5)
+    assert [len(p) for p in pages] == [5, 5, 5, 5, 5]
+    assert_cursor_headers(pages, headers, 25)
+    full = client.get("/api/customers").json()
+    assert [i for p in pages for i in p] == [c["id"] for c in full]
+    assert sorted(i for p in pages for i in p) == sorted(ids)
+
+
+def test_customers_single_page_has_no_cursor(client):
+    add_customers(client, ["Alpha", "Beta"])
+    pages, headers = walk(client, "/api/customers", 2)
+    assert len(pages) == 1
+    assert_cursor_headers(pages, headers, 2)
+
+
+def test_customers_cursor_is_stable_under_inserts(client):
+    add_customers(client, [f"M Customer {i:02d}" for i in range(10)])
+    first = client.get("/api/customers", params={"limit": 4})
+    seen = [c["id"] for c in first.json()]
+    # Rows added on either side of the cursor neither repeat nor shift the remaining pages
+    add_customers(client, ["A Before Cursor", "Z After Cursor"])
+    rest, _ = walk(client, "/api/customers", 4, after_id=first.headers["X-Next-After-Id"])
+    rest_names = [c["name"] for c in client.get("/api/customers").json() if c["id"] in {i for p in rest for i in p}]
+    assert not set(seen) & {i for p in rest for i in p}
+    assert "A Before Cursor" not in rest_names and "Z After Cursor" in rest_names
+    assert len(seen) + sum(len(p) for p in rest) == 11
+
+
+def test_customers_filters_count_in_total(client):
+    add_customers(client, ["Smith A", "Smith B", "Jones C"])
+    res = client.get("/api/customers", params={"q": "smith", "limit": 1})
+    assert res.headers["X-Total-Count"] == "2"
+    pages, headers = walk(client, "/api/customers", 1, q="smith")
+    assert len(pages) == 2
+    assert_cursor_headers(pages, headers, 2)
+
+
+def test_batches_pages_newest_first(client, compute_batch):
+    ids = [compute_batch(3) for _ in range(7)]
+    pages, headers = walk(client, "/api/batches", 3)
+    assert [i for p in pages for i in p] == ids[::-1]
+    assert [len(p) for p in pages] == [3, 3, 1]
+    assert_cursor_headers(pages, headers, 7)
+
+
+def test_batch_rows_pages(client, compute_batch):
+    batch_id = compute_batch(2_050)
+    pages, headers = walk(client, f"/api/batches/{batch_id}", 1_000)
+    assert [len(p) for p in pages] == [1_000, 1_000, 50]
+    assert_cursor_headers(pages, headers, 2_050)
+    row_ids = [i for p in pages for i in p]
+    assert row_ids == sorted(row_ids) and len(set(row_ids)) == 2_050
+
+
+def test_default_limit_truncates_with_a_cursor(client, compute_batch):
+    import api
+
+    batch_id = compute_batch(api.PAGE_LIMIT_DEFAULT + 1)
+    res = client.get(f"/api/batches/{batch_id}")
+    assert len(res.json()["rows"]) == api.PAGE_LIMIT_DEFAULT
+    assert int(res.headers["X-Total-Count"]) == api.PAGE_LIMIT_DEFAULT + 1
+    assert "X-Next-After-Id" in res.headers
+
+
+@pytest.mark.parametrize("url", ["/api/customers", "/api/batches/{batch_id}"])
+def test_unknown_after_id(client, url, compute_batch):
+    batch_id = compute_batch(2)
+    res = client.get(url.format(batch_id=batch_id), params={"after_id": 999_999})
+    assert res.status_code == 400
+
+
+def test_limit_bounds(client):
+    assert client.get("/api/batches", params={"limit": 0}).status_code == 422
+    assert client.get("/api/batches", params={"limit": 10_001}).status_code == 422
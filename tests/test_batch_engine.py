@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import CANON, ENGINE_PYTHON, ENGINE_VECTORIZED, compute_batch_df, normalize_name
+
+MAPPING = dict(col_owner="Owner", col_propid="Prop ID", col_notice="Notice", col_final="Final")
+FEES = dict(
+    tax_rate_pct=2.5,
+    contingency_pct=25.0,
+    flat_fee=150.0,
+    review_min_tax_saved=700.0,
+    charge_flat_if_no_win=False,
+)
+CUSTOMER_NAMES = ["Smith John A", "Garcia Maria Holdings LLC", "Nguyen Thomas B"]
+CUSTOMERS = {normalize_name(n): {"id": i + 1, "name": n} for i, n in enumerate(CUSTOMER_NAMES)}
+
+
+def sheet(owners, notice, final):
+    return pd.DataFrame(
+        {
+            "Owner": owners,
+            "Prop ID": [f"R{i:06d}" for i in range(len(owners))],
+            "Notice": notice,
+            "Final": final,
+        }
+    )
+
+
+def assert_engines_agree(df_raw, customers=CUSTOMERS, **fees):
+    params = {**MAPPING, **FEES, **fees, "customers_by_norm": customers}
+    vectorized = compute_batch_df(df_raw, **params, engine=ENGINE_VECTORIZED)
+    python = compute_batch_df(df_raw, **params, engine=ENGINE_PYTHON)
+    pd.testing.assert_frame_equal(vectorized, python)
+    return vectorized
+
+
+def test_mixed_sheet():
+    df = assert_engines_agree(
+        sheet(
+            ["SMITH JOHN A", "Unknown Owner", "garcia maria holdings llc", "Doe Jane"],
+            [300_000, 250_000, 1_000_000, 80_000],
+            [250_000, 250_000, 900_000, 79_000],
+        )
+    )
+    assert df[CANON["status"]].tolist() == ["STANDARD", "NO_CHARGE", "STANDARD", "REVIEW"]
+    assert df[CANON["matched_customer_id"]].fillna(0).astype(int).tolist() == [1, 0, 2, 0]
+
+
+def test_charge_flat_if_no_win():
+    df = assert_engines_agree(
+        sheet(["Smith John A", "Doe Jane"], [100_000, 100_000], [100_000, 90_000]),
+        charge_flat_if_no_win=True,
+    )
+    assert df[CANON["final_invoice"]].tolist() == [150.0, 212.5]
+
+
+def test_empty_sheet():
+    df = assert_engines_agree(sheet([], [], []))
+    assert df.empty
+
+
+def test_every_row_matched():
+    owners = [n.upper() for n in CUSTOMER_NAMES] * 3
+    df = assert_engines_agree(sheet(owners, [200_000] * 9, [150_000] * 9))
+    assert df[CANON["matched_customer_id"]].notna().all()
+
+
+def test_no_customers():
+    df = assert_engines_agree(sheet(["Smith John A"], [200_000], [150_000]), customers={})
+    assert df[CANON["matched_customer_id"]].isna().all()
+
+
+def test_nan_cells():
+    df = assert_engines_agree(
+        sheet(
+            ["Smith John A", np.nan, None, "Nguyen Thomas B"],
+            [np.nan, 120_000, 90_000, None],
+            [100_000, np.nan, 85_000, 70_000],
+        )
+    )
+    assert df[CANON["notice_value"]].tolist() == [0.0, 120_000.0, 90_000.0, 0.0]
+    assert not df[CANON["money_error"]].any()
+
+
+def test_messy_money():
+    df = assert_engines_agree(
+        sheet(
+            ["Smith John A"] * 8,
+            ["$123,456", " $ 98,000 ", "98,000.00", "(1,234)", "", "N/A", "12abc", 250000],
+            ["$100,000", "90,000", "$98,000", "0", "", "1,000", "$5", "240,000.50"],
+        )
+    )
+    assert df[CANON["notice_value"]].tolist() == [123_456.0, 98_000.0, 98_000.0, -1_234.0, 0.0, 0.0, 0.0, 250_000.0]
+    assert df[CANON["money_error"]].tolist() == [False, False, False, False, False, True, True, False]
+
+
+@pytest.mark.parametrize("row_offset", [0, 50_000])
+def test_row_offset(row_offset):
+    df = assert_engines_agree(sheet(["Smith John A", "Doe Jane"], [1, 2], [1, 1]), row_offset=row_offset)
+    assert df[CANON["row_id"]].tolist() == [row_offset, row_offset + 1]
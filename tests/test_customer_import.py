@@ -0,0 +1,98 @@
+import pandas as pd
+import pytest
+
+import app
+
+
+def run_import(org, rows, upsert=False):
+    with app.db_session() as conn:
+        return app.import_customers(conn, org.org_id, pd.DataFrame(rows), upsert=upsert)
+
+
+def customer_row(org, name):
+    with app.db_session() as conn:
+        row = conn.execute(
+            "SELECT * FROM customers WHERE org_id=? AND name_norm=?", (org.org_id, app.normalize_name(name))
+        ).fetchone()
+    return dict(row)
+
+
+@pytest.fixture
+def existing(org):
+    run_import(
+        org,
+        {
+            "name": ["Smith John A", "Doe Jane", "Garcia Maria"],
+            "email": ["smith@example.com", "", "garcia@example.com"],
+            "city": ["Houston", "Austin", ""],
+        },
+    )
+    with app.db_session() as conn:
+        conn.execute("UPDATE customers SET is_active=0 WHERE name_norm=?", (app.normalize_name("Garcia Maria"),))
+        conn.commit()
+    return org
+
+
+def test_insert_counts(org):
+    counts = run_import(
+        org,
+        {"name": ["Smith John A", "  ", "SMITH JOHN A", "Doe Jane", None]},
+    )
+    assert counts == {"added": 2, "updated": 0, "skipped": 3}
+
+
+def test_existing_names_are_skipped_without_upsert(existing):
+    counts = run_import(existing, {"name": ["Smith John A", "New Person"], "email": ["changed@example.com", ""]})
+    assert counts == {"added": 1, "updated": 0, "skipped": 1}
+    assert customer_row(existing, "Smith John A")["email"] == "smith@example.com"
+
+
+def test_upsert_counts_only_changed_rows(existing):
+    counts = run_import(
+        existing,
+        {
+            "name": ["Smith John A", "Doe Jane", "Garcia Maria", "New Person", "smith john a"],
+            # Smith: all blank; Doe: same city; Garcia: new phone; duplicate Smith row dropped
+            "email": ["", "", "", "new@example.com", "dup@example.com"],
+            "phone": ["", "", "713-555-0100", "", ""],
+            "city": ["", "Austin", "", "Katy", ""],
+        },
+        upsert=True,
+    )
+    assert counts == {"added": 1, "updated": 1, "skipped": 3}
+    assert customer_row(existing, "Smith John A")["email"] == "smith@example.com"
+    assert customer_row(existing, "Doe Jane")["city"] == "Austin"
+
+
+def test_upsert_keeps_inactive_customers_inactive(existing):
+    counts = run_import(existing, {"name": ["Garcia Maria"], "city": ["Dallas"]}, upsert=True)
+    assert counts == {"added": 0, "updated": 1, "skipped": 0}
+    row = customer_row(existing, "Garcia Maria")
+    assert (row["city"], row["email"], row["is_active"]) == ("Dallas", "garcia@example.com", 0)
+
+
+def test_unchanged_upsert_leaves_customers_version(existing):
+    with app.db_session() as conn:
+        before = app.customers_version(conn, existing.org_id)
+    counts = run_import(existing, {"name": ["Smith John A", "Doe Jane"], "city": ["Houston", ""]}, upsert=True)
+    assert counts == {"added": 0, "updated": 0, "skipped": 2}
+    with app.db_session() as conn:
+        assert app.customers_version(conn, existing.org_id) == before
+
+
+def test_upsert_keeps_the_cached_match_index_current(existing):
+    index = app.customer_match_index(existing.org_id)
+    run_import(existing, {"name": ["Doe Jane", "New Person"], "qb_customer_ref": ["QB-9", ""]}, upsert=True)
+    current = app.customer_match_index(existing.org_id)
+    assert current is index
+    assert current.by_norm[app.normalize_name("Doe Jane")]["qb_customer_ref"] == "QB-9"
+    assert app.normalize_name("New Person") in current.by_norm
+
+
+def test_import_endpoint(client):
+    csv = b"Name,Email\nSmith John A,smith@example.com\nDoe Jane,\n"
+    res = client.post("/api/customers/import", files={"file": ("c.csv", csv, "text/csv")})
+    assert res.json() == {"added": 2, "updated": 0, "skipped": 0}
+    csv = b"name,email\nSmith John A,\nDoe Jane,doe@example.com\n"
+    res = client.post("/api/customers/import", files={"file": ("c.csv", csv, "text/csv")}, data={"upsert": "true"})
+    assert res.json() == {"added": 0, "updated": 1, "skipped": 1}
@@ -0,0 +1,70 @@
+import pandas as pd
+
+import app
+from app import FuzzyCustomerIndex, token_sort_key
+
+
+def customer(cid, name):
+    return {"id": cid, "name": name, "name_norm": app.normalize_name(name), "is_active": 1}
+
+
+def match_id(index, owner):
+    hit = index.match(token_sort_key(owner))
+    return hit[0]["id"] if hit else None
+
+
+NAMES = ["Smith John A", "Garcia Maria Holdings LLC", "Nguyen Thomas B", "Johnson Robert", "Smith John B"]
+OWNERS = ["SMITH JON A", "GARCIA MARIA HOLDING LLC", "NGUYEN THOMAS", "JOHNSON ROBERT & MARY", "SMITH JOHN B ET UX", "DOE JANE"]
+
+
+def test_edit_reuses_the_slot():
+    index = FuzzyCustomerIndex([customer(1, "Smith John A"), customer(2, "Doe Jane")])
+    for i in range(50):
+        index.add(customer(1, f"Smith John {chr(65 + i % 26)}"))
+    assert len(index.customers) == len(index.keys) == 2
+    assert index.positions == {1: 0, 2: 1}
+
+
+def test_edits_match_like_a_fresh_build():
+    index = FuzzyCustomerIndex(customer(i, n) for i, n in enumerate(NAMES, 1))
+    index.add(customer(1, "Nguyen Thomas B"))  # now a duplicate name of customer 3
+    index.add(customer(3, "Smith John A"))  # and the two swapped
+    index.remove(4)
+    index.add(customer(4, "Johnson Robert"))
+    final = {1: "Nguyen Thomas B", 2: NAMES[1], 3: "Smith John A", 4: NAMES[3], 5: NAMES[4]}
+    fresh = FuzzyCustomerIndex(customer(i, n) for i, n in final.items())
+    assert [match_id(index, o) for o in OWNERS] == [match_id(fresh, o) for o in OWNERS]
+    assert match_id(index, "SMITH JON A") == 3
+
+
+def test_copy_is_independent_and_compacts():
+    index = FuzzyCustomerIndex(customer(i, f"Owner {i} Trust") for i in range(1, 11))
+    snapshot = index.copy()
+    for i in range(1, 9):
+        index.remove(i)
+    assert match_id(snapshot, "OWNER 1 TRUST") == 1
+    assert match_id(index, "OWNER 1 TRUST") is None
+    compact = index.copy()
+    assert len(index.customers) == 10 and len(compact.customers) == 2
+    assert match_id(compact, "OWNER 10 TRUST") == 10
+
+
+def test_apply_keeps_running_snapshots(org):
+    with app.db_session() as conn:
+        app.import_customers(conn, org.org_id, pd.DataFrame({"name": ["Smith John A", "Doe Jane"]}))
+    index = app.customer_match_index(org.org_id)
+    running = index.fuzzy()
+    smith = index.by_norm[app.normalize_name("Smith John A")]
+
+    with app.db_session() as conn:
+        conn.execute("UPDATE customers SET name=?, name_norm=? WHERE id=?", ("Nguyen Thomas B", "nguyen thomas b", smith["id"]))
+        conn.commit()
+        app.sync_customer_index(conn, org.org_id, [smith["id"]])
+
+    assert app.customer_match_index(org.org_id) is index
+    assert match_id(running, "SMITH JON A") == smith["id"]
+    assert match_id(running, "NGUYEN THOMAS B") is None
+    current = index.fuzzy()
+    assert match_id(current, "SMITH JON A") is None
+    assert match_id(current, "NGUYEN THOMAS B") == smith["id"]
+    assert len(current.customers) == 2
@@ -0,0 +1,43 @@
+import pytest
+
+import api
+
+
+@pytest.fixture
+def metrics_token(monkeypatch):
+    monkeypatch.setattr(api, "METRICS_TOKEN", "scrape-secret")
+    return "scrape-secret"
+
+
+def test_metrics_off_without_token(client):
+    assert client.get("/api/metrics").status_code == 404
+
+
+def test_metrics_need_the_token(client, metrics_token):
+    assert client.get("/api/metrics").status_code == 401  # the user's own JWT is not enough
+    assert client.get("/api/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    res = client.get("/api/metrics", headers={"Authorization": f"Bearer {metrics_token}"})
+    assert res.status_code == 200
+    assert "taxpilot_http_requests_total" in res.text
+
+
+def test_health_details_need_the_token(client, metrics_token):
+    assert client.get("/api/health").json().keys() == {"status", "db"}
+    res = client.get("/api/health", headers={"Authorization": f"Bearer {metrics_token}"})
+    assert "password_hashing" in res.json() and "token_cache" in res.json()
+
+
+def test_route_template_resolved_once_per_path(monkeypatch):
+    walks = []
+
+    def matches(scope, _matches=api.app.router.routes[0].matches):
+        walks.append(scope["path"])
+        return _matches(scope)
+
+    monkeypatch.setattr(api.app.router.routes[0], "matches", matches)
+    monkeypatch.setattr(api, "_route_templates", api.OrderedDict())
+    scope = {"type": "http", "app": api.app, "method": "GET", "path": "/api/batches/7", "root_path": ""}
+    assert api.route_template(scope) == api.route_template(scope) == "/api/batches/{batch_id}"
+    assert api.route_template({**scope, "path": "/nope"}) == "unmatched"
+    assert walks == ["/api/batches/7", "/nope"]  # the repeated lookup came from the cache
+    assert list(api._route_templates) == [("GET", "", "/api/batches/7"), ("GET", "", "/nope")]
@@ -0,0 +1,140 @@
+import gzip
+import hashlib
+import sqlite3
+
+import pytest
+
+import app
+
+LATEST_VERSION = app.SCHEMA_MIGRATIONS[-1][0]
+
+# The tables as init_db created them before schema_version existed
+BASELINE_SCHEMA = """
+CREATE TABLE organizations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE, created_at TEXT NOT NULL
+);
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, org_id INTEGER NOT NULL, email TEXT NOT NULL,
+    password_hash TEXT NOT NULL, role TEXT NOT NULL, created_at TEXT NOT NULL, UNIQUE(org_id, email)
+);
+CREATE TABLE settings (
+    org_id INTEGER NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (org_id, key)
+);
+CREATE TABLE customers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, org_id INTEGER NOT NULL, name TEXT NOT NULL,
+    name_norm TEXT NOT NULL, email TEXT, phone TEXT, address1 TEXT, address2 TEXT, city TEXT,
+    state TEXT, zip TEXT, qb_customer_ref TEXT, is_active INTEGER NOT NULL DEFAULT 1,
+    created_at TEXT NOT NULL, UNIQUE(org_id, name_norm)
+);
+CREATE TABLE batches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, org_id INTEGER NOT NULL, created_by_user_id INTEGER NOT NULL,
+    created_at TEXT NOT NULL, source_filename TEXT NOT NULL, tax_rate_pct REAL NOT NULL,
+    contingency_pct REAL NOT NULL, flat_fee REAL NOT NULL, review_min_tax_saved REAL NOT NULL,
+    charge_flat_if_no_win INTEGER NOT NULL, invoice_date TEXT NOT NULL, days_due INTEGER NOT NULL,
+    qb_item_name TEXT NOT NULL, qb_desc_prefix TEXT NOT NULL, notes TEXT
+);
+CREATE TABLE batch_rows (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, batch_id INTEGER NOT NULL, row_index INTEGER NOT NULL,
+    raw_client_name TEXT NOT NULL, property_id TEXT NOT NULL, notice_value REAL NOT NULL,
+    final_value REAL NOT NULL, reduction REAL NOT NULL, tax_saved REAL NOT NULL, base_fee REAL NOT NULL,
+    manual_discount REAL NOT NULL, final_invoice REAL NOT NULL, status TEXT NOT NULL,
+    matched_customer_id INTEGER, matched_customer_name TEXT
+);
+CREATE TABLE exports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, batch_id INTEGER NOT NULL, created_at TEXT NOT NULL,
+    created_by_user_id INTEGER NOT NULL, invoice_start_no INTEGER NOT NULL, invoice_count INTEGER NOT NULL,
+    total_amount REAL NOT NULL, filename TEXT NOT NULL, csv_blob BLOB NOT NULL
+);
+"""
+
+BASELINE_CSV = b"InvoiceNo,Customer,ItemAmount\n1001,Smith John A,400.00\n"
+
+# (query, index the plan must search)
+INDEXED_LOOKUPS = [
+    ("SELECT * FROM batch_rows WHERE batch_id = ? ORDER BY row_index", "idx_batch_rows_batch_row"),
+    ("SELECT * FROM batches WHERE org_id = ? ORDER BY id DESC", "idx_batches_org_id"),
+    ("SELECT * FROM exports WHERE batch_id = ? ORDER BY id DESC", "idx_exports_batch_id"),
+    ("SELECT * FROM customers WHERE org_id = ? ORDER BY name", "idx_customers_org_name"),
+]
+
+
+@pytest.fixture
+def baseline_db(tmp_path, monkeypatch):
+    """A database with the pre-migration schema and some data in every table."""
+    path = str(tmp_path / "baseline.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executescript(
+        """
+        INSERT INTO organizations VALUES (1, 'Old Org', '2025-01-01');
+        INSERT INTO users VALUES (1, 1, 'admin@example.com', 'x', 'admin', '2025-01-01');
+        INSERT INTO settings VALUES (1, 'next_invoice_no', '1002');
+        INSERT INTO customers(id, org_id, name, name_norm, created_at, is_active)
+            VALUES (1, 1, 'Smith John A', 'smith john a', '2025-01-01', 1),
+                   (2, 1, 'Doe Jane', 'doe jane', '2025-01-01', 0);
+        INSERT INTO batches VALUES
+            (1, 1, 1, '2025-01-02', 'county.csv', 2.5, 25, 150, 700, 0, '2025-01-31', 30, 'Item', 'Tax', NULL);
+        INSERT INTO batch_rows(batch_id, row_index, raw_client_name, property_id, notice_value, final_value,
+                               reduction, tax_saved, base_fee, manual_discount, final_invoice, status,
+                               matched_customer_id, matched_customer_name)
+            VALUES (1, 0, 'SMITH JOHN A', 'R1', 300000, 250000, 50000, 1000, 400, 0, 400, 'STANDARD', 1, 'Smith John A'),
+                   (1, 1, 'DOE JANE', 'R2', 100000, 90000, 10000, 200, 200, 0, 200, 'REVIEW', NULL, NULL),
+                   (1, 2, 'NOBODY', 'R3', 100000, 100000, 0, 0, 0, 0, 0, 'NO_CHARGE', NULL, NULL);
+        """
+    )
+    conn.execute(
+        "INSERT INTO exports VALUES (1, 1, '2025-01-03', 1, 1001, 1, 400, 'QB_Import_Batch_1.csv', ?)",
+        (BASELINE_CSV,),
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(app, "DB_PATH", path)
+    app.close_db_pool()
+    app._customer_indexes.clear()
+    yield path
+    app.close_db_pool()
+
+
+def assert_indexed_lookups(conn):
+    for sql, index in INDEXED_LOOKUPS:
+        plan = " | ".join(r["detail"] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, (1,)))
+        assert "SEARCH" in plan and f"USING INDEX {index}" in plan, (sql, plan)
+        assert "USE TEMP B-TREE" not in plan, (sql, plan)
+
+
+def test_fresh_database(temp_db):
+    with app.db_session() as conn:
+        assert app.schema_version(conn) == LATEST_VERSION == 7
+        assert app.migrate_db(conn) == LATEST_VERSION
+        assert_indexed_lookups(conn)
+
+
+def test_migrations_are_recorded_once(temp_db):
+    app.init_db()
+    with app.db_session() as conn:
+        versions = [r[0] for r in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+    assert versions == [v for v, _, _ in app.SCHEMA_MIGRATIONS]
+
+
+def test_baseline_database_upgrade(baseline_db):
+    app.init_db()
+    with app.db_session() as conn:
+        assert app.schema_version(conn) == 7
+        assert_indexed_lookups(conn)
+
+        batch = conn.execute("SELECT * FROM batches WHERE id = 1").fetchone()
+        assert (batch["row_count"], batch["billable_count"], batch["total_invoice"]) == (3, 2, 600.0)
+        assert (batch["tax_saved_total"], batch["review_count"]) == (1200.0, 1)
+
+        stats = app.get_org_stats(conn, 1)
+        assert stats["customer_count"] == 1
+        assert (stats["batch_count"], stats["row_count"], stats["billable_count"]) == (1, 3, 2)
+
+        export = conn.execute("SELECT csv_blob, blob_sha256 FROM exports WHERE id = 1").fetchone()
+        assert export["csv_blob"] == b""
+        assert export["blob_sha256"] == hashlib.sha256(BASELINE_CSV).hexdigest()
+        blob = conn.execute("SELECT codec, data FROM export_blobs").fetchone()
+        assert blob["codec"] == "gzip" and gzip.decompress(blob["data"]) == BASELINE_CSV
+        assert b"".join(app.iter_export_csv(conn, 1)) == BASELINE_CSV
+
+        assert app.get_settings(1, conn=conn, use_cache=False)["next_invoice_no"] == "1002"
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import api
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    monkeypatch.setattr(api, "hash_stats", dict.fromkeys(api.hash_stats, 0))
+    yield api.hash_stats
+    api.shutdown_hash_pool()
+
+
+def test_completed_counts_successes_only(stats):
+    dk = asyncio.run(api.pbkdf2("secret", b"salt" * 4, 1000))
+    assert dk == api.hashlib.pbkdf2_hmac("sha256", b"secret", b"salt" * 4, 1000)
+    assert (stats["completed"], stats["failed"], stats["in_flight"]) == (1, 0, 0)
+
+    with pytest.raises(ValueError):
+        asyncio.run(api.pbkdf2("secret", b"salt" * 4, 0))
+    assert (stats["completed"], stats["failed"], stats["in_flight"]) == (1, 1, 0)
+
+
+def test_rejected_past_the_queue_cap(stats, monkeypatch):
+    monkeypatch.setitem(stats, "in_flight", api.HASH_WORKERS + api.HASH_QUEUE_MAX)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(api.pbkdf2("secret", b"salt" * 4, 1000))
+    assert exc.value.status_code == 503
+    assert (stats["rejected"], stats["completed"], stats["failed"]) == (1, 0, 0)
+
+
+def test_verify_password_async(stats):
+    stored = api.format_password_hash(b"s" * 16, 1000, api.hashlib.pbkdf2_hmac("sha256", b"pw", b"s" * 16, 1000))
+    assert asyncio.run(api.verify_password_async("pw", stored))
+    assert not asyncio.run(api.verify_password_async("wrong", stored))
+    assert stats["completed"] == 2
+
+
+def test_pool_does_not_fork_the_server(stats):
+    assert api.hash_pool()._mp_context.get_start_method() in ("forkserver", "spawn")
+
+
+def test_lifespan_owns_the_pool(org):
+    from fastapi.testclient import TestClient
+
+    api.shutdown_hash_pool()
+    with TestClient(api.app):
+        pool = api._hash_pool
+        assert pool is not None
+    assert api._hash_pool is None
+    assert pool._shutdown_thread
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"org_name": " ", "email": "a@example.com", "password": "pw"},
+        {"org_name": "New Org", "email": "", "password": "pw"},
+        {"org_name": "New Org", "email": "a@example.com", "password": " "},
+        {"org_name": "Test Org", "email": "a@example.com", "password": "pw"},
+    ],
+)
+def test_register_validates_before_hashing(client, stats, body):
+    res = client.post("/api/auth/register", json=body)
+    assert res.status_code == 400
+    assert stats["completed"] + stats["failed"] == 0
+
+
+def test_register(client, stats):
+    body = {"org_name": "New Org", "email": "a@example.com", "password": "pw"}
+    assert client.post("/api/auth/register", json=body).status_code == 200
+    assert stats["completed"] == 1
+    assert client.post("/api/auth/login", json=body).status_code == 200
@@ -0,0 +1,57 @@
+import app
+
+
+def test_defaults_and_round_trip(org):
+    assert app.get_settings(org.org_id)["next_invoice_no"] == app.SETTING_DEFAULTS["next_invoice_no"]
+    app.set_settings(org.org_id, {"next_invoice_no": "2001", "flat_fee": "99"})
+    settings = app.get_settings(org.org_id)
+    assert settings["next_invoice_no"] == "2001"
+    assert settings["flat_fee"] == "99"
+
+
+def test_write_on_caller_connection_is_invisible_until_commit(org):
+    assert app.get_settings(org.org_id)["next_invoice_no"] == "1001"
+    with app.db_session() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        app.set_setting(org.org_id, "next_invoice_no", "1500", conn=conn)
+        # Another connection still sees the committed row while the write is open
+        with app.db_session() as other:
+            assert app.get_settings(org.org_id, conn=other, use_cache=False)["next_invoice_no"] == "1001"
+        conn.rollback()
+    assert app.get_settings(org.org_id)["next_invoice_no"] == "1001"
+
+
+def test_read_during_write_does_not_cache_old_row(org):
+    with app.db_session() as conn:
+        app.set_setting(org.org_id, "next_invoice_no", "1500", conn=conn)
+        # A concurrent reader between the write and the commit caches the old committed row
+        assert app.get_settings(org.org_id)["next_invoice_no"] == "1001"
+        conn.commit()
+        app.invalidate_settings_cache(org.org_id)
+    assert app.get_settings(org.org_id)["next_invoice_no"] == "1500"
+
+
+class WriteAfterRead:
+    """Connection stand-in: a writer commits (and invalidates) right after the settings read."""
+
+    def __init__(self, conn, org_id):
+        self.conn = conn
+        self.org_id = org_id
+
+    def execute(self, sql, parameters=()):
+        rows = self.conn.execute(sql, parameters).fetchall()
+        app.set_setting(self.org_id, "flat_fee", "175")
+        return WriteAfterRead.Result(rows)
+
+    class Result:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def fetchall(self):
+            return self.rows
+
+
+def test_read_overtaken_by_write_is_not_cached(org):
+    with app.db_session() as conn:
+        assert app.get_settings(org.org_id, conn=WriteAfterRead(conn, org.org_id))["flat_fee"] == "150"
+    assert app.get_settings(org.org_id)["flat_fee"] == "175"
@@ -0,0 +1,125 @@
+import io
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+import app
+
+MAPPING = dict(col_owner="Owner", col_propid="Prop ID", col_notice="Notice", col_final="Final")
+FEES = dict(tax_rate_pct=2.5, contingency_pct=25.0, flat_fee=150.0, review_min_tax_saved=700.0, charge_flat_if_no_win=False)
+INVOICE = dict(invoice_date="2026-01-31", days_due=30, qb_item_name="Item", qb_desc_prefix="Tax", notes=None)
+
+
+def sheet(rows):
+    return pd.DataFrame(
+        {
+            "Owner": [f"Owner {i % 7}" for i in range(rows)],
+            "Prop ID": [f"R{i:06d}" for i in range(rows)],
+            "Notice": [200_000 + i for i in range(rows)],
+            "Final": [150_000] * rows,
+        }
+    )
+
+
+def stages(profiler):
+    return {s["stage"]: s for s in profiler.report()["stages"]}
+
+
+def test_compute_batch_stages_assembles_once():
+    profiler = app.StageProfiler(memory=False)
+    app.compute_batch_df(sheet(100), **MAPPING, **FEES, customers_by_norm={}, profiler=profiler)
+    report = stages(profiler)
+    assert list(report) == ["copy", "parse", "tax", "fees", "match", "assemble"]
+    assert (report["assemble"]["calls"], report["assemble"]["rows"]) == (1, 100)
+
+
+def test_chunked_read_skips_end_of_file(org):
+    profiler = app.StageProfiler(memory=False)
+    csv = io.BytesIO(sheet(250).to_csv(index=False).encode("utf-8"))
+    _, totals = app.run_batch_chunked(
+        csv,
+        "county.csv",
+        org_id=org.org_id,
+        user_id=org.user_id,
+        **MAPPING,
+        **FEES,
+        **INVOICE,
+        customers_by_norm={},
+        chunksize=100,
+        profiler=profiler,
+    )
+    report = stages(profiler)
+    assert totals["rows"] == 250
+    assert (report["read"]["calls"], report["read"]["rows"]) == (3, 250)
+    assert (report["write"]["calls"], report["assemble"]["calls"]) == (3, 3)
+
+
+def test_skipped_stage_still_raises():
+    profiler = app.StageProfiler(memory=False)
+    with pytest.raises(ValueError):
+        with profiler.stage("read") as info:
+            info["skip"] = True
+            raise ValueError("bad chunk")
+    assert profiler.report()["stages"] == []
+
+
+def test_one_memory_profiler_at_a_time():
+    first, second = app.StageProfiler(), app.StageProfiler()
+    with first.stage("parse", 10):
+        with second.stage("parse", 10):
+            pass
+        assert tracemalloc.is_tracing()
+    second_report = second.report()
+    assert tracemalloc.is_tracing()  # only the profiler that started tracing stops it
+    first_report = first.report()
+    assert not tracemalloc.is_tracing()
+    assert second_report["stages"][0]["peak_bytes"] is None
+    assert first_report["stages"][0]["peak_bytes"] is not None
+
+    third = app.StageProfiler()
+    with third.stage("parse", 10):
+        pass
+    assert third.report()["stages"][0]["peak_bytes"] is not None
+
+
+def test_report_after_error_releases_memory_profiling():
+    profiler = app.StageProfiler()
+    with pytest.raises(ValueError):
+        with profiler.stage("parse"):
+            raise ValueError("bad sheet")
+    profiler.report()
+    assert not tracemalloc.is_tracing()
+    assert app._memory_profiling_lock.acquire(blocking=False)
+    app._memory_profiling_lock.release()
+
+
+def compute_profiled(client, **form):
+    res = client.post(
+        "/api/batches/compute",
+        files={"file": ("county.csv", sheet(50).to_csv(index=False).encode("utf-8"), "text/csv")},
+        data={**MAPPING, **form},
+    )
+    assert res.status_code == 200, res.text
+    return {s["stage"]: s for s in res.json()["timings"]["stages"]}
+
+
+def test_api_profile(client):
+    timings = compute_profiled(client, profile="true")
+    assert timings["read"]["rows"] == timings["write"]["rows"] == 50
+    assert all(s["peak_bytes"] is None for s in timings.values())
+
+
+def test_api_profile_memory(client):
+    timings = compute_profiled(client, profile_memory="true")
+    assert timings["read"]["rows"] == 50
+    assert all(s["peak_bytes"] is not None for s in timings.values())
+    assert not tracemalloc.is_tracing()
+
+
+def test_api_profile_memory_while_another_run_measures(client):
+    other = app.StageProfiler()
+    with other.stage("parse"):
+        timings = compute_profiled(client, profile="true", profile_memory="true")
+    assert all(s["peak_bytes"] is None for s in timings.values())
+    assert other.report()["stages"][0]["peak_bytes"] is not None
@@ -0,0 +1,65 @@
+import dataclasses
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def api_mod(client):
+    import api
+
+    return api
+
+
+def auth(api, user):
+    return {"Authorization": f"Bearer {api.encode_token(user)}"}
+
+
+def set_role(user_id, role):
+    with app.db_session() as conn:
+        conn.execute("UPDATE users SET role=? WHERE id=?", (role, user_id))
+        conn.commit()
+
+
+def test_cache_hits_skip_decoding(client, api_mod, monkeypatch):
+    assert client.get("/api/settings").status_code == 200
+    hits = api_mod.token_cache_stats["hits"]
+    monkeypatch.setattr(api_mod, "decode_token_payload", lambda token: pytest.fail("decoded a cached token"))
+    assert client.get("/api/settings").status_code == 200
+    assert api_mod.token_cache_stats["hits"] == hits + 1
+
+
+def test_role_change_applies_on_revalidation(client, api_mod, org, monkeypatch):
+    assert client.get("/api/settings").status_code == 200
+    set_role(org.user_id, app.ROLE_VIEW)
+    # Within the revalidation interval the cached entry still stands
+    assert client.get("/api/settings").status_code == 200
+
+    monkeypatch.setattr(api_mod, "TOKEN_REVALIDATE_SECONDS", 0.0)
+    assert client.get("/api/settings").status_code == 401
+    assert client.get("/api/settings").status_code == 401
+    # A token carrying the new role is accepted
+    viewer = dataclasses.replace(org, role=app.ROLE_VIEW)
+    assert client.get("/api/settings", headers=auth(api_mod, viewer)).status_code == 200
+
+
+def test_token_with_stale_role_is_rejected_on_first_use(client, api_mod, org):
+    set_role(org.user_id, app.ROLE_STAFF)
+    assert client.get("/api/settings").status_code == 401
+
+
+def test_removed_user_loses_every_token(client, api_mod, org, monkeypatch):
+    other = auth(api_mod, org)
+    assert client.get("/api/settings").status_code == 200
+    with app.db_session() as conn:
+        conn.execute("DELETE FROM users WHERE id=?", (org.user_id,))
+        conn.commit()
+    monkeypatch.setattr(api_mod, "TOKEN_REVALIDATE_SECONDS", 0.0)
+    assert client.get("/api/settings").status_code == 401
+    assert client.get("/api/settings", headers=other).status_code == 401
+
+
+def test_logout_revokes_the_token(client):
+    assert client.post("/api/auth/logout").status_code == 200
+    assert client.get("/api/settings").status_code == 401